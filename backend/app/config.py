@@ -11,6 +11,26 @@ class Settings(BaseSettings):
     LLM_MODEL_NAME: str = "qwen3-max"
     LLM_BASE_URL: str = "https://dashscope.aliyuncs.com/compatible-mode/v1"
     LLM_TEMPERATURE: float = 0.7
+    # LLM HTTP 连接池：是否启用 HTTP/2（需安装 h2）、最大连接数、空闲连接保持时长（秒）、请求超时（秒）
+    LLM_HTTP2: bool = True
+    LLM_MAX_CONNECTIONS: int = 64
+    LLM_KEEPALIVE_EXPIRY: float = 60.0
+    LLM_TIMEOUT: float = 120.0
+    # LLM 网关：同时进行的调用数上限、每分钟请求数 / token 数上限（0 表示不限），
+    # 放行前为每次调用预留的输出 token 数（调用结束后按实际用量校正）
+    LLM_MAX_CONCURRENCY: int = 16
+    LLM_RPM: int = 0
+    LLM_TPM: int = 0
+    LLM_OUTPUT_TOKEN_ESTIMATE: int = 512
+    # LLM 来源：dashscope（在线调用）/ record（在线调用并录制到 LLM_TRACE_FILE）/ replay（按录制文件回放，不访问网络）
+    LLM_PROVIDER: str = "dashscope"
+    LLM_TRACE_FILE: str = "./data/llm_traces.jsonl"
+    # 回放模式：首个分片前的模拟延迟（毫秒）、分片间隔（毫秒）、每个分片的字符数，
+    # 未命中录制内容时的处理：error（抛出异常）/ answer（返回固定回答）
+    LLM_REPLAY_LATENCY_MS: int = 300
+    LLM_REPLAY_TOKEN_INTERVAL_MS: int = 20
+    LLM_REPLAY_CHUNK_CHARS: int = 4
+    LLM_REPLAY_ON_MISS: str = "error"
 
     # MySQL 默认连接（可通过 .env 覆盖）
     MYSQL_HOST: str = "localhost"
@@ -22,6 +42,77 @@ class Settings(BaseSettings):
     # 连接配置持久化路径
     CONNECTIONS_FILE: str = "./data/connections.json"
 
+    # Agent 执行模式：thread（有界线程池驱动同步 stream）/ async（原生 astream）
+    AGENT_EXECUTION_MODE: str = "thread"
+    # 单进程内同时运行的 Agent 数上限，超出的请求排队等待
+    AGENT_MAX_CONCURRENCY: int = 32
+    # Agent 构建（连接数据库、读取表结构）的线程数，与运行线程池分开
+    AGENT_BUILD_WORKERS: int = 4
+    # 最终回答是否逐 token 流式推送（关闭时回答在生成完毕后整段发送）
+    AGENT_STREAM_TOKENS: bool = True
+
+    # thinking 事件默认协议：full（每次全量）/ delta（仅新增步骤 + 序号），请求可单独指定
+    THINKING_EVENT_MODE: str = "full"
+    # delta 模式下每 N 步额外发送一次全量快照（供中途接入方校正），0 表示不发送
+    THINKING_SNAPSHOT_INTERVAL: int = 0
+
+    # 图表引擎：rules（仅本地规则）/ llm（仅 LLM）/ hybrid（规则优先，无法判定时调用 LLM）
+    CHART_ENGINE: str = "hybrid"
+
+    # Agent 获取表结构的方式：inject（schema 摘要写入 system prompt）/ retrieve（按问题检索相关表）
+    # / discover（工具逐步探查）
+    AGENT_SCHEMA_MODE: str = "inject"
+    # 注入摘要的最大字符数，超过时改为按问题检索相关表
+    SCHEMA_DIGEST_MAX_CHARS: int = 12000
+    # 每个问题检索的相关表数量（外键引用的表另行补充）
+    SCHEMA_RETRIEVAL_TOP_K: int = 8
+
+    # schema 缓存有效期（秒），到期后以一条指纹查询校验是否变化
+    SCHEMA_CACHE_TTL: int = 300
+
+    # SQL 工作台结果句柄：有效期（秒）、单个结果最多物化行数、最多保留句柄数
+    QUERY_CACHE_TTL: int = 600
+    QUERY_CACHE_MAX_ROWS: int = 10000
+    QUERY_CACHE_MAX_ENTRIES: int = 32
+
+    # 问题 → SQL 缓存：开关、有效期（秒）、最大条目数
+    QUESTION_CACHE_ENABLED: bool = True
+    QUESTION_CACHE_TTL: int = 3600
+    QUESTION_CACHE_MAX_ENTRIES: int = 512
+    # 近似匹配阈值（字符 bigram Jaccard 相似度，0 表示仅精确匹配）
+    QUESTION_CACHE_SIMILARITY: float = 0.0
+    # 命中后的回答方式：llm（一次 LLM 调用总结结果）/ template（不调用 LLM，直接给出结果表格）
+    QUESTION_CACHE_ANSWER_MODE: str = "llm"
+
+    # 对话记忆存储：sqlite（本地文件，多个 worker 共享）/ memory（进程内）
+    CHECKPOINT_BACKEND: str = "sqlite"
+    CHECKPOINT_DB_PATH: str = "./data/checkpoints.db"
+    # 每个对话保留的最近轮数，更早的轮次按 CHECKPOINT_COMPACT_MODE 处理：truncate（丢弃）/ summarize（LLM 摘要）
+    CHECKPOINT_MAX_TURNS: int = 10
+    CHECKPOINT_COMPACT_MODE: str = "truncate"
+    # 对话空闲多久（秒）后删除其记忆（0 表示不删除）
+    CHECKPOINT_THREAD_TTL: int = 7 * 24 * 3600
+
+    # 单次调用模型的上下文预算（估算 token，0 表示不限）、原样保留的最近轮数（含当前轮）、
+    # 较早轮次中其他工具输出折叠后保留的字符数
+    CONTEXT_TOKEN_BUDGET: int = 24000
+    CONTEXT_KEEP_TURNS: int = 2
+    CONTEXT_COLLAPSED_TOOL_CHARS: int = 200
+
+    # REST 接口执行数据库调用的线程数（决定工作台并发查询上限）
+    DB_EXECUTOR_WORKERS: int = 32
+
+    # 按连接缓存的资源（连接池、SQLDatabase、Agent）：最多保留的连接数（LRU 淘汰）、
+    # 空闲多久（秒）后释放（0 表示不按空闲释放）、后台清理（连接资源与空闲对话记忆）间隔（秒）
+    RESOURCE_MAX_CONNECTIONS: int = 16
+    RESOURCE_IDLE_TTL: int = 1800
+    RESOURCE_SWEEP_INTERVAL: int = 60
+
+    # 流式导出每批读取的行数
+    EXPORT_CHUNK_ROWS: int = 5000
+    # 流式导出的服务端执行时间上限（秒，max_execution_time，含传输时间），0 表示不限制
+    EXPORT_TIMEOUT: int = 3600
+
     model_config = {
         "env_file": os.path.join(os.path.dirname(os.path.dirname(__file__)), ".env"),
         "env_file_encoding": "utf-8",
@@ -4,12 +4,18 @@ MySQL 数据库连接工厂 + LangChain SQLDatabase 封装
 """
 
 from urllib.parse import quote_plus
+import pymysql
 from langchain_community.utilities import SQLDatabase
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import Engine
 from app.config import get_settings
 
 # 兼容旧代码的默认 SQLDatabase 单例（Phase 2 中将被 connection_service 完全替代）
 _default_db: SQLDatabase | None = None
 
+# read_timeout 在查询超时基础上的余量（秒），服务端 max_execution_time 应先生效
+READ_TIMEOUT_GRACE = 30
+
 
 def build_mysql_uri(
     host: str,
@@ -36,6 +42,96 @@ def build_mysql_uri(
     return f"mysql+pymysql://{user}:{encoded_password}@{host}:{port}/{database}?charset=utf8mb4"
 
 
+def create_mysql_engine(
+    host: str,
+    port: int,
+    user: str,
+    password: str,
+    database: str,
+    pool_size: int = 5,
+    max_overflow: int = 10,
+    pool_recycle: int = 3600,
+    pool_pre_ping: bool = True,
+    query_timeout: int = 30,
+) -> Engine:
+    """
+    创建带连接池的 SQLAlchemy Engine（MySQL）
+
+    query_timeout > 0 时：
+    - 每个新连接设置会话级 max_execution_time（服务端到时中止 SELECT）
+    - read_timeout 设为 query_timeout + READ_TIMEOUT_GRACE，作为服务端不支持该变量时的客户端兜底
+
+    Args:
+        host: MySQL 主机地址
+        port: MySQL 端口
+        user: 用户名
+        password: 密码
+        database: 数据库名
+        pool_size: 常驻连接数
+        max_overflow: 峰值时允许额外创建的连接数
+        pool_recycle: 连接最大存活秒数，超过后重建（应小于 MySQL wait_timeout）
+        pool_pre_ping: 取出连接前是否 ping 检测失效连接
+        query_timeout: 单条查询超时秒数，0 表示不限制
+
+    Returns:
+        Engine 实例，可通过 raw_connection() 获取池化的原生 pymysql 连接
+    """
+    uri = build_mysql_uri(host, port, user, password, database)
+    connect_args = {"connect_timeout": 10}
+    if query_timeout > 0:
+        connect_args["read_timeout"] = query_timeout + READ_TIMEOUT_GRACE
+    engine = create_engine(
+        uri,
+        pool_size=pool_size,
+        max_overflow=max_overflow,
+        pool_recycle=pool_recycle,
+        pool_pre_ping=pool_pre_ping,
+        connect_args=connect_args,
+    )
+
+    if query_timeout > 0:
+        @event.listens_for(engine, "connect")
+        def _set_execution_time(dbapi_connection, connection_record):
+            cursor = dbapi_connection.cursor()
+            try:
+                cursor.execute(f"SET SESSION max_execution_time = {query_timeout * 1000}")
+            except pymysql.Error:
+                # MariaDB 等不支持该变量时仅依赖 read_timeout
+                pass
+            finally:
+                cursor.close()
+
+    return engine
+
+
+def open_unpooled_connection(engine: Engine, query_timeout: int = 0):
+    """
+    以 Engine 的连接参数新建一个不经连接池的 pymysql 连接
+
+    用于长时间流式导出与 KILL QUERY（不占用、不受限于连接池）
+
+    Args:
+        engine: 连接池 Engine（取其连接参数）
+        query_timeout: 会话级 max_execution_time（秒），0 表示不限制；
+            read_timeout 随之设为 query_timeout + READ_TIMEOUT_GRACE
+    """
+    cargs, cparams = engine.dialect.create_connect_args(engine.url)
+    cparams["connect_timeout"] = 10
+    if query_timeout > 0:
+        cparams["read_timeout"] = query_timeout + READ_TIMEOUT_GRACE
+    conn = engine.dialect.connect(*cargs, **cparams)
+    if query_timeout > 0:
+        cursor = conn.cursor()
+        try:
+            cursor.execute(f"SET SESSION max_execution_time = {query_timeout * 1000}")
+        except pymysql.Error:
+            # MariaDB 等不支持该变量时仅依赖 read_timeout
+            pass
+        finally:
+            cursor.close()
+    return conn
+
+
 def create_sql_database(
     host: str,
     port: int,
@@ -0,0 +1,79 @@
+"""
+MySQL schema 批量读取
+基于 information_schema 的集合查询一次取回所有表、列、主键、注释和外键，
+往返次数固定为 3 次，与表数量无关（替代 SHOW TABLES + 逐表 SHOW FULL COLUMNS）
+"""
+
+from app.models.schemas import ColumnInfo, ForeignKeyInfo, TableSchema
+
+_TABLES_SQL = """
+SELECT TABLE_NAME, TABLE_COMMENT
+FROM information_schema.TABLES
+WHERE TABLE_SCHEMA = DATABASE()
+ORDER BY TABLE_NAME
+"""
+
+_COLUMNS_SQL = """
+SELECT TABLE_NAME, COLUMN_NAME, COLUMN_TYPE, IS_NULLABLE, COLUMN_KEY, COLUMN_COMMENT
+FROM information_schema.COLUMNS
+WHERE TABLE_SCHEMA = DATABASE()
+ORDER BY TABLE_NAME, ORDINAL_POSITION
+"""
+
+_FOREIGN_KEYS_SQL = """
+SELECT TABLE_NAME, COLUMN_NAME, REFERENCED_TABLE_NAME, REFERENCED_COLUMN_NAME
+FROM information_schema.KEY_COLUMN_USAGE
+WHERE TABLE_SCHEMA = DATABASE() AND REFERENCED_TABLE_NAME IS NOT NULL
+ORDER BY TABLE_NAME, CONSTRAINT_NAME, ORDINAL_POSITION
+"""
+
+
+def fetch_schema(conn) -> list[TableSchema]:
+    """
+    读取当前数据库的完整表结构
+
+    Args:
+        conn: 已选中数据库的 DB-API 连接（pymysql 连接或连接池代理）
+
+    Returns:
+        TableSchema 列表（按表名排序，列按定义顺序）
+    """
+    cursor = conn.cursor()
+    try:
+        cursor.execute(_TABLES_SQL)
+        table_rows = cursor.fetchall()
+        cursor.execute(_COLUMNS_SQL)
+        column_rows = cursor.fetchall()
+        cursor.execute(_FOREIGN_KEYS_SQL)
+        fk_rows = cursor.fetchall()
+    finally:
+        cursor.close()
+
+    tables: dict[str, TableSchema] = {
+        name: TableSchema(name=name, comment=comment or None)
+        for name, comment in table_rows
+    }
+
+    for table_name, name, col_type, nullable, key, comment in column_rows:
+        table = tables.get(table_name)
+        if table is None:
+            continue
+        table.columns.append(ColumnInfo(
+            name=name,
+            type=col_type or "VARCHAR(255)",
+            primary_key=(key == "PRI"),
+            nullable=(nullable == "YES"),
+            comment=comment or None,
+        ))
+
+    for table_name, column, ref_table, ref_column in fk_rows:
+        table = tables.get(table_name)
+        if table is None:
+            continue
+        table.foreign_keys.append(ForeignKeyInfo(
+            column=column,
+            referenced_table=ref_table,
+            referenced_column=ref_column,
+        ))
+
+    return list(tables.values())
@@ -1,20 +1,54 @@
+import asyncio
 from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 
+from app.config import get_settings
 from app.routers import session, chat, database, connection
-from app.services.connection_service import init_default_connection
+from app.services.checkpoint_service import collect_idle_threads
+from app.services.llm_replay import get_trace_store
+from app.services.llm_service import close_llm_clients, get_gateway
+from app.services.connection_service import (
+    get_resource_stats,
+    init_default_connection,
+    run_db,
+    sweep_idle_resources,
+)
+
+
+async def _sweep_periodically(interval: float) -> None:
+    """定期释放空闲超时的连接资源（连接池、Agent）与对话记忆"""
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            released = await run_db(sweep_idle_resources)
+            expired = await asyncio.to_thread(collect_idle_threads)
+        except Exception as e:
+            print(f"[资源清理] 失败: {e}")
+            continue
+        if released:
+            print(f"[资源清理] 已释放 {released} 个空闲连接的资源")
+        if expired:
+            print(f"[资源清理] 已删除 {expired} 个空闲对话的记忆")
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    """应用生命周期：启动时初始化默认 MySQL 连接"""
+    """应用生命周期：启动时初始化默认 MySQL 连接，并启动空闲资源 / 对话记忆清理任务；关闭时释放 LLM 连接池"""
     default_conn = init_default_connection()
     if default_conn:
         print(f"[启动] 已创建默认 MySQL 连接: {default_conn.name} ({default_conn.host}:{default_conn.port}/{default_conn.database})")
     else:
         print("[启动] 已有连接配置或未配置 MySQL 默认参数，跳过默认连接创建")
+
+    settings = get_settings()
+    sweeper = None
+    if settings.RESOURCE_SWEEP_INTERVAL > 0:
+        sweeper = asyncio.create_task(_sweep_periodically(settings.RESOURCE_SWEEP_INTERVAL))
     yield
+    if sweeper is not None:
+        sweeper.cancel()
+    await close_llm_clients()
 
 
 app = FastAPI(
@@ -49,3 +83,19 @@ app.include_router(database.router)
 async def health_check():
     """健康检查接口"""
     return {"status": "ok", "service": "nl2sql-backend", "version": "1.0.0-mysql"}
+
+
+@app.get("/api/health/resources")
+async def resource_stats():
+    """按连接缓存的资源统计（连接池 / Agent 数量、命中率、淘汰次数）"""
+    return get_resource_stats()
+
+
+@app.get("/api/health/llm")
+async def llm_gateway_stats():
+    """LLM 网关统计（并发、各优先级队列深度与等待时间）；录制 / 回放模式下附带录制文件命中统计"""
+    settings = get_settings()
+    stats = get_gateway().stats()
+    if settings.LLM_PROVIDER in ("record", "replay"):
+        stats["traces"] = {"provider": settings.LLM_PROVIDER, **get_trace_store().stats()}
+    return stats
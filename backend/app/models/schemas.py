@@ -3,7 +3,7 @@ Pydantic 数据模型（请求/响应验证）
 """
 
 from pydantic import BaseModel, Field
-from typing import Optional, Any
+from typing import Optional, Any, Literal
 from datetime import datetime
 
 
@@ -47,6 +47,9 @@ class ChatRequest(BaseModel):
     """聊天请求"""
     message: str = Field(..., min_length=1, description="用户消息内容")
     connection_id: str = Field(..., min_length=1, description="MySQL 连接 ID（指定使用哪个数据库）")
+    thinking_mode: Optional[Literal["full", "delta"]] = Field(
+        default=None, description="thinking 事件协议：full 全量 / delta 增量，不传则使用服务端默认"
+    )
 
 
 # ===== 图表相关 =====
@@ -66,17 +69,28 @@ class ColumnInfo(BaseModel):
     type: str = Field(..., description="列类型")
     primary_key: bool = Field(default=False, description="是否为主键")
     nullable: bool = Field(default=True, description="是否可为空")
+    comment: Optional[str] = Field(default=None, description="列注释")
+
+
+class ForeignKeyInfo(BaseModel):
+    """外键信息（单列）"""
+    column: str = Field(..., description="本表列名")
+    referenced_table: str = Field(..., description="引用表名")
+    referenced_column: str = Field(..., description="引用列名")
 
 
 class TableSchema(BaseModel):
     """单表结构"""
     name: str = Field(..., description="表名")
+    comment: Optional[str] = Field(default=None, description="表注释")
     columns: list[ColumnInfo] = Field(default_factory=list, description="列列表")
+    foreign_keys: list[ForeignKeyInfo] = Field(default_factory=list, description="外键列表")
 
 
 class SchemaResponse(BaseModel):
     """数据库 schema 响应"""
     tables: list[TableSchema] = Field(default_factory=list, description="所有表")
+    version: int = Field(default=0, description="schema 缓存版本号，结构变化时递增")
 
 
 class SqlQueryRequest(BaseModel):
@@ -85,17 +99,43 @@ class SqlQueryRequest(BaseModel):
     sql: str = Field(..., min_length=1, description="SQL 查询语句（仅允许 SELECT）")
     page: int = Field(default=1, ge=1, description="页码，从 1 开始")
     page_size: int = Field(default=50, ge=1, le=500, description="每页条数")
+    query_handle: Optional[str] = Field(default=None, description="上次查询返回的结果句柄，翻页时携带以复用结果")
+    count_mode: Literal["exact", "estimate"] = Field(
+        default="exact", description="结果超过缓存上限时的总行数计算方式：exact 精确 / estimate 估算"
+    )
+    pagination: Literal["offset", "keyset"] = Field(
+        default="offset", description="分页方式：offset 按页码 / keyset 按续页令牌（简单单表查询深页恒定开销）"
+    )
+    cursor: Optional[str] = Field(default=None, description="keyset 模式的续页令牌，为空时读取第一页")
+    key_columns: Optional[list[str]] = Field(
+        default=None, description="keyset 模式的排序键（组合唯一），为空时使用单表查询的主键"
+    )
 
 
 class SqlQueryResponse(BaseModel):
     """SQL 查询响应（分页）"""
     columns: list[str] = Field(default_factory=list, description="列名列表")
     rows: list[list[Any]] = Field(default_factory=list, description="行数据")
-    total_count: int = Field(default=0, description="总行数")
+    total_count: Optional[int] = Field(default=0, description="总行数；keyset 模式不计算总行数，为空")
     page: int = Field(default=1, description="当前页码")
     page_size: int = Field(default=50, description="每页条数")
     total_pages: int = Field(default=0, description="总页数")
     elapsed_ms: int = Field(default=0, description="执行耗时（毫秒）")
+    query_handle: Optional[str] = Field(default=None, description="结果句柄，翻页时回传")
+    count_estimated: bool = Field(default=False, description="总行数是否为估算值")
+    next_cursor: Optional[str] = Field(default=None, description="keyset 模式下一页的续页令牌，无更多数据时为空")
+    key_columns: Optional[list[str]] = Field(default=None, description="keyset 模式实际使用的排序键")
+    keyset_pushdown: Optional[bool] = Field(
+        default=None,
+        description="keyset 模式排序键条件是否并入原查询；为 false 时（含 GROUP BY / DISTINCT / LIMIT 等）按派生表过滤，深页开销随位置增长",
+    )
+
+
+class SqlExportRequest(BaseModel):
+    """SQL 结果导出请求（流式返回完整结果）"""
+    connection_id: str = Field(..., min_length=1, description="MySQL 连接 ID")
+    sql: str = Field(..., min_length=1, description="SQL 查询语句（仅允许 SELECT）")
+    format: Literal["csv", "ndjson", "arrow"] = Field(default="csv", description="导出格式")
 
 
 # ===== MySQL 连接管理 =====
@@ -108,6 +148,11 @@ class MySQLConnectionCreate(BaseModel):
     user: str = Field(..., min_length=1, description="用户名")
     password: str = Field(default="", description="密码")
     database: str = Field(..., min_length=1, description="数据库名")
+    pool_size: int = Field(default=5, ge=1, le=100, description="连接池常驻连接数")
+    max_overflow: int = Field(default=10, ge=0, le=100, description="连接池峰值额外连接数")
+    pool_recycle: int = Field(default=3600, ge=-1, description="连接最大存活秒数，-1 表示不回收")
+    pool_pre_ping: bool = Field(default=True, description="取出连接前是否 ping 检测")
+    query_timeout: int = Field(default=30, ge=0, le=3600, description="单条查询超时秒数，0 表示不限制")
 
 
 class MySQLConnectionConfig(BaseModel):
@@ -119,6 +164,11 @@ class MySQLConnectionConfig(BaseModel):
     user: str = Field(..., description="用户名")
     password: str = Field(default="", description="密码")
     database: str = Field(..., description="数据库名")
+    pool_size: int = Field(default=5, description="连接池常驻连接数")
+    max_overflow: int = Field(default=10, description="连接池峰值额外连接数")
+    pool_recycle: int = Field(default=3600, description="连接最大存活秒数，-1 表示不回收")
+    pool_pre_ping: bool = Field(default=True, description="取出连接前是否 ping 检测")
+    query_timeout: int = Field(default=30, ge=0, le=3600, description="单条查询超时秒数，0 表示不限制")
 
 
 class MySQLConnectionUpdate(BaseModel):
@@ -129,6 +179,11 @@ class MySQLConnectionUpdate(BaseModel):
     user: Optional[str] = Field(default=None, description="用户名")
     password: Optional[str] = Field(default=None, description="密码")
     database: Optional[str] = Field(default=None, description="数据库名")
+    pool_size: Optional[int] = Field(default=None, ge=1, le=100, description="连接池常驻连接数")
+    max_overflow: Optional[int] = Field(default=None, ge=0, le=100, description="连接池峰值额外连接数")
+    pool_recycle: Optional[int] = Field(default=None, ge=-1, description="连接最大存活秒数，-1 表示不回收")
+    pool_pre_ping: Optional[bool] = Field(default=None, description="取出连接前是否 ping 检测")
+    query_timeout: Optional[int] = Field(default=None, ge=0, le=3600, description="单条查询超时秒数，0 表示不限制")
 
 
 class ConnectionTestRequest(BaseModel):
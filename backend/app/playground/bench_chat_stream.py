@@ -0,0 +1,449 @@
+"""
+聊天 SSE 全链路压测脚本
+启动一个独立的后端进程（LLM 使用回放模式，不访问网络），N 个会话并发调用 /api/chat/{session_id}/stream，
+统计首事件时间（TTFE）、首 token 时间（TTFT）、总耗时分位数、事件吞吐与服务端 RSS，结果写入 JSON 供提交间对比
+
+数据库：
+  - sqlite（默认）：使用 sql_repo/data/test.db（不存在时运行 sql_repo/init_db.py 生成），
+    压测进程内把连接资源替换为 SQLite Engine（AGENT_SCHEMA_MODE=discover、关闭问题缓存，不读取 information_schema）
+  - mysql：使用 --mysql-* 参数（默认取 .env 中的 MYSQL_*）指定的真实库
+LLM：压测前为每个问题生成回放记录（第 1 次调用 sql_db_query，第 2 次给出回答），
+     延迟由 --latency-ms / --token-interval-ms 模拟
+
+运行方式：
+  python backend/app/playground/bench_chat_stream.py --sessions 20 --turns 3
+  python backend/app/playground/bench_chat_stream.py --db mysql --mode async --compare data/bench/chat_stream_abc123.json
+  python backend/app/playground/bench_chat_stream.py --url http://127.0.0.1:8118 --connection-id <id>   # 压测已启动的后端（不统计 RSS）
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from typing import Optional
+
+import httpx
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+REPO_DIR = os.path.dirname(BACKEND_DIR)
+SQLITE_DB = os.path.join(REPO_DIR, "sql_repo", "data", "test.db")
+
+if BACKEND_DIR not in sys.path:
+    sys.path.insert(0, BACKEND_DIR)
+
+# 回放的 SQL（sql_repo 示例库与 MySQL 示例库均有 departments 表）
+DEFAULT_SQL = "SELECT name, budget FROM departments ORDER BY budget DESC LIMIT 10"
+
+# 对比时统计的指标：(路径, 越小越好)
+COMPARE_METRICS = [
+    ("ttfe_ms.p50", True),
+    ("ttfe_ms.p95", True),
+    ("ttft_ms.p50", True),
+    ("ttft_ms.p95", True),
+    ("latency_ms.p50", True),
+    ("latency_ms.p95", True),
+    ("latency_ms.p99", True),
+    ("events_per_sec", False),
+    ("requests_per_sec", False),
+    ("rss_mb.peak", True),
+]
+
+
+# ==================== 服务端 ====================
+
+def serve(port: int, sqlite_path: Optional[str]) -> None:
+    """在当前进程启动后端（sqlite_path 非空时所有连接的 Engine 改为该 SQLite 文件）"""
+    import uvicorn
+
+    if sqlite_path:
+        use_sqlite_engine(sqlite_path)
+
+    from app.main import app
+    uvicorn.run(app, host="127.0.0.1", port=port, log_level="warning")
+
+
+def use_sqlite_engine(sqlite_path: str) -> None:
+    """所有连接的资源改为指向 SQLite 文件的 Engine（连接配置仍需存在）"""
+    from sqlalchemy import create_engine
+
+    from app.services import connection_service
+
+    def _create_sqlite_resources(conn_id: str):
+        if connection_service.get_connection(conn_id) is None:
+            return None
+        engine = create_engine(f"sqlite:///{sqlite_path}", connect_args={"check_same_thread": False})
+        return connection_service.ConnectionResources(engine=engine)
+
+    connection_service._create_resources = _create_sqlite_resources
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _ensure_sqlite_db() -> str:
+    if not os.path.exists(SQLITE_DB):
+        subprocess.run([sys.executable, os.path.join(REPO_DIR, "sql_repo", "init_db.py")], check=True)
+    return SQLITE_DB
+
+
+def _write_traces(path: str, questions: list[str], sql: str, answer_chars: int) -> None:
+    """为每个问题生成两步回放记录（按 turn_key 匹配，与 prompt 其余内容无关）"""
+    from app.services.llm_replay import make_turn_key
+
+    answer = ("根据查询结果，预算最高的部门如上表所示。" * (answer_chars // 20 + 1))[:answer_chars]
+    with open(path, "w", encoding="utf-8") as f:
+        for question in questions:
+            steps = [
+                {"content": "", "tool_calls": [{"name": "sql_db_query", "args": {"query": sql}}]},
+                {"content": answer, "tool_calls": []},
+            ]
+            for step, output in enumerate(steps):
+                record = {"prompt_hash": None, "turn_key": make_turn_key(question, step), **output}
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+
+def _start_server(args, work_dir: str, traces: str) -> tuple[subprocess.Popen, str]:
+    port = _free_port()
+    env = dict(
+        os.environ,
+        LLM_PROVIDER="replay",
+        LLM_TRACE_FILE=traces,
+        LLM_REPLAY_LATENCY_MS=str(args.latency_ms),
+        LLM_REPLAY_TOKEN_INTERVAL_MS=str(args.token_interval_ms),
+        LLM_REPLAY_ON_MISS="answer",
+        AGENT_EXECUTION_MODE=args.mode,
+        CHART_ENGINE="rules",
+        QUESTION_CACHE_ENABLED="false",
+        CONNECTIONS_FILE=os.path.join(work_dir, "connections.json"),
+        CHECKPOINT_DB_PATH=os.path.join(work_dir, "checkpoints.db"),
+    )
+    cmd = [sys.executable, os.path.abspath(__file__), "serve", "--port", str(port)]
+    if args.db == "sqlite":
+        env["AGENT_SCHEMA_MODE"] = "discover"
+        cmd += ["--sqlite", _ensure_sqlite_db()]
+    proc = subprocess.Popen(cmd, cwd=BACKEND_DIR, env=env)
+    url = f"http://127.0.0.1:{port}"
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError(f"后端进程启动失败，退出码 {proc.returncode}")
+        try:
+            if httpx.get(f"{url}/api/health", timeout=1).status_code == 200:
+                return proc, url
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    proc.kill()
+    raise RuntimeError("后端进程启动超时")
+
+
+# ==================== RSS 采样 ====================
+
+def _read_rss_mb(pid: int) -> Optional[float]:
+    """读取进程 RSS（MB），仅支持 Linux /proc"""
+    try:
+        with open(f"/proc/{pid}/status", "r") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return None
+
+
+class RssSampler:
+    """后台线程定时采样服务端 RSS"""
+
+    def __init__(self, pid: Optional[int], interval: float = 0.2):
+        self.pid = pid
+        self.interval = interval
+        self.samples: list[float] = []
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            rss = _read_rss_mb(self.pid)
+            if rss is not None:
+                self.samples.append(rss)
+            self._stop.wait(self.interval)
+
+    def __enter__(self) -> "RssSampler":
+        if self.pid is not None:
+            self._thread.start()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self._stop.set()
+        if self._thread.is_alive():
+            self._thread.join()
+
+    def summary(self) -> Optional[dict]:
+        if not self.samples:
+            return None
+        return {
+            "start": round(self.samples[0], 1),
+            "peak": round(max(self.samples), 1),
+            "end": round(self.samples[-1], 1),
+        }
+
+
+# ==================== 客户端 ====================
+
+async def _stream_one(client: httpx.AsyncClient, session_id: str, connection_id: str, message: str) -> dict:
+    """发送一次聊天请求并统计事件时间"""
+    start = time.perf_counter()
+    result = {"ttfe": None, "ttft": None, "latency": None, "events": 0, "tokens": 0, "error": None}
+    event = ""
+    async with client.stream(
+        "POST",
+        f"/api/chat/{session_id}/stream",
+        json={"message": message, "connection_id": connection_id},
+    ) as response:
+        if response.status_code != 200:
+            result["error"] = f"HTTP {response.status_code}"
+            return result
+        async for line in response.aiter_lines():
+            if line.startswith("event: "):
+                event = line[7:].strip()
+                continue
+            if not line.startswith("data: "):
+                continue
+            elapsed = time.perf_counter() - start
+            result["events"] += 1
+            if result["ttfe"] is None:
+                result["ttfe"] = elapsed
+            if event == "token":
+                result["tokens"] += 1
+                if result["ttft"] is None:
+                    result["ttft"] = elapsed
+            elif event == "error" and result["error"] is None:
+                result["error"] = json.loads(line[6:]).get("message", "error")
+            elif event == "done":
+                result["latency"] = elapsed
+    return result
+
+
+async def _run_session(client: httpx.AsyncClient, connection_id: str, index: int, questions: list[str]) -> list[dict]:
+    resp = await client.post("/api/sessions", json={"title": f"bench-{index}"})
+    resp.raise_for_status()
+    session_id = resp.json()["id"]
+    results = []
+    for question in questions:
+        results.append(await _stream_one(client, session_id, connection_id, question))
+    await client.delete(f"/api/sessions/{session_id}")
+    return results
+
+
+async def _drive(url: str, connection_id: str, sessions: list[list[str]], warmup: list[str]) -> tuple[list[dict], float]:
+    limits = httpx.Limits(max_connections=len(sessions) + 4, max_keepalive_connections=len(sessions) + 4)
+    async with httpx.AsyncClient(base_url=url, timeout=None, limits=limits) as client:
+        if warmup:
+            await _run_session(client, connection_id, -1, warmup)
+        start = time.perf_counter()
+        per_session = await asyncio.gather(*(
+            _run_session(client, connection_id, i, questions) for i, questions in enumerate(sessions)
+        ))
+        wall = time.perf_counter() - start
+    return [r for results in per_session for r in results], wall
+
+
+def _create_connection(url: str, args) -> str:
+    payload = {
+        "name": "bench",
+        "host": args.mysql_host,
+        "port": args.mysql_port,
+        "user": args.mysql_user,
+        "password": args.mysql_password,
+        "database": args.mysql_database,
+        "pool_size": max(5, args.sessions),
+    }
+    resp = httpx.post(f"{url}/api/connections", json=payload, timeout=10)
+    resp.raise_for_status()
+    return resp.json()["id"]
+
+
+# ==================== 统计 ====================
+
+def _percentiles(values: list[float]) -> Optional[dict]:
+    """毫秒分位数"""
+    if not values:
+        return None
+    ms = sorted(v * 1000 for v in values)
+
+    def pick(p: float) -> float:
+        return round(ms[min(len(ms) - 1, int(round(p * (len(ms) - 1))))], 2)
+
+    return {
+        "count": len(ms),
+        "mean": round(statistics.fmean(ms), 2),
+        "p50": pick(0.50),
+        "p90": pick(0.90),
+        "p95": pick(0.95),
+        "p99": pick(0.99),
+        "max": round(ms[-1], 2),
+    }
+
+
+def summarize(results: list[dict], wall: float, rss: Optional[dict]) -> dict:
+    ok = [r for r in results if r["error"] is None and r["latency"] is not None]
+    events = sum(r["events"] for r in results)
+    return {
+        "requests": len(results),
+        "errors": len(results) - len(ok),
+        "error_samples": sorted({r["error"] for r in results if r["error"]})[:5],
+        "wall_seconds": round(wall, 3),
+        "requests_per_sec": round(len(ok) / wall, 2) if wall else 0.0,
+        "events": events,
+        "events_per_sec": round(events / wall, 2) if wall else 0.0,
+        "tokens_per_request": round(statistics.fmean([r["tokens"] for r in ok]), 2) if ok else 0.0,
+        "ttfe_ms": _percentiles([r["ttfe"] for r in ok if r["ttfe"] is not None]),
+        "ttft_ms": _percentiles([r["ttft"] for r in ok if r["ttft"] is not None]),
+        "latency_ms": _percentiles([r["latency"] for r in ok]),
+        "rss_mb": rss,
+    }
+
+
+def _lookup(data: dict, path: str) -> Optional[float]:
+    for part in path.split("."):
+        if not isinstance(data, dict):
+            return None
+        data = data.get(part)
+    return data if isinstance(data, (int, float)) else None
+
+
+def compare(current: dict, baseline: dict) -> list[dict]:
+    """与基线结果逐项对比，change 为相对变化（正数表示变差）"""
+    rows = []
+    for path, lower_is_better in COMPARE_METRICS:
+        new, old = _lookup(current["results"], path), _lookup(baseline["results"], path)
+        if new is None or old is None or old == 0:
+            continue
+        change = (new - old) / old if lower_is_better else (old - new) / old
+        rows.append({"metric": path, "baseline": old, "current": new, "change": round(change, 4)})
+    return rows
+
+
+def git_revision() -> str:
+    try:
+        rev = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=REPO_DIR, capture_output=True, text=True, check=True
+        ).stdout.strip()
+        dirty = subprocess.run(["git", "diff", "--quiet", "HEAD"], cwd=REPO_DIR).returncode != 0
+        return f"{rev}-dirty" if dirty else rev
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+# ==================== 入口 ====================
+
+def run(args) -> int:
+    revision = git_revision()
+    sessions = [
+        [f"压测问题 {i}-{t}：预算最高的 10 个部门是哪些？" for t in range(args.turns)]
+        for i in range(args.sessions)
+    ]
+    warmup = [f"预热问题 {t}：预算最高的 10 个部门是哪些？" for t in range(args.warmup)]
+
+    proc = None
+    with tempfile.TemporaryDirectory(prefix="bench_chat_") as work_dir:
+        try:
+            if args.url:
+                url, connection_id, pid = args.url.rstrip("/"), args.connection_id, args.server_pid
+            else:
+                traces = os.path.join(work_dir, "traces.jsonl")
+                _write_traces(traces, warmup + [q for s in sessions for q in s], args.sql, args.answer_chars)
+                proc, url = _start_server(args, work_dir, traces)
+                connection_id, pid = _create_connection(url, args), proc.pid
+
+            print(f"压测 {url}：{args.sessions} 个会话 × {args.turns} 轮，mode={args.mode}，db={args.db}")
+            with RssSampler(pid) as sampler:
+                results, wall = asyncio.run(_drive(url, connection_id, sessions, warmup))
+            gateway = httpx.get(f"{url}/api/health/llm", timeout=10).json()
+        finally:
+            if proc is not None:
+                proc.terminate()
+                proc.wait(timeout=30)
+
+    report = {
+        "benchmark": "chat_stream",
+        "revision": revision,
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "config": {k: v for k, v in vars(args).items() if k not in ("command", "mysql_password", "compare", "output")},
+        "results": summarize(results, wall, sampler.summary()),
+        "llm": {"traces": gateway.get("traces"), "gateway_max_queue_depth": gateway.get("max_queue_depth")},
+    }
+    print(json.dumps(report["results"], ensure_ascii=False, indent=2))
+
+    output = args.output or os.path.join(BACKEND_DIR, "data", "bench", f"chat_stream_{revision}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"结果已写入 {output}")
+
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        print(f"\n对比基线 {baseline.get('revision')}（change > 0 表示变差）")
+        regressions = 0
+        for row in compare(report, baseline):
+            flag = "  <-- 退化" if row["change"] > args.threshold else ""
+            regressions += bool(flag)
+            print(f"  {row['metric']:<20} {row['baseline']:>12} -> {row['current']:>12}  {row['change']:+.1%}{flag}")
+        return 1 if regressions else 0
+    return 0
+
+
+def main() -> int:
+    from app.config import get_settings
+
+    settings = get_settings()
+    parser = argparse.ArgumentParser(description="聊天 SSE 全链路压测")
+    sub = parser.add_subparsers(dest="command")
+
+    serve_parser = sub.add_parser("serve", help="（内部）启动压测用后端进程")
+    serve_parser.add_argument("--port", type=int, required=True)
+    serve_parser.add_argument("--sqlite", default=None)
+
+    parser.add_argument("--sessions", type=int, default=10, help="并发会话数")
+    parser.add_argument("--turns", type=int, default=3, help="每个会话的提问轮数（同一会话内串行）")
+    parser.add_argument("--warmup", type=int, default=1, help="正式压测前的预热请求数")
+    parser.add_argument("--mode", choices=["thread", "async"], default=settings.AGENT_EXECUTION_MODE)
+    parser.add_argument("--db", choices=["sqlite", "mysql"], default="sqlite")
+    parser.add_argument("--sql", default=DEFAULT_SQL, help="回放中 Agent 执行的 SQL")
+    parser.add_argument("--answer-chars", type=int, default=200, help="回放回答的字符数")
+    parser.add_argument("--latency-ms", type=int, default=300, help="模拟的 LLM 首个分片延迟")
+    parser.add_argument("--token-interval-ms", type=int, default=20, help="模拟的 LLM 分片间隔")
+    parser.add_argument("--mysql-host", default=settings.MYSQL_HOST)
+    parser.add_argument("--mysql-port", type=int, default=settings.MYSQL_PORT)
+    parser.add_argument("--mysql-user", default=settings.MYSQL_USER)
+    parser.add_argument("--mysql-password", default=settings.MYSQL_PASSWORD)
+    parser.add_argument("--mysql-database", default=settings.MYSQL_DATABASE or "ai_sales_data")
+    parser.add_argument("--url", default=None, help="压测已启动的后端（需同时指定 --connection-id）")
+    parser.add_argument("--connection-id", default=None)
+    parser.add_argument("--server-pid", type=int, default=None, help="--url 模式下用于采样 RSS 的后端进程号")
+    parser.add_argument("--output", default=None, help="结果 JSON 路径（默认 backend/data/bench/chat_stream_<revision>.json）")
+    parser.add_argument("--compare", default=None, help="基线结果 JSON，逐项对比并在退化超过阈值时返回 1")
+    parser.add_argument("--threshold", type=float, default=0.1, help="判定退化的相对变化阈值")
+    args = parser.parse_args()
+
+    if args.command == "serve":
+        serve(args.port, args.sqlite)
+        return 0
+    if args.url and not args.connection_id:
+        parser.error("--url 需要同时指定 --connection-id")
+    return run(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,399 @@
+"""
+数据库路由热点路径微基准
+用 sql_repo/init_db.py 的合成表生成器按规模生成 schema 与数据，进程内直接调用 /api/database 路由的处理函数
+（不经 HTTP），统计：
+  - schema_cold / schema_warm：读取全部表结构（缓存失效后全量读取 / 命中缓存）
+  - schema_serialize：SchemaResponse 序列化为 JSON
+  - query_first_page：首次查询（物化 QUERY_CACHE_MAX_ROWS 行 + 总行数 + 第 1 页）
+  - page_cached / page_deep_offset：携带句柄翻页（物化范围内切片 / 超出范围回退 LIMIT/OFFSET 的末页）
+  - count_exact / count_estimate：结果超过物化上限时的 COUNT(*) / EXPLAIN 估算
+  - keyset_first / keyset_deep：键集分页首页 / 末页
+  - serialize_page / serialize_max_page：SqlQueryResponse 序列化为 JSON（--page-size 行 / 500 行）
+
+数据库：
+  - mysql（默认）：在 --mysql-* 指定的库（默认取 .env 中的 MYSQL_*）中重建合成表（--skip-generate 时复用已有数据）；
+    连接不上时立即以退出码 3 结束
+  - sqlite：生成的库缓存在 backend/data/bench/ 下，参数不变时复用，只用于没有 MySQL 时粗测分页与序列化；
+    schema 读取（information_schema）、EXPLAIN 估算与键集分页（%s 占位符）依赖 MySQL，相应项记为跳过；
+    有跳过项时打印警告并以退出码 2 结束（--allow-skipped 时仅警告），避免把不完整的结果当作完整基准
+
+运行方式：
+  python backend/app/playground/bench_database_router.py --mysql-database bench --tables 500 --fact-rows 1000000
+  python backend/app/playground/bench_database_router.py --mysql-database bench --skip-generate --compare data/bench/database_router_abc123.json
+  python backend/app/playground/bench_database_router.py --db sqlite --allow-skipped
+"""
+
+import argparse
+import json
+import os
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+from typing import Any, Callable, Optional
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+REPO_DIR = os.path.dirname(BACKEND_DIR)
+
+for path in (BACKEND_DIR, os.path.join(REPO_DIR, "sql_repo")):
+    if path not in sys.path:
+        sys.path.insert(0, path)
+
+import init_db  # noqa: E402  (sql_repo/init_db.py)
+
+# 对比时各项取中位数，越小越好
+COMPARE_STAT = "median_ms"
+
+# 有依赖 MySQL 的项被跳过时的退出码
+EXIT_SKIPPED = 2
+# MySQL 连接失败时的退出码
+EXIT_UNREACHABLE = 3
+
+
+# ==================== 数据准备 ====================
+
+def _prepare_sqlite(args) -> str:
+    """生成（或复用）SQLite 合成库，返回文件路径"""
+    name = f"router_{args.tables}x{args.rows}x{args.columns}_{args.fact_rows}_{args.seed}.db"
+    path = os.path.join(BACKEND_DIR, "data", "bench", name)
+    if os.path.exists(path) and not args.regenerate:
+        return path
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    if os.path.exists(path):
+        os.remove(path)
+    print(f"生成 SQLite 合成库 {path} ...")
+    conn = sqlite3.connect(path)
+    try:
+        init_db.init_scaled_tables(conn, args.tables, args.rows, args.columns, args.fact_rows, args.seed)
+    finally:
+        conn.close()
+    return path
+
+
+def _check_mysql(args) -> Optional[str]:
+    """确认 MySQL 可连接（连接超时 5 秒），失败时返回错误描述"""
+    import pymysql
+
+    try:
+        conn = pymysql.connect(
+            host=args.mysql_host, port=args.mysql_port, user=args.mysql_user,
+            password=args.mysql_password, database=args.mysql_database, charset="utf8mb4",
+            connect_timeout=5,
+        )
+    except pymysql.Error as e:
+        return str(e)
+    conn.close()
+    return None
+
+
+def _prepare_mysql(args) -> None:
+    """在 MySQL 中重建合成表"""
+    import pymysql
+
+    conn = pymysql.connect(
+        host=args.mysql_host, port=args.mysql_port, user=args.mysql_user,
+        password=args.mysql_password, database=args.mysql_database, charset="utf8mb4",
+    )
+    try:
+        cursor = conn.cursor()
+        cursor.execute(
+            "SELECT COUNT(*) FROM information_schema.TABLES "
+            "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME LIKE %s",
+            (init_db.SYNTHETIC_PREFIX + "%",),
+        )
+        existing = cursor.fetchone()[0]
+        cursor.close()
+        print(f"在 MySQL {args.mysql_database} 中生成合成表 ...")
+        init_db.init_scaled_tables(
+            conn, args.tables, args.rows, args.columns, args.fact_rows, args.seed,
+            placeholder="%s", existing_tables=existing,
+        )
+    finally:
+        conn.close()
+
+
+def _register_connection(args) -> str:
+    from app.models.schemas import MySQLConnectionCreate
+    from app.services import connection_service
+
+    config = connection_service.add_connection(MySQLConnectionCreate(
+        name="bench",
+        host=args.mysql_host,
+        port=args.mysql_port,
+        user=args.mysql_user,
+        password=args.mysql_password,
+        database=args.mysql_database,
+        query_timeout=0,
+    ))
+    return config.id
+
+
+# ==================== 计时 ====================
+
+def _measure(func: Callable[[], Any], repeat: int, setup: Optional[Callable[[], None]] = None) -> tuple[dict, Any]:
+    """执行 repeat 次（每次前调用 setup，不计时），返回 (毫秒统计, 最后一次的返回值)"""
+    samples = []
+    result = None
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        start = time.perf_counter()
+        result = func()
+        samples.append((time.perf_counter() - start) * 1000)
+    samples.sort()
+    return {
+        "runs": len(samples),
+        "min_ms": round(samples[0], 3),
+        "median_ms": round(statistics.median(samples), 3),
+        "p95_ms": round(samples[min(len(samples) - 1, int(round(0.95 * (len(samples) - 1))))], 3),
+        "max_ms": round(samples[-1], 3),
+    }, result
+
+
+class Bench:
+    """逐项运行并收集结果；依赖 MySQL 的项在其他库上记为跳过"""
+
+    SKIPPED_MYSQL = "需要 MySQL"
+
+    def __init__(self, repeat: int, is_mysql: bool):
+        self.repeat = repeat
+        self.is_mysql = is_mysql
+        self.results: dict[str, dict] = {}
+
+    def run(
+        self,
+        name: str,
+        func: Callable[[], Any],
+        setup: Optional[Callable[[], None]] = None,
+        requires_mysql: bool = False,
+        extra: Optional[Callable[[Any], dict]] = None,
+    ) -> Any:
+        if requires_mysql and not self.is_mysql:
+            self.results[name] = {"skipped": self.SKIPPED_MYSQL}
+            print(f"  {name:<20} 跳过（需要 MySQL）")
+            return None
+        stats, result = _measure(func, self.repeat, setup)
+        if extra is not None:
+            stats.update(extra(result))
+        self.results[name] = stats
+        print(f"  {name:<20} median {stats['median_ms']:>10.3f} ms   p95 {stats['p95_ms']:>10.3f} ms")
+        return result
+
+
+# ==================== 基准项 ====================
+
+def run_cases(args, connection_id: str, is_mysql: bool) -> dict:
+    from app.models.schemas import SqlQueryRequest, SqlQueryResponse
+    from app.routers import database
+    from app.services import connection_service, query_service, schema_service
+    from app.services.query_guard import QueryGuard
+
+    bench = Bench(args.repeat, is_mysql)
+    sql = f"SELECT * FROM {init_db.FACT_TABLE}"
+
+    # ---------- schema ----------
+    bench.run(
+        "schema_cold",
+        lambda: database._load_schema(connection_id, True),
+        setup=lambda: schema_service.invalidate(connection_id),
+        requires_mysql=True,
+        extra=lambda r: {"tables": len(r.tables), "columns": sum(len(t.columns) for t in r.tables)},
+    )
+    schema = bench.run("schema_warm", lambda: database._load_schema(connection_id, False), requires_mysql=True)
+    bench.run(
+        "schema_serialize",
+        lambda: schema.model_dump_json(),
+        requires_mysql=True,
+        extra=lambda r: {"bytes": len(r.encode("utf-8"))},
+    )
+
+    if not args.fact_rows:
+        return bench.results
+
+    # ---------- 页码分页 ----------
+    def offset_query(**kwargs) -> SqlQueryResponse:
+        kwargs.setdefault("page_size", args.page_size)
+        body = SqlQueryRequest(connection_id=connection_id, sql=sql, **kwargs)
+        return database._execute_offset_query(body, sql, QueryGuard(connection_id))
+
+    first = bench.run(
+        "query_first_page",
+        offset_query,
+        extra=lambda r: {"total_count": r.total_count, "materialized_rows": len(
+            query_service.get_handle(r.query_handle, connection_id, sql).rows
+        )},
+    )
+    handle = first.query_handle
+    bench.run("page_cached", lambda: offset_query(page=2, query_handle=handle))
+    bench.run("page_deep_offset", lambda: offset_query(page=first.total_pages, query_handle=handle))
+
+    # ---------- 总行数 ----------
+    entry = query_service.get_handle(handle, connection_id, sql)
+
+    def count(mode: str) -> int:
+        conn = connection_service.get_engine(connection_id).raw_connection()
+        try:
+            query_service.ensure_count(conn, entry, mode)
+        finally:
+            conn.close()
+        return entry.total_count
+
+    def reset_count() -> None:
+        entry.total_count = None
+        entry.count_estimated = False
+
+    if entry.complete:
+        bench.results["count_exact"] = bench.results["count_estimate"] = {"skipped": "结果未超过物化上限"}
+    else:
+        bench.run("count_exact", lambda: count("exact"), setup=reset_count)
+        bench.run(
+            "count_estimate", lambda: count("estimate"), setup=reset_count, requires_mysql=True,
+            extra=lambda r: {"estimated_count": r},
+        )
+
+    # ---------- 键集分页 ----------
+    def keyset_query(cursor: Optional[str] = None) -> SqlQueryResponse:
+        body = SqlQueryRequest(
+            connection_id=connection_id, sql=sql, page_size=args.page_size,
+            pagination="keyset", key_columns=["id"], cursor=cursor,
+        )
+        return database._execute_keyset_query(body, sql, QueryGuard(connection_id))
+
+    deep_cursor = query_service.encode_cursor(sql, ["id"], [max(0, args.fact_rows - args.page_size)])
+    bench.run("keyset_first", keyset_query, requires_mysql=True)
+    bench.run("keyset_deep", lambda: keyset_query(deep_cursor), requires_mysql=True)
+
+    # ---------- 序列化 ----------
+    bench.run(
+        "serialize_page",
+        first.model_dump_json,
+        extra=lambda r: {"rows": len(first.rows), "bytes": len(r.encode("utf-8"))},
+    )
+    max_page = offset_query(page_size=500, query_handle=handle) if args.page_size != 500 else first
+    bench.run(
+        "serialize_max_page",
+        max_page.model_dump_json,
+        extra=lambda r: {"rows": len(max_page.rows), "bytes": len(r.encode("utf-8"))},
+    )
+    return bench.results
+
+
+# ==================== 入口 ====================
+
+def compare(current: dict, baseline: dict, threshold: float) -> int:
+    """逐项对比中位数，返回退化项数量"""
+    print(f"\n对比基线 {baseline.get('revision')}（change > 0 表示变慢）")
+    regressions = 0
+    for name, stats in current["results"].items():
+        old = baseline["results"].get(name, {}).get(COMPARE_STAT)
+        new = stats.get(COMPARE_STAT)
+        if not old or new is None:
+            continue
+        change = (new - old) / old
+        flag = "  <-- 退化" if change > threshold else ""
+        regressions += bool(flag)
+        print(f"  {name:<20} {old:>12.3f} -> {new:>12.3f} ms  {change:+.1%}{flag}")
+    return regressions
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="数据库路由微基准")
+    parser.add_argument("--db", choices=["mysql", "sqlite"], default="mysql",
+                        help="mysql：完整基准；sqlite：无 MySQL 时粗测（schema 与键集分页项跳过）")
+    parser.add_argument("--tables", type=int, default=500, help="合成表数量")
+    parser.add_argument("--rows", type=int, default=20, help="每张合成表的行数")
+    parser.add_argument("--columns", type=int, default=8, help="每张合成表的列数")
+    parser.add_argument("--fact-rows", type=int, default=1_000_000, help="bench_facts 大表的行数（0 表示只测 schema）")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--regenerate", action="store_true", help="sqlite：忽略已缓存的合成库重新生成")
+    parser.add_argument("--skip-generate", action="store_true", help="mysql：复用库中已有的合成表")
+    parser.add_argument("--page-size", type=int, default=50)
+    parser.add_argument("--cache-rows", type=int, default=None, help="覆盖 QUERY_CACHE_MAX_ROWS")
+    parser.add_argument("--repeat", type=int, default=5, help="每项重复次数")
+    parser.add_argument("--mysql-host", default=None)
+    parser.add_argument("--mysql-port", type=int, default=None)
+    parser.add_argument("--mysql-user", default=None)
+    parser.add_argument("--mysql-password", default=None)
+    parser.add_argument("--mysql-database", default=None)
+    parser.add_argument("--output", default=None, help="结果 JSON 路径（默认 backend/data/bench/database_router_<revision>.json）")
+    parser.add_argument("--compare", default=None, help="基线结果 JSON，中位数退化超过阈值时返回 1")
+    parser.add_argument("--threshold", type=float, default=0.1, help="判定退化的相对变化阈值")
+    parser.add_argument("--allow-skipped", action="store_true", help="依赖 MySQL 的项被跳过时仍返回 0")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix="bench_router_") as work_dir:
+        # 连接配置写入临时文件，不影响本地 connections.json
+        os.environ["CONNECTIONS_FILE"] = os.path.join(work_dir, "connections.json")
+        if args.cache_rows is not None:
+            os.environ["QUERY_CACHE_MAX_ROWS"] = str(args.cache_rows)
+
+        from app.config import get_settings
+        from app.playground.bench_chat_stream import git_revision, use_sqlite_engine
+
+        settings = get_settings()
+        args.mysql_host = args.mysql_host or settings.MYSQL_HOST
+        args.mysql_port = args.mysql_port or settings.MYSQL_PORT
+        args.mysql_user = args.mysql_user or settings.MYSQL_USER
+        args.mysql_password = args.mysql_password if args.mysql_password is not None else settings.MYSQL_PASSWORD
+        args.mysql_database = args.mysql_database or settings.MYSQL_DATABASE or "ai_sales_data"
+
+        if args.db == "sqlite":
+            use_sqlite_engine(_prepare_sqlite(args))
+        else:
+            error = _check_mysql(args)
+            if error is not None:
+                print(
+                    f"无法连接 MySQL {args.mysql_user}@{args.mysql_host}:{args.mysql_port}/{args.mysql_database}：{error}\n"
+                    f"请通过 --mysql-* 或 .env 的 MYSQL_* 指定可用的库；没有 MySQL 时可用 --db sqlite 粗测（结果不完整）",
+                    file=sys.stderr,
+                )
+                return EXIT_UNREACHABLE
+            if not args.skip_generate:
+                _prepare_mysql(args)
+        connection_id = _register_connection(args)
+
+        print(
+            f"数据库路由微基准：db={args.db}，{args.tables} 张表 × {args.rows} 行 × {args.columns} 列，"
+            f"{init_db.FACT_TABLE} {args.fact_rows} 行，物化上限 {settings.QUERY_CACHE_MAX_ROWS} 行"
+        )
+        results = run_cases(args, connection_id, is_mysql=args.db == "mysql")
+
+    revision = git_revision()
+    report = {
+        "benchmark": "database_router",
+        "revision": revision,
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "config": {
+            **{k: v for k, v in vars(args).items() if k not in ("mysql_password", "compare", "output")},
+            "query_cache_max_rows": settings.QUERY_CACHE_MAX_ROWS,
+        },
+        "results": results,
+    }
+    output = args.output or os.path.join(BACKEND_DIR, "data", "bench", f"database_router_{revision}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"结果已写入 {output}")
+
+    exit_code = 0
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        exit_code = 1 if compare(report, baseline, args.threshold) else 0
+
+    skipped = [name for name, stats in results.items() if stats.get("skipped") == Bench.SKIPPED_MYSQL]
+    if skipped:
+        print(
+            f"\n警告：以下 {len(skipped)} 项依赖 MySQL，在 {args.db} 上未运行，结果不完整：\n"
+            f"  {', '.join(skipped)}\n"
+            f"  去掉 --db sqlite 在 MySQL 上运行完整基准"
+            + ("" if args.allow_skipped else f"（退出码 {EXIT_SKIPPED}；--allow-skipped 时忽略）")
+        )
+        if not args.allow_skipped:
+            exit_code = exit_code or EXIT_SKIPPED
+    return exit_code
+
+
+if __name__ == "__main__":
+    sys.exit(main())
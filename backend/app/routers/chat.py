@@ -1,19 +1,37 @@
 """
 聊天接口 - SSE 流式推送（MySQL 版本 - Phase2）
 事件类型：token / sql / thinking / chart / done / error
-基于 Agent stream_mode="updates" 接口，支持按 connection_id 指定数据库
+基于 Agent stream_mode=["messages", "updates"] 接口，支持按 connection_id 指定数据库
+最终回答按 token 实时推送，updates 事件用于 sql / thinking
+Agent 与图表生成均在线程池/原生异步中执行，不阻塞事件循环
+图表在 sql_db_query 返回结果后立即后台生成，与最终回答并行，就绪即推送
+会话首轮问题命中问题 → SQL 缓存时重放 SQL，跳过 Agent 的多轮工具调用
+每轮结束后在后台压缩对话记忆（裁剪 / 摘要较早轮次，只保留最新 checkpoint）；
+同一线程的 Agent 运行与压缩持同一把锁串行执行，压缩不会覆盖下一轮已写入的消息
 """
 
 import json
 import asyncio
-from typing import AsyncGenerator
+import weakref
+from typing import Any, AsyncGenerator, AsyncIterator, Optional
 from fastapi import APIRouter, HTTPException
 from starlette.responses import StreamingResponse
 
+from app.config import get_settings
 from app.models.schemas import ChatRequest
-from app.services.agent_service import get_agent
-from app.services import session_service
+from app.services.agent_service import (
+    aget_agent,
+    astream_agent,
+    astream_replay,
+    compact_conversation,
+    prepare_replay,
+    remember_question,
+    select_relevant_tables,
+)
+from app.services import checkpoint_service, context_budget, question_cache, session_service
 from app.services.chart_service import generate_chart
+from app.services.query_guard import QueryGuard
+from app.services.sql_tools import QueryResult
 
 router = APIRouter(prefix="/api/chat", tags=["聊天"])
 
@@ -25,6 +43,40 @@ _TOOL_NAMES = {
     "sql_db_query": "执行 SQL 查询",
 }
 
+# 检索相关表时拼接的历史用户问题数
+_RETRIEVAL_HISTORY = 2
+
+# 进行中的对话记忆压缩任务（持有引用，避免任务被回收）
+_compaction_tasks: set[asyncio.Task] = set()
+
+# thread_id -> 线程锁（无人持有 / 等待时自动回收）
+_thread_locks: "weakref.WeakValueDictionary[str, asyncio.Lock]" = weakref.WeakValueDictionary()
+
+
+def _thread_lock(thread_id: str) -> asyncio.Lock:
+    """同一对话线程的 Agent 运行与记忆压缩共用的锁（进程内）"""
+    lock = _thread_locks.get(thread_id)
+    if lock is None:
+        lock = asyncio.Lock()
+        _thread_locks[thread_id] = lock
+    return lock
+
+
+def _schedule_compaction(agent, config: dict) -> None:
+    """后台压缩对话记忆，不推迟 done 事件；持线程锁执行，下一轮在压缩完成后才开始"""
+    lock = _thread_lock(config["configurable"]["thread_id"])
+
+    async def _run() -> None:
+        try:
+            async with lock:
+                await asyncio.to_thread(compact_conversation, agent, config)
+        except Exception as e:
+            print(f"[对话记忆] 压缩失败: {e}")
+
+    task = asyncio.create_task(_run())
+    _compaction_tasks.add(task)
+    task.add_done_callback(_compaction_tasks.discard)
+
 
 def _format_sse(event: str, data: str) -> str:
     """格式化 SSE 事件"""
@@ -44,10 +96,125 @@ def _summary_tool_result(name: str, content: str) -> str:
     return content[:100] + ("..." if len(content) > 100 else "")
 
 
+class _ThinkingLog:
+    """
+    思考过程累积器，负责生成 thinking 事件
+
+    - full 模式：每次发送 {"seq": n, "content": 全量文本}
+    - delta 模式：仅发送 {"seq": n, "delta": 新增步骤}，
+      每 snapshot_interval 步改发一次全量 {"seq": n, "content": ...} 供接收方校正
+    seq 为追加后的步骤总数，接收方据此检测丢失并等待下一次快照
+    """
+
+    def __init__(self, mode: str, snapshot_interval: int = 0):
+        self.mode = mode
+        self.snapshot_interval = snapshot_interval
+        self.lines: list[str] = []
+
+    def text(self) -> str:
+        """完整思考过程文本"""
+        return "\n\n".join(self.lines)
+
+    def append(self, line: str) -> str:
+        """追加一步并返回对应的 SSE 事件"""
+        self.lines.append(line)
+        seq = len(self.lines)
+        if self.mode == "delta" and not (
+            self.snapshot_interval and seq % self.snapshot_interval == 0
+        ):
+            payload = {"seq": seq, "delta": line}
+        else:
+            payload = {"seq": seq, "content": self.text()}
+        return _format_sse("thinking", json.dumps(payload, ensure_ascii=False))
+
+
+class _ChartJob:
+    """
+    后台图表任务
+
+    sql_db_query 结果到达即启动，与 Agent 生成最终回答并行；
+    Agent 重新查询时丢弃旧任务，只推送最后一次查询的图表
+    """
+
+    def __init__(self):
+        self.task: Optional[asyncio.Future] = None
+
+    def start(self, question: str, sql: str, query_result: QueryResult) -> None:
+        """启动（或替换）图表生成任务"""
+        self.cancel()
+        self.task = asyncio.ensure_future(asyncio.to_thread(
+            generate_chart,
+            question=question,
+            sql=sql,
+            query_result=query_result,
+        ))
+
+    def pop_event(self) -> Optional[str]:
+        """取出已完成任务的 chart 事件，无图表时返回 None"""
+        task, self.task = self.task, None
+        try:
+            chart_data = task.result()
+        except Exception as e:
+            # 图表生成失败不影响主流程
+            chart_data = {
+                "chart_type": "table", "echarts_option": None,
+                "table_data": {"columns": ["错误"], "rows": [[str(e)]]},
+            }
+        if not chart_data:
+            return None
+        return _format_sse("chart", json.dumps(chart_data, ensure_ascii=False))
+
+    async def wait_event(self) -> Optional[str]:
+        """等待进行中的任务完成并取出 chart 事件"""
+        if self.task is None:
+            return None
+        await asyncio.wait({self.task})
+        return self.pop_event()
+
+    def cancel(self) -> None:
+        """取消进行中的任务（线程内的 LLM 调用无法中断，结果将被丢弃）"""
+        if self.task is not None:
+            self.task.cancel()
+            self.task = None
+
+
+async def _interleave(
+    events: AsyncIterator[Any],
+    chart: _ChartJob,
+) -> AsyncIterator[tuple[str, Any]]:
+    """
+    合并 Agent 事件流与后台图表任务，谁先就绪先产出谁
+
+    Yields:
+        ("agent", 事件) 或 ("chart", SSE 字符串 | None)
+    """
+    it = events.__aiter__()
+    next_event = asyncio.ensure_future(anext(it))
+    try:
+        while True:
+            waiting = {next_event}
+            if chart.task is not None:
+                waiting.add(chart.task)
+            done, _ = await asyncio.wait(waiting, return_when=asyncio.FIRST_COMPLETED)
+
+            if chart.task is not None and chart.task in done:
+                yield "chart", chart.pop_event()
+            if next_event in done:
+                try:
+                    item = next_event.result()
+                except StopAsyncIteration:
+                    return
+                yield "agent", item
+                next_event = asyncio.ensure_future(anext(it))
+    finally:
+        next_event.cancel()
+
+
 async def _stream_agent_response(
     session_id: str,
     message: str,
     connection_id: str,
+    thinking_mode: str | None = None,
 ) -> AsyncGenerator[str, None]:
     """
     执行 Agent 并流式推送结果
@@ -56,35 +223,104 @@ async def _stream_agent_response(
         session_id: 会话 ID
         message: 用户消息
         connection_id: MySQL 连接 ID
+        thinking_mode: thinking 事件协议 full / delta，None 时使用配置默认值
 
     SSE 事件流：
-    - event: token    -> data: {"content": "文本片段"} 仅最终回答
+    - event: token    -> data: {"content": "文本片段"} 仅最终回答，逐 token 推送
+                         或 {"reset": true}：已推送的片段实为工具调用前的思考，接收方应清空
     - event: sql      -> data: {"sql": "SELECT..."}
-    - event: thinking -> data: {"content": "完整思考过程"} 用户问题+思考步骤，追加累积
+    - event: thinking -> data: {"seq": n, "content": "完整思考过程"}（full）
+                         或 {"seq": n, "delta": "新增步骤"}（delta，步骤间以空行拼接）
     - event: chart    -> data: {"chart_type": "bar", ...}
     - event: done     -> data: {}
     - event: error    -> data: {"message": "错误描述"}
     """
+    chart = _ChartJob()
+    # 客户端断开 / 运行中止时 KILL 工具正在执行的查询
+    query_guard = QueryGuard(connection_id)
+    thread_id = checkpoint_service.thread_id_for(session_id, connection_id)
+    # 等待同一线程上一轮的运行 / 记忆压缩结束
+    lock = _thread_lock(thread_id)
+    await lock.acquire()
     try:
-        agent = get_agent(connection_id)
-        thread_config = {"configurable": {"thread_id": session_id}}
+        agent = await aget_agent(connection_id)
+        # query_results：sql_db_query 的完整结果（按 tool_call_id），不进入对话状态
+        query_results: dict[str, QueryResult] = {}
+        thread_config = {"configurable": {
+            "thread_id": thread_id,
+            "query_guard": query_guard,
+            "query_results": query_results,
+        }}
 
         executed_sql = None
-        query_result = None
         final_answer = ""
-        thinking_lines: list[str] = []
+        settings = get_settings()
+        stream_tokens = settings.AGENT_STREAM_TOKENS
+        # 当前 model 轮次已推送的 token 文本；轮次结束（updates 事件）时清空
+        streamed_text = ""
+        # 当前 model 轮次出现工具调用分片后不再推送 token
+        in_tool_call = False
+        thinking = _ThinkingLog(
+            thinking_mode or settings.THINKING_EVENT_MODE,
+            settings.THINKING_SNAPSHOT_INTERVAL,
+        )
 
         # 初始化：用户问题
-        thinking_lines.append(f"**用户问题**：{message}")
-        yield _format_sse("thinking", json.dumps(
-            {"content": "\n\n".join(thinking_lines)}, ensure_ascii=False
-        ))
+        yield thinking.append(f"**用户问题**：{message}")
+
+        # 问题 → SQL 缓存仅用于会话首轮（后续轮次可能依赖上下文，如“那上个月呢”）
+        history = session_service.get_messages(session_id) or []
+        first_turn = not history
+        replay = None
+        if first_turn:
+            replay = await asyncio.to_thread(prepare_replay, connection_id, message, query_guard)
+        # 最近一次 sql_db_query 是否执行成功（成功的首轮问答才写入缓存）
+        query_succeeded = False
+
+        stream_mode = ["messages", "updates"] if stream_tokens else "updates"
+        if replay is not None:
+            yield thinking.append("**命中问题缓存**：复用已验证的 SQL，重新执行获取最新数据")
+            agent_events = astream_replay(
+                agent, message, replay, thread_config, stream_mode=stream_mode
+            )
+        else:
+            # 表较多时按问题检索相关表（拼接近几轮问题，兼顾追问）
+            recent_questions = [m["content"] for m in history if m["role"] == "user"][-_RETRIEVAL_HISTORY:]
+            relevant_tables = await asyncio.to_thread(
+                select_relevant_tables, connection_id, "\n".join(recent_questions + [message])
+            )
+            if relevant_tables:
+                thread_config["configurable"]["relevant_tables"] = relevant_tables
+                yield thinking.append(f"**检索相关表**：{', '.join(relevant_tables)}")
+            agent_events = astream_agent(
+                agent,
+                {"messages": [{"role": "user", "content": message}]},
+                config=thread_config,
+                stream_mode=stream_mode,
+            )
+        async for source, item in _interleave(agent_events, chart):
+            if source == "chart":
+                if item:
+                    yield item
+                continue
+
+            mode, event = item if stream_tokens else ("updates", item)
+
+            if mode == "messages":
+                chunk, metadata = event
+                # 仅推送 model 节点的文本分片（工具内部的 LLM 调用如 query_checker 忽略）
+                if metadata.get("langgraph_node") != "model" or in_tool_call:
+                    continue
+                if getattr(chunk, "tool_call_chunks", None):
+                    in_tool_call = True
+                    continue
+                if isinstance(chunk.content, str) and chunk.content:
+                    streamed_text += chunk.content
+                    yield _format_sse("token", json.dumps(
+                        {"content": chunk.content}, ensure_ascii=False
+                    ))
+                continue
 
-        for event in agent.stream(
-            {"messages": [{"role": "user", "content": message}]},
-            config=thread_config,
-            stream_mode="updates",
-        ):
             for node_name, node_data in event.items():
                 if not isinstance(node_data, dict) or "messages" not in node_data:
                     continue
@@ -93,13 +329,16 @@ async def _stream_agent_response(
                     msg_type = type(msg).__name__
 
                     if node_name == "model" and msg_type == "AIMessage":
+                        already_streamed = streamed_text
+                        streamed_text = ""
+                        in_tool_call = False
                         if hasattr(msg, "tool_calls") and msg.tool_calls:
+                            # 已推送的 token 属于工具调用前的思考，通知前端撤回
+                            if already_streamed:
+                                yield _format_sse("token", json.dumps({"reset": True}))
                             # 中间思考：追加 AI 的 reasoning
                             if msg.content:
-                                thinking_lines.append(f"**思考**：{msg.content.strip()}")
-                                yield _format_sse("thinking", json.dumps(
-                                    {"content": "\n\n".join(thinking_lines)}, ensure_ascii=False
-                                ))
+                                yield thinking.append(f"**思考**：{msg.content.strip()}")
                             # 记录 SQL 并发送 sql 事件
                             for tc in msg.tool_calls:
                                 if tc.get("name") == "sql_db_query":
@@ -108,58 +347,51 @@ async def _stream_agent_response(
                                         {"sql": executed_sql}, ensure_ascii=False
                                     ))
                         else:
-                            # 最终回答：仅发 token，不发 thinking
+                            # 最终回答：token 已逐片推送；未流式输出时整段补发
                             if msg.content:
                                 final_answer = msg.content
-                                yield _format_sse("token", json.dumps(
-                                    {"content": msg.content}, ensure_ascii=False
-                                ))
-                            thinking_lines.append(f"**最终回答**：\n{msg.content.strip()}")
-                            yield _format_sse("thinking", json.dumps(
-                                {"content": "\n\n".join(thinking_lines)}, ensure_ascii=False
-                            ))
+                                if not already_streamed:
+                                    yield _format_sse("token", json.dumps(
+                                        {"content": msg.content}, ensure_ascii=False
+                                    ))
+                            yield thinking.append(f"**最终回答**：\n{msg.content.strip()}")
 
                     elif node_name == "tools" and msg_type == "ToolMessage":
                         if hasattr(msg, "name"):
                             tool_name = msg.name
                             desc = _TOOL_NAMES.get(tool_name, tool_name)
                             summary = _summary_tool_result(tool_name, msg.content or "")
-                            thinking_lines.append(f"**{desc}**：{summary}")
-                            yield _format_sse("thinking", json.dumps(
-                                {"content": "\n\n".join(thinking_lines)}, ensure_ascii=False
-                            ))
+                            yield thinking.append(f"**{desc}**：{summary}")
+                            # 查询结果已知，立即后台生成图表（与最终回答并行）
+                            # 结构化结果由中间件按 tool_call_id 交出，查询出错时为 None
+                            query_result = query_results.pop(getattr(msg, "tool_call_id", None), None)
                             if tool_name == "sql_db_query":
-                                query_result = msg.content
-
-            await asyncio.sleep(0)
-
-        # Agent 执行完毕后，生成图表
-        if executed_sql and query_result:
-            try:
-                chart_data = generate_chart(
-                    question=message,
-                    sql=executed_sql,
-                    query_result=query_result,
-                )
-                if chart_data:
-                    yield _format_sse("chart", json.dumps(
-                        chart_data, ensure_ascii=False
-                    ))
-            except Exception as e:
-                # 图表生成失败不影响主流程
-                yield _format_sse("chart", json.dumps(
-                    {"chart_type": "table", "echarts_option": None,
-                     "table_data": {"columns": ["错误"], "rows": [[str(e)]]}},
-                    ensure_ascii=False,
-                ))
+                                query_succeeded = isinstance(query_result, QueryResult)
+                            if (
+                                tool_name == "sql_db_query"
+                                and executed_sql
+                                and isinstance(query_result, QueryResult)
+                                and query_result.rows
+                            ):
+                                chart.start(message, executed_sql, query_result)
+
+        # Agent 执行完毕后，等待尚未完成的图表
+        chart_event = await chart.wait_event()
+        if chart_event:
+            yield chart_event
+
+        # 首轮问答成功且非缓存重放时，记录问题 → SQL
+        if first_turn and replay is None and executed_sql and final_answer and query_succeeded:
+            await asyncio.to_thread(remember_question, connection_id, message, executed_sql)
 
         # 保存消息到会话
         session_service.add_message(session_id, "user", message)
         if final_answer:
-            thinking_content = "\n\n".join(thinking_lines) if thinking_lines else None
+            thinking_content = thinking.text() if thinking.lines else None
             session_service.add_message(
                 session_id, "assistant", final_answer, thinking_process=thinking_content
             )
+        _schedule_compaction(agent, thread_config)
 
         # 发送完成事件
         yield _format_sse("done", "{}")
@@ -175,6 +407,10 @@ async def _stream_agent_response(
             {"message": f"处理失败: {str(e)}"}, ensure_ascii=False
         ))
         yield _format_sse("done", "{}")
+    finally:
+        lock.release()
+        chart.cancel()
+        query_guard.cancel_in_background()
 
 
 @router.post("/{session_id}/stream")
@@ -185,7 +421,7 @@ async def chat_stream(session_id: str, body: ChatRequest):
     通过 SSE 推送以下事件：
     - token: 流式文本片段
     - sql: Agent 执行的 SQL 语句
-    - thinking: 思考过程（累积）
+    - thinking: 思考过程（full 全量 / delta 增量，由 body.thinking_mode 决定）
     - chart: 图表配置（含 ECharts option 和表格数据）
     - done: 流结束标记
     - error: 错误信息
@@ -196,7 +432,9 @@ async def chat_stream(session_id: str, body: ChatRequest):
         raise HTTPException(status_code=404, detail="会话不存在")
 
     return StreamingResponse(
-        _stream_agent_response(session_id, body.message, body.connection_id),
+        _stream_agent_response(
+            session_id, body.message, body.connection_id, body.thinking_mode
+        ),
         media_type="text/event-stream",
         headers={
             "Cache-Control": "no-cache",
@@ -204,3 +442,21 @@ async def chat_stream(session_id: str, body: ChatRequest):
             "X-Accel-Buffering": "no",
         },
     )
+
+
+@router.get("/memory/stats")
+async def memory_stats():
+    """对话记忆统计（后端、线程数、压缩与清理次数）"""
+    return await asyncio.to_thread(checkpoint_service.get_stats)
+
+
+@router.get("/context/stats")
+async def context_stats():
+    """上下文预算统计（模型调用次数、裁剪次数、节省的估算 prompt token）"""
+    return context_budget.get_stats()
+
+
+@router.get("/cache/stats")
+async def question_cache_stats():
+    """问题 → SQL 缓存的命中率等统计"""
+    return question_cache.get_stats()
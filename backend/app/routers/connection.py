@@ -6,6 +6,8 @@ MySQL 连接管理 API
 - DELETE /api/connections/{id}      删除连接
 - POST   /api/connections/test      测试连接（不保存）
 - POST   /api/connections/{id}/test 测试已保存的连接
+
+连接测试与连接池释放（更新 / 删除）在数据库访问线程池中执行，不阻塞事件循环
 """
 
 from fastapi import APIRouter, HTTPException
@@ -57,7 +59,7 @@ async def update_connection(conn_id: str, body: MySQLConnectionUpdate):
     """
     更新指定连接配置（支持部分更新）
     """
-    config = connection_service.update_connection(conn_id, body)
+    config = await connection_service.run_db(connection_service.update_connection, conn_id, body)
     if config is None:
         raise HTTPException(status_code=404, detail=f"连接 '{conn_id}' 不存在")
     return config
@@ -68,7 +70,7 @@ async def delete_connection(conn_id: str):
     """
     删除指定连接配置
     """
-    success = connection_service.delete_connection(conn_id)
+    success = await connection_service.run_db(connection_service.delete_connection, conn_id)
     if not success:
         raise HTTPException(status_code=404, detail=f"连接 '{conn_id}' 不存在")
     return None
@@ -80,7 +82,7 @@ async def test_connection(body: ConnectionTestRequest):
     测试 MySQL 连接（不保存，传入完整配置）
     用于新增连接前预先验证连通性
     """
-    result = connection_service.test_connection_by_config(body)
+    result = await connection_service.run_db(connection_service.test_connection_by_config, body)
     return result
 
 
@@ -90,7 +92,7 @@ async def test_saved_connection(conn_id: str):
     测试已保存的 MySQL 连接
     用于校验现有连接是否仍然可用
     """
-    result = connection_service.test_connection_by_id(conn_id)
+    result = await connection_service.run_db(connection_service.test_connection_by_id, conn_id)
     if result is None:
         raise HTTPException(status_code=404, detail=f"连接 '{conn_id}' 不存在")
     return result
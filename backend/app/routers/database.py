@@ -1,7 +1,12 @@
 """
 数据库工具 API（MySQL 版本 - Phase2）
-- GET  /api/database/schema?connection_id=xxx  — 获取指定连接的所有表结构
-- POST /api/database/query                     — 在指定连接上执行 SQL 查询（仅 SELECT，带分页）
+- GET  /api/database/schema?connection_id=xxx  — 获取指定连接的所有表结构（带缓存）
+- POST /api/database/schema/refresh?connection_id=xxx — 强制重新读取表结构
+- POST /api/database/query                     — 在指定连接上执行 SQL 查询（仅 SELECT，按页码或续页令牌分页）
+- POST /api/database/export                    — 流式导出完整查询结果（CSV / NDJSON / Arrow）
+
+阻塞的驱动调用均经 connection_service.run_db 在数据库访问线程池中执行，不阻塞事件循环；
+导出流由 StreamingResponse 在线程池中迭代
 """
 
 import math
@@ -9,13 +14,18 @@ import re
 import time
 
 import pymysql
-from fastapi import APIRouter, HTTPException, Query
+from typing import Optional
+
+from fastapi import APIRouter, HTTPException, Query, Request
+from fastapi.responses import StreamingResponse
+from sqlalchemy.exc import SQLAlchemyError
 
-from app.services import connection_service
+from app.config import get_settings
+from app.services import connection_service, export_service, query_service, schema_service
+from app.services.query_guard import QueryCancelledError, QueryGuard, run_until_disconnected
 from app.models.schemas import (
-    ColumnInfo,
-    TableSchema,
     SchemaResponse,
+    SqlExportRequest,
     SqlQueryRequest,
     SqlQueryResponse,
 )
@@ -29,115 +39,242 @@ _FORBIDDEN_KEYWORDS = re.compile(
 )
 
 
-def _get_mysql_connection_by_id(connection_id: str) -> pymysql.Connection:
+def _get_mysql_connection_by_id(connection_id: str, guard: Optional[QueryGuard] = None):
     """
-    根据 connection_id 获取原生 pymysql 连接
+    根据 connection_id 从连接池获取原生 pymysql 连接
+
+    返回的是池化连接代理，close() 时归还连接池而非断开；
+    连接池与 Agent 使用的 SQLDatabase 共用（见 connection_service.get_engine）。
+    传入 guard 时登记连接，客户端断开后可 KILL 其上的查询，须用 _release_connection 归还
     """
-    config = connection_service.get_connection(connection_id)
-    if config is None:
+    engine = connection_service.get_engine(connection_id)
+    if engine is None:
         raise HTTPException(status_code=404, detail=f"连接 '{connection_id}' 不存在")
 
     try:
-        return pymysql.connect(
-            host=config.host,
-            port=config.port,
-            user=config.user,
-            password=config.password,
-            database=config.database,
-            charset="utf8mb4",
-            connect_timeout=10,
-        )
-    except pymysql.Error as e:
+        conn = engine.raw_connection()
+    except (pymysql.Error, SQLAlchemyError) as e:
         raise HTTPException(status_code=503, detail=f"无法连接到数据库: {str(e)}")
 
+    if guard is not None:
+        try:
+            guard.attach(conn)
+        except QueryCancelledError:
+            conn.close()
+            raise HTTPException(status_code=499, detail="客户端已断开，查询已取消")
+    return conn
+
+
+def _release_connection(conn, guard: Optional[QueryGuard] = None) -> None:
+    """注销 guard 登记后归还连接"""
+    if guard is not None:
+        guard.detach()
+    conn.close()
+
+
+def _validate_select(sql: str) -> str:
+    """安全校验：仅允许 SELECT，返回去除首尾空白的语句"""
+    sql = sql.strip()
+    if not sql.upper().startswith("SELECT"):
+        raise HTTPException(status_code=400, detail="仅允许 SELECT 查询语句")
+
+    if _FORBIDDEN_KEYWORDS.match(sql):
+        raise HTTPException(status_code=400, detail="不允许执行写操作语句")
+    return sql
+
 
 @router.get("/schema", response_model=SchemaResponse)
 async def get_schema(connection_id: str = Query(..., description="MySQL 连接 ID")):
     """
-    获取指定连接的数据库所有表结构信息（表名 + 列定义）
+    获取指定连接的数据库所有表结构信息（表名 + 列定义 + 注释 + 外键）
+    结果来自 schema 缓存，TTL 到期后按指纹校验是否需要重新读取
     """
-    conn = _get_mysql_connection_by_id(connection_id)
+    return await connection_service.run_db(_load_schema, connection_id, False)
+
+
+@router.post("/schema/refresh", response_model=SchemaResponse)
+async def refresh_schema(connection_id: str = Query(..., description="MySQL 连接 ID")):
+    """
+    强制重新读取指定连接的表结构（同时刷新 Agent 使用的缓存）
+    """
+    return await connection_service.run_db(_load_schema, connection_id, True)
+
+
+def _load_schema(connection_id: str, refresh: bool) -> SchemaResponse:
+    """从 schema 缓存读取并转换为响应"""
     try:
-        cursor = conn.cursor()
-
-        # 获取所有用户表
-        cursor.execute("SHOW TABLES")
-        table_names = [row[0] for row in cursor.fetchall()]
-
-        tables: list[TableSchema] = []
-        for table_name in table_names:
-            cursor.execute(f"SHOW FULL COLUMNS FROM `{table_name}`")
-            columns: list[ColumnInfo] = []
-            for col_row in cursor.fetchall():
-                # SHOW FULL COLUMNS 返回:
-                # (Field, Type, Collation, Null, Key, Default, Extra, Privileges, Comment)
-                columns.append(ColumnInfo(
-                    name=col_row[0],
-                    type=col_row[1] or "VARCHAR(255)",
-                    primary_key=(col_row[4] == "PRI"),
-                    nullable=(col_row[3] == "YES"),
-                ))
-            tables.append(TableSchema(name=table_name, columns=columns))
-
-        return SchemaResponse(tables=tables)
-    finally:
-        conn.close()
+        snapshot = schema_service.get_schema(connection_id, refresh=refresh)
+    except (pymysql.Error, SQLAlchemyError) as e:
+        raise HTTPException(status_code=503, detail=f"读取表结构失败: {str(e)}")
+    if snapshot is None:
+        raise HTTPException(status_code=404, detail=f"连接 '{connection_id}' 不存在")
+    return SchemaResponse(tables=snapshot.tables, version=snapshot.version)
 
 
 @router.post("/query", response_model=SqlQueryResponse)
-async def execute_query(body: SqlQueryRequest):
+async def execute_query(body: SqlQueryRequest, request: Request):
     """
     在指定连接上执行用户 SQL 查询（仅允许 SELECT），返回分页结果。
+
+    首次查询只执行一次并缓存为结果句柄，翻页时携带 query_handle 直接从缓存读取；
+    仅当结果超过缓存上限时才计算总行数（精确或估算）或回退为 LIMIT/OFFSET。
+    单条查询受连接的 query_timeout 限制；客户端断开时对执行中的查询发送 KILL QUERY。
     """
-    sql = body.sql.strip()
+    sql = _validate_select(body.sql)
 
-    # 安全校验：仅允许 SELECT
-    if not sql.upper().startswith("SELECT"):
-        raise HTTPException(status_code=400, detail="仅允许 SELECT 查询语句")
+    guard = QueryGuard(body.connection_id)
+    handler = _execute_keyset_query if body.pagination == "keyset" else _execute_offset_query
+    return await run_until_disconnected(request, guard, handler, body, sql, guard)
 
-    if _FORBIDDEN_KEYWORDS.match(sql):
-        raise HTTPException(status_code=400, detail="不允许执行写操作语句")
 
-    conn = _get_mysql_connection_by_id(body.connection_id)
+def _execute_offset_query(body: SqlQueryRequest, sql: str, guard: QueryGuard) -> SqlQueryResponse:
+    """
+    按页码分页（在数据库访问线程池中执行）
+    """
+    start_time = time.time()
+    entry = None
+    if body.query_handle:
+        entry = query_service.get_handle(body.query_handle, body.connection_id, sql)
+
+    conn = None
     try:
-        cursor = conn.cursor()
-        start_time = time.time()
+        # 1. 句柄失效或首次查询：执行一次并物化结果
+        if entry is None:
+            conn = _get_mysql_connection_by_id(body.connection_id, guard)
+            try:
+                entry = query_service.open_result(conn, body.connection_id, sql)
+            except pymysql.Error as e:
+                raise HTTPException(status_code=400, detail=f"SQL 执行错误: {str(e)}")
 
-        # 1. 获取总行数
-        count_sql = f"SELECT COUNT(*) FROM ({sql}) AS _count_subquery"
-        try:
-            cursor.execute(count_sql)
-            total_count = cursor.fetchone()[0]
-        except pymysql.Error as e:
-            raise HTTPException(status_code=400, detail=f"SQL 执行错误: {str(e)}")
+        # 2. 结果超过缓存上限时才需要访问数据库计算总行数 / 读取缓存外的页
+        if not entry.complete:
+            if conn is None:
+                conn = _get_mysql_connection_by_id(body.connection_id, guard)
+            try:
+                query_service.ensure_count(conn, entry, body.count_mode)
+            except pymysql.Error as e:
+                raise HTTPException(status_code=400, detail=f"SQL 执行错误: {str(e)}")
 
-        # 2. 计算分页
+        total_count = entry.total_count
         total_pages = max(1, math.ceil(total_count / body.page_size))
-        offset = (body.page - 1) * body.page_size
 
         # 3. 获取分页数据
-        paged_sql = f"SELECT * FROM ({sql}) AS _paged_subquery LIMIT {body.page_size} OFFSET {offset}"
         try:
-            cursor.execute(paged_sql)
-            rows_raw = cursor.fetchall()
-            # 获取列名
-            columns = [desc[0] for desc in cursor.description] if cursor.description else []
+            rows = query_service.get_page(entry, body.page, body.page_size, conn)
         except pymysql.Error as e:
             raise HTTPException(status_code=400, detail=f"SQL 执行错误: {str(e)}")
 
         elapsed_ms = int((time.time() - start_time) * 1000)
 
-        # 转换行数据为可序列化列表
-        rows = [list(row) for row in rows_raw]
-
         return SqlQueryResponse(
-            columns=columns,
+            columns=entry.columns,
             rows=rows,
             total_count=total_count,
             page=body.page,
             page_size=body.page_size,
             total_pages=total_pages,
             elapsed_ms=elapsed_ms,
+            query_handle=entry.handle,
+            count_estimated=entry.count_estimated,
         )
     finally:
+        if conn is not None:
+            _release_connection(conn, guard)
+
+
+def _execute_keyset_query(body: SqlQueryRequest, sql: str, guard: QueryGuard) -> SqlQueryResponse:
+    """
+    键集分页：按排序键从上一页末行之后读取，不计算总行数（在数据库访问线程池中执行）
+    """
+    start_time = time.time()
+    after = None
+    try:
+        if body.cursor:
+            key_columns, after = query_service.decode_cursor(body.cursor, sql)
+        else:
+            key_columns = body.key_columns or query_service.infer_key_columns(body.connection_id, sql)
+    except (pymysql.Error, SQLAlchemyError) as e:
+        raise HTTPException(status_code=503, detail=f"读取表结构失败: {str(e)}")
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if not key_columns:
+        raise HTTPException(status_code=400, detail="无法推断排序键，请通过 key_columns 指定唯一的排序列")
+
+    conn = _get_mysql_connection_by_id(body.connection_id, guard)
+    try:
+        page = query_service.fetch_keyset_page(
+            conn, body.connection_id, sql, key_columns, body.page_size, after
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except pymysql.Error as e:
+        raise HTTPException(status_code=400, detail=f"SQL 执行错误: {str(e)}")
+    finally:
+        _release_connection(conn, guard)
+
+    return SqlQueryResponse(
+        columns=page.columns,
+        rows=page.rows,
+        total_count=None,
+        page=body.page,
+        page_size=body.page_size,
+        total_pages=0,
+        elapsed_ms=int((time.time() - start_time) * 1000),
+        next_cursor=page.next_cursor,
+        key_columns=page.key_columns,
+        keyset_pushdown=page.pushdown,
+    )
+
+
+def _open_export_cursor(connection_id: str, sql: str, guard: QueryGuard):
+    """
+    新建直连连接并以无缓冲游标发送查询，返回 (连接, 游标)
+
+    导出不经连接池、不受工作台 query_timeout 限制（长时间流式读取），服务端执行时间上限为 EXPORT_TIMEOUT；
+    连接登记到 guard，客户端断开时 KILL QUERY，连接随生成器关闭
+    """
+    try:
+        conn = connection_service.open_direct_connection(connection_id, get_settings().EXPORT_TIMEOUT)
+    except pymysql.Error as e:
+        raise HTTPException(status_code=503, detail=f"无法连接到数据库: {str(e)}")
+    if conn is None:
+        raise HTTPException(status_code=404, detail=f"连接 '{connection_id}' 不存在")
+    try:
+        guard.attach(conn)
+        cursor = export_service.open_cursor(conn, sql)
+    except pymysql.Error as e:
+        conn.close()
+        raise HTTPException(status_code=400, detail=f"SQL 执行错误: {str(e)}")
+    except QueryCancelledError:
+        conn.close()
+        raise HTTPException(status_code=499, detail="客户端已断开，查询已取消")
+    if guard.cancelled:
+        # 发送查询期间客户端已断开，结果无人接收
         conn.close()
+        raise HTTPException(status_code=499, detail="客户端已断开，查询已取消")
+    return conn, cursor
+
+
+@router.post("/export")
+async def export_query(body: SqlExportRequest, request: Request):
+    """
+    流式导出完整查询结果（仅允许 SELECT）
+
+    使用无缓冲服务端游标逐批读取，边读边写出，不受分页条数限制且内存占用恒定。
+    SQL 错误在开始传输前返回 400；客户端断开时对执行中的查询发送 KILL QUERY。
+    """
+    sql = _validate_select(body.sql)
+    try:
+        export_service.check_format(body.format)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    guard = QueryGuard(body.connection_id)
+    conn, cursor = await run_until_disconnected(request, guard, _open_export_cursor, body.connection_id, sql, guard)
+
+    filename = f"export_{time.strftime('%Y%m%d_%H%M%S')}.{export_service.FILE_EXTENSIONS[body.format]}"
+    return StreamingResponse(
+        export_service.stream_rows(conn, cursor, body.format, guard),
+        media_type=export_service.MEDIA_TYPES[body.format],
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
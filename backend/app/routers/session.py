@@ -2,6 +2,8 @@
 会话管理 CRUD REST API
 """
 
+import asyncio
+
 from fastapi import APIRouter, HTTPException
 from app.models.schemas import (
     SessionCreate,
@@ -69,8 +71,8 @@ async def update_session(session_id: str, body: SessionUpdate):
 
 @router.delete("/{session_id}", status_code=204)
 async def delete_session(session_id: str):
-    """删除会话"""
-    success = session_service.delete_session(session_id)
+    """删除会话（同时删除对话记忆，在线程中执行，不阻塞事件循环）"""
+    success = await asyncio.to_thread(session_service.delete_session, session_id)
     if not success:
         raise HTTPException(status_code=404, detail="会话不存在")
     return None
@@ -1,21 +1,58 @@
 """
 SQL Agent 服务层（MySQL 版本 - Phase2）
-基于 LangChain create_agent + SQLDatabaseToolkit + InMemorySaver
-按 connection_id 管理独立的 Agent 实例和 Checkpointer
+基于 LangChain create_agent + SQLDatabaseToolkit（sql_db_query 为结构化版本）+ Checkpointer
+按 connection_id 管理独立的 Agent 实例（存放在 connection_service 的连接资源中，随连接池一起 LRU 淘汰 /
+空闲释放 / 配置变更失效）；对话记忆由 checkpoint_service 的共用 Checkpointer 持久化，每轮结束后压缩
+每次调用模型前由 context_budget 中间件按 token 预算裁剪历史（折叠较早轮次的工具输出）
+AGENT_SCHEMA_MODE=inject 时 schema 摘要直接写入 system prompt，表结构探查工具仅作兜底；
+表多时（或 retrieve）按问题检索相关表，仅注入并开放这些表
+Agent 运行脱离事件循环：有界线程池驱动同步 stream，或原生 astream，均受进程级并发上限约束
+问题 → SQL 缓存命中时重放 SQL（重新执行取最新数据），最多一次 LLM 调用生成回答
 """
 
-from typing import Any
+import asyncio
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Any, AsyncIterator, Optional
 
 from langchain.agents import create_agent
-from langchain_community.agent_toolkits import SQLDatabaseToolkit
-from langgraph.checkpoint.memory import InMemorySaver
+from langchain.agents.middleware import ModelRequest, dynamic_prompt
+from langchain_core.messages import AIMessage, AnyMessage, HumanMessage, RemoveMessage, SystemMessage, ToolMessage
+from langgraph.checkpoint.base import BaseCheckpointSaver
+from langgraph.config import get_config
+from langgraph.graph.message import REMOVE_ALL_MESSAGES
+from sqlalchemy.exc import SQLAlchemyError
 
+from app.config import get_settings
 from app.services.llm_service import get_llm
-from app.services import connection_service
+from app.services import checkpoint_service, connection_service, question_cache, schema_retrieval, schema_service
+from app.services.checkpoint_service import SUMMARY_MESSAGE_NAME
+from app.services.context_budget import ContextBudgetMiddleware
+from app.services.query_guard import QueryCancelledError, QueryGuard
+from app.services.question_cache import CachedQuestion
+from app.services.resource_registry import INVALIDATED
+from app.services.sql_tools import (
+    QueryResult,
+    QueryResultSinkMiddleware,
+    execute_structured,
+    get_sql_tools,
+    publish_query_result,
+    query_result_meta,
+    render_query_content,
+)
 
-# 按 connection_id 缓存 Agent 和 Checkpointer
-_agents: dict[str, Any] = {}
-_checkpointers: dict[str, InMemorySaver] = {}
+# Agent 运行线程池与并发信号量（懒加载，按 AGENT_MAX_CONCURRENCY 限流）
+_executor: ThreadPoolExecutor | None = None
+# Agent 构建线程池（与运行线程池分开，冷启动构建不排在长时间运行之后）
+_build_executor: ThreadPoolExecutor | None = None
+_run_semaphore: asyncio.Semaphore | None = None
+
+# 线程 -> 事件循环队列的消息类型
+_EVENT = "event"
+_ERROR = "error"
+_END = "end"
 
 SYSTEM_PROMPT = """你是一个专业的 SQL 数据库查询助手，负责帮助用户通过自然语言查询数据库。
 
@@ -34,6 +71,39 @@ SYSTEM_PROMPT = """你是一个专业的 SQL 数据库查询助手，负责帮
 - 如果查询出错，分析错误原因并重写查询重试
 - 不确定时，先查表结构再生成查询"""
 
+SCHEMA_PROMPT = """你是一个专业的 SQL 数据库查询助手，负责帮助用户通过自然语言查询数据库。
+
+{schema_title}（格式：表名(列名 类型 [PK] [→引用表.引用列] ['列注释'], ...)  -- 表注释）：
+{schema}
+
+规则：
+1. 直接根据上面的表结构生成正确的 MySQL SQL 查询，无需调用 sql_db_list_tables
+2. 仅当需要查看示例数据、确认列的取值格式时，才使用 sql_db_schema
+3. 较复杂的查询可使用 sql_db_query_checker 校验 SQL 语法
+4. 使用 sql_db_query 执行查询
+5. 用中文总结查询结果，回答要清晰、有条理
+6. 在回答末尾附上执行的 SQL 语句（用 ```sql 代码块包裹）
+
+限制：
+- 查询最多返回 {top_k} 条结果
+- 绝对不允许执行 INSERT、UPDATE、DELETE、DROP 等修改操作
+- 如果查询出错，分析错误原因并重写查询重试"""
+
+REPLAY_PROMPT = """你是一个专业的 SQL 数据库查询助手。下面给出用户问题、已执行的 MySQL 查询及其结果。
+
+规则：
+1. 用中文总结查询结果回答用户问题，回答要清晰、有条理
+2. 只依据给出的查询结果作答，不要编造数据
+3. 在回答末尾附上执行的 SQL 语句（用 ```sql 代码块包裹）"""
+
+SUMMARY_PROMPT = """请将下面的数据查询对话压缩为一段简短的中文摘要，供后续追问参考。
+保留：用户关心的数据对象、筛选条件与时间范围、涉及的表与关键 SQL、得出的主要结论数字。
+不要编造内容，不超过 300 字。"""
+
+# 重放回答中展示给 LLM / 模板表格的最大行数
+REPLAY_PROMPT_ROWS = 50
+REPLAY_TEMPLATE_ROWS = 10
+
 
 def get_agent(connection_id: str):
     """
@@ -48,62 +118,503 @@ def get_agent(connection_id: str):
     Raises:
         ValueError: 连接 ID 不存在或无法连接
     """
-    if connection_id in _agents:
-        return _agents[connection_id]
+    mode, digest = _resolve_schema_mode(connection_id)
+    # prompt 方式与 schema 版本变化后重建 Agent（保留 Checkpointer）
+    prompt_key = (mode, digest[1] if digest is not None else None)
+    resources = connection_service.get_resources(connection_id)
+    if resources is not None and resources.agent is not None and resources.agent_key == prompt_key:
+        return resources.agent
 
     # 获取 SQLDatabase 实例
     db = connection_service.get_sql_database(connection_id)
-    if db is None:
+    if resources is None or db is None:
         raise ValueError(f"连接 '{connection_id}' 不存在或无法获取数据库实例")
 
-    llm = get_llm()
+    # 开启流式后，stream_mode 含 "messages" 时可逐 token 获取最终回答
+    llm = get_llm(streaming=get_settings().AGENT_STREAM_TOKENS)
 
-    # 创建工具集
-    toolkit = SQLDatabaseToolkit(db=db, llm=llm)
-    tools = toolkit.get_tools()
+    # 创建工具集（sql_db_query 通过 artifact 附带结构化结果，表结构类工具读取 schema 缓存）
+    tools = get_sql_tools(db, llm, connection_id)
 
-    # 创建 checkpointer（用于多轮对话记忆）
-    checkpointer = InMemorySaver()
+    # 共用 checkpointer（多轮对话记忆）；Agent 重建时沿用原有对话
+    checkpointer = checkpoint_service.get_checkpointer()
 
-    # 构建 system prompt
-    prompt = SYSTEM_PROMPT.format(top_k=10)
+    # 构建 system prompt：inject 注入完整摘要；retrieve 每次调用模型时按相关表动态生成
+    middleware = []
+    prompt = None
+    if mode == "inject":
+        prompt = SCHEMA_PROMPT.format(schema_title="数据库表结构如下", schema=digest[0], top_k=10)
+    elif mode == "retrieve":
+        middleware.append(_retrieval_prompt(connection_id))
+    else:
+        prompt = SYSTEM_PROMPT.format(top_k=10)
+    # 查询结果行数据不写入对话状态，交给本次运行的 configurable.query_results
+    middleware.append(QueryResultSinkMiddleware())
+    # 调用模型前按上下文预算裁剪历史消息（需在动态 prompt 之后，才能计入 system prompt）
+    middleware.append(ContextBudgetMiddleware())
 
     # 创建 Agent
     agent = create_agent(
         llm,
         tools,
         system_prompt=prompt,
+        middleware=middleware,
         checkpointer=checkpointer,
     )
 
-    _agents[connection_id] = agent
-    _checkpointers[connection_id] = checkpointer
+    resources.agent = agent
+    resources.agent_key = prompt_key
 
     return agent
 
 
-def get_checkpointer(connection_id: str) -> InMemorySaver:
+def _resolve_schema_mode(connection_id: str) -> tuple[str, Optional[tuple[str, int]]]:
+    """
+    确定 Agent 获取表结构的方式
+
+    - inject：摘要不超过 SCHEMA_DIGEST_MAX_CHARS 时整体注入，超过时改用 retrieve
+    - retrieve：每个问题检索相关表，仅注入并开放这些表
+    - discover：原始的工具探查流程（schema 读取失败时也退回此方式）
+
+    Returns:
+        (方式, inject 时的 (摘要, 版本))
+    """
+    mode = get_settings().AGENT_SCHEMA_MODE
+    if mode not in ("inject", "retrieve"):
+        return "discover", None
+    try:
+        digest = schema_service.get_digest(connection_id)
+    except Exception:
+        return "discover", None
+    if digest is None:
+        return "discover", None
+    if mode == "inject" and len(digest[0]) <= get_settings().SCHEMA_DIGEST_MAX_CHARS:
+        return "inject", digest
+    return "retrieve", None
+
+
+def _retrieval_prompt(connection_id: str):
+    """
+    retrieve 方式的动态 system prompt：读取本次运行 config 中的 relevant_tables，
+    只注入这些表的摘要；未检索到相关表时使用探查 prompt
+    """
+    @dynamic_prompt
+    def _prompt(request: ModelRequest) -> str:
+        tables = (get_config().get("configurable") or {}).get("relevant_tables")
+        if not tables:
+            return SYSTEM_PROMPT.format(top_k=10)
+        return SCHEMA_PROMPT.format(
+            schema_title="与问题相关的表（检索自全部表，sql_db_schema 仅开放这些表）结构如下",
+            schema=schema_service.get_table_digest(connection_id, tables),
+            top_k=10,
+        )
+
+    return _prompt
+
+
+def select_relevant_tables(connection_id: str, question: str) -> Optional[list[str]]:
+    """
+    为问题检索相关表（阻塞调用，仅 retrieve 方式生效）
+
+    Args:
+        connection_id: 连接 ID
+        question: 检索文本（当前问题，可拼接近几轮问题）
+
+    Returns:
+        相关表名列表；非 retrieve 方式或未检索到任何表时返回 None（不做限制）
+    """
+    mode, _ = _resolve_schema_mode(connection_id)
+    if mode != "retrieve":
+        return None
+    tables = schema_retrieval.select_tables(
+        connection_id, question, get_settings().SCHEMA_RETRIEVAL_TOP_K
+    )
+    return tables or None
+
+
+def get_checkpointer(connection_id: str) -> BaseCheckpointSaver:
     """
-    获取指定连接的 checkpointer 实例
+    获取指定连接使用的 checkpointer 实例（所有连接共用，按线程 ID 区分）
 
     Args:
         connection_id: MySQL 连接 ID
     """
-    if connection_id not in _checkpointers:
-        get_agent(connection_id)  # 确保初始化
-    return _checkpointers[connection_id]
+    return checkpoint_service.get_checkpointer()
 
 
 def clear_agent_cache(connection_id: str = None) -> None:
     """
-    清除 Agent 缓存（连接配置变更时应调用）
+    清除 Agent 缓存（包括对话记忆）
 
     Args:
         connection_id: 指定连接 ID，为 None 时清除所有缓存
     """
-    if connection_id:
-        _agents.pop(connection_id, None)
-        _checkpointers.pop(connection_id, None)
+    targets = [connection_id] if connection_id else [c.id for c in connection_service.list_connections()]
+    for cid in targets:
+        resources = connection_service.peek_resources(cid)
+        if resources is not None:
+            resources.agent = None
+            resources.agent_key = None
+    checkpoint_service.delete_threads(connection_id=connection_id)
+
+
+def _on_connection_evicted(connection_id: str, reason: str) -> None:
+    """
+    连接资源释放时的清理：Agent 已随资源一起释放；配置变更 / 删除时丢弃该连接的问题缓存，
+    连接已删除时一并丢弃对话记忆
+    """
+    if reason != INVALIDATED:
+        return
+    question_cache.invalidate(connection_id)
+    if connection_service.get_connection(connection_id) is None:
+        checkpoint_service.delete_threads(connection_id=connection_id)
+
+
+connection_service.add_eviction_listener(_on_connection_evicted)
+
+
+# ==================== 对话记忆压缩 ====================
+
+def _turn_starts(messages: list[AnyMessage]) -> list[int]:
+    """每轮对话（用户消息）的起始下标，已有的摘要消息不计为一轮"""
+    return [
+        i for i, m in enumerate(messages)
+        if isinstance(m, HumanMessage) and m.name != SUMMARY_MESSAGE_NAME
+    ]
+
+
+def _summarize(messages: list[AnyMessage]) -> str:
+    """用一次 LLM 调用把被裁掉的轮次（含已有摘要）压缩为摘要文本；工具调用过程只保留 SQL"""
+    lines = []
+    for m in messages:
+        if isinstance(m, HumanMessage):
+            prefix = "此前摘要" if m.name == SUMMARY_MESSAGE_NAME else "用户"
+            lines.append(f"{prefix}：{m.content}")
+        elif isinstance(m, AIMessage):
+            for tc in m.tool_calls or []:
+                if tc.get("name") == "sql_db_query":
+                    lines.append(f"执行 SQL：{tc['args'].get('query', '')}")
+            if m.content and not m.tool_calls:
+                lines.append(f"助手：{m.content}")
+    response = get_llm(priority="background").invoke([
+        SystemMessage(content=SUMMARY_PROMPT),
+        HumanMessage(content="\n".join(lines)),
+    ])
+    return response.content if isinstance(response.content, str) else str(response.content)
+
+
+def compact_conversation(agent, config: dict) -> int:
+    """
+    压缩一个对话的记忆（阻塞调用，应在对话结束后于线程中执行）
+
+    - 消息超过 CHECKPOINT_MAX_TURNS 轮时，裁掉较早的轮次（summarize 模式下先用 LLM 生成摘要，
+      以一条摘要消息放在保留的消息之前）；按轮次边界裁剪，不会拆开工具调用与其结果
+    - 只保留线程最新的 checkpoint
+
+    Args:
+        agent: get_agent 返回的 CompiledStateGraph
+        config: 运行配置（需含 thread_id）
+
+    Returns:
+        裁掉的消息数
+    """
+    settings = get_settings()
+    thread_config = {"configurable": {"thread_id": config["configurable"]["thread_id"]}}
+    messages = agent.get_state(thread_config).values.get("messages", [])
+    starts = _turn_starts(messages)
+    dropped = 0
+    max_turns = max(1, settings.CHECKPOINT_MAX_TURNS)
+    if len(starts) > max_turns:
+        cut = starts[-max_turns]
+        kept: list[AnyMessage] = messages[cut:]
+        if settings.CHECKPOINT_COMPACT_MODE == "summarize":
+            summary = _summarize(messages[:cut])
+            kept = [HumanMessage(content=f"（此前对话摘要）{summary}", name=SUMMARY_MESSAGE_NAME)] + kept
+        agent.update_state(
+            thread_config,
+            {"messages": [RemoveMessage(id=REMOVE_ALL_MESSAGES), *kept]},
+            as_node="model",
+        )
+        dropped = cut
+    checkpoint_service.compact(thread_config["configurable"]["thread_id"])
+    return dropped
+
+
+# ==================== 非阻塞执行 ====================
+
+def _get_executor() -> ThreadPoolExecutor:
+    """获取 Agent 运行线程池（大小与并发上限一致）"""
+    global _executor
+    if _executor is None:
+        settings = get_settings()
+        _executor = ThreadPoolExecutor(
+            max_workers=max(1, settings.AGENT_MAX_CONCURRENCY),
+            thread_name_prefix="agent-run",
+        )
+    return _executor
+
+
+def _get_build_executor() -> ThreadPoolExecutor:
+    """获取 Agent 构建线程池（大小为 AGENT_BUILD_WORKERS）"""
+    global _build_executor
+    if _build_executor is None:
+        _build_executor = ThreadPoolExecutor(
+            max_workers=max(1, get_settings().AGENT_BUILD_WORKERS),
+            thread_name_prefix="agent-build",
+        )
+    return _build_executor
+
+
+def _get_run_semaphore() -> asyncio.Semaphore:
+    """获取进程级 Agent 并发信号量"""
+    global _run_semaphore
+    if _run_semaphore is None:
+        settings = get_settings()
+        _run_semaphore = asyncio.Semaphore(max(1, settings.AGENT_MAX_CONCURRENCY))
+    return _run_semaphore
+
+
+async def aget_agent(connection_id: str):
+    """
+    在构建线程池中获取 Agent（首次构建需连接数据库并反射表结构，不能阻塞事件循环；
+    与运行线程池分开，不会排在正在执行的 Agent 之后）
+
+    注入 schema 模式下每次都需校验 schema 版本（可能触发指纹查询），因此始终在线程池中执行
+
+    Args:
+        connection_id: MySQL 连接 ID
+    """
+    if get_settings().AGENT_SCHEMA_MODE == "discover":
+        resources = connection_service.peek_resources(connection_id)
+        if resources is not None and resources.agent is not None:
+            return resources.agent
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_get_build_executor(), get_agent, connection_id)
+
+
+async def astream_agent(
+    agent,
+    agent_input: dict,
+    config: dict,
+    stream_mode: Any = "updates",
+) -> AsyncIterator[Any]:
+    """
+    以不阻塞事件循环的方式执行 Agent 并逐个产出 stream 事件
+
+    执行模式由 AGENT_EXECUTION_MODE 决定：
+    - thread: 在有界线程池中迭代同步 agent.stream，事件经 asyncio.Queue 回传
+    - async:  直接迭代原生 agent.astream
+
+    两种模式都受 AGENT_MAX_CONCURRENCY 约束，超出上限的请求在信号量上排队，
+    不占用工作线程。调用方提前退出（如客户端断开）时，后台线程在下一个事件处停止；
+    thread 模式的并发名额在后台线程结束后才归还（当前步骤的 LLM 调用 / SQL 仍在执行时不计为空闲）。
+
+    Args:
+        agent: get_agent 返回的 CompiledStateGraph
+        agent_input: Agent 输入，如 {"messages": [...]}
+        config: 运行配置，如 {"configurable": {"thread_id": ...}}
+        stream_mode: 透传给 stream/astream 的 stream_mode
+
+    Yields:
+        与 agent.stream 相同的事件对象
+    """
+    semaphore = _get_run_semaphore()
+    if get_settings().AGENT_EXECUTION_MODE == "async":
+        async with semaphore:
+            async for event in agent.astream(agent_input, config=config, stream_mode=stream_mode):
+                yield event
+        return
+
+    loop = asyncio.get_running_loop()
+    queue: asyncio.Queue = asyncio.Queue()
+    stop = threading.Event()
+
+    def _put(kind: str, payload: Any) -> None:
+        try:
+            loop.call_soon_threadsafe(queue.put_nowait, (kind, payload))
+        except RuntimeError:
+            # 事件循环已关闭（进程退出中），丢弃即可
+            stop.set()
+
+    def _produce() -> None:
+        try:
+            for event in agent.stream(agent_input, config=config, stream_mode=stream_mode):
+                if stop.is_set():
+                    break
+                _put(_EVENT, event)
+        except Exception as e:
+            _put(_ERROR, e)
+        finally:
+            _put(_END, None)
+            # 名额由后台线程在执行结束后归还
+            try:
+                loop.call_soon_threadsafe(semaphore.release)
+            except RuntimeError:
+                pass
+
+    await semaphore.acquire()
+    try:
+        loop.run_in_executor(_get_executor(), _produce)
+    except BaseException:
+        semaphore.release()
+        raise
+    try:
+        while True:
+            kind, payload = await queue.get()
+            if kind == _EVENT:
+                yield payload
+            elif kind == _ERROR:
+                raise payload
+            else:
+                break
+    finally:
+        stop.set()
+
+
+# ==================== 问题 → SQL 缓存重放 ====================
+
+@dataclass
+class Replay:
+    """一次缓存命中：缓存条目、重新执行得到的最新结果及其返回给 LLM 的文本"""
+    entry: CachedQuestion
+    result: QueryResult
+    # sql_db_query 工具输出文本（prepare_replay 中生成，astream_replay 不再访问数据库）
+    content: str
+
+
+def prepare_replay(
+    connection_id: str,
+    question: str,
+    guard: Optional[QueryGuard] = None,
+) -> Optional[Replay]:
+    """
+    查找问题缓存并重新执行缓存的 SQL（阻塞调用）
+
+    重新执行失败（表结构变化、权限等）时丢弃该条目并返回 None，由调用方走完整 Agent 流程
+
+    Args:
+        connection_id: 连接 ID
+        question: 用户问题
+        guard: 登记执行中的查询，运行中止时可被 KILL
+    """
+    if not get_settings().QUESTION_CACHE_ENABLED:
+        return None
+    snapshot = schema_service.get_schema(connection_id)
+    db = connection_service.get_sql_database(connection_id)
+    if snapshot is None or db is None:
+        return None
+
+    entry = question_cache.lookup(connection_id, snapshot.fingerprint, question)
+    if entry is None:
+        return None
+    try:
+        result = execute_structured(db, entry.sql, guard=guard)
+    except (SQLAlchemyError, QueryCancelledError):
+        question_cache.discard(entry)
+        return None
+    return Replay(entry=entry, result=result, content=render_query_content(db, result))
+
+
+def remember_question(connection_id: str, question: str, sql: str) -> None:
+    """
+    记录 Agent 成功回答的问题及其 SQL（阻塞调用，schema 指纹取自缓存）
+
+    Args:
+        connection_id: 连接 ID
+        question: 用户问题
+        sql: 最终执行成功的 SQL
+    """
+    if not get_settings().QUESTION_CACHE_ENABLED:
+        return
+    snapshot = schema_service.get_schema(connection_id)
+    if snapshot is not None:
+        question_cache.store(connection_id, snapshot.fingerprint, question, sql)
+
+
+def _template_answer(replay: Replay) -> str:
+    """不调用 LLM 的回答：结果表格 + SQL"""
+    result = replay.result
+    lines = [f"查询结果共 {len(result.rows)}{'+' if result.truncated else ''} 行："]
+    if result.rows:
+        lines.append("")
+        lines.append("| " + " | ".join(result.columns) + " |")
+        lines.append("|" + " --- |" * len(result.columns))
+        for row in result.rows[:REPLAY_TEMPLATE_ROWS]:
+            lines.append("| " + " | ".join("" if v is None else str(v) for v in row) + " |")
+        if len(result.rows) > REPLAY_TEMPLATE_ROWS:
+            lines.append(f"\n（仅展示前 {REPLAY_TEMPLATE_ROWS} 行）")
+    lines.append(f"\n```sql\n{replay.entry.sql}\n```")
+    return "\n".join(lines)
+
+
+async def astream_replay(
+    agent,
+    question: str,
+    replay: Replay,
+    config: dict,
+    stream_mode: Any = "updates",
+) -> AsyncIterator[Any]:
+    """
+    以与 astream_agent 相同的事件形态产出缓存重放过程
+
+    依次产出：model 节点的 sql_db_query 工具调用 → tools 节点的 ToolMessage（最新结果交给 configurable.query_results）
+    → 最终回答（QUESTION_CACHE_ANSWER_MODE=llm 时一次 LLM 调用并逐 token 推送，template 时不调用 LLM）。
+    结束后将这一轮写入 checkpointer，后续追问可引用上下文。
+
+    Args:
+        agent: get_agent 返回的 CompiledStateGraph
+        question: 用户问题
+        replay: prepare_replay 的结果
+        config: 运行配置（需含 thread_id，可含 query_results）
+        stream_mode: "updates" 或 ["messages", "updates"]
+    """
+    modes = stream_mode if isinstance(stream_mode, list) else [stream_mode]
+
+    def _event(mode: str, data: Any) -> Any:
+        return (mode, data) if isinstance(stream_mode, list) else data
+
+    call_id = f"call_replay_{uuid.uuid4().hex[:12]}"
+    call_message = AIMessage(
+        content="",
+        tool_calls=[{"name": "sql_db_query", "args": {"query": replay.entry.sql}, "id": call_id}],
+    )
+    tool_message = ToolMessage(
+        content=replay.content,
+        artifact=query_result_meta(replay.result),
+        name="sql_db_query",
+        tool_call_id=call_id,
+    )
+    publish_query_result(config, call_id, replay.result)
+    yield _event("updates", {"model": {"messages": [call_message]}})
+    yield _event("updates", {"tools": {"messages": [tool_message]}})
+
+    if get_settings().QUESTION_CACHE_ANSWER_MODE == "template":
+        answer = _template_answer(replay)
     else:
-        _agents.clear()
-        _checkpointers.clear()
+        llm = get_llm(streaming=True)
+        prompt = [
+            SystemMessage(content=REPLAY_PROMPT),
+            HumanMessage(content=(
+                f"用户问题：{question}\n\n"
+                f"执行的 SQL：\n{replay.entry.sql}\n\n"
+                f"查询结果：\n{replay.result.to_prompt_text(REPLAY_PROMPT_ROWS)}"
+            )),
+        ]
+        answer = ""
+        async with _get_run_semaphore():
+            async for chunk in llm.astream(prompt):
+                if isinstance(chunk.content, str) and chunk.content:
+                    answer += chunk.content
+                    if "messages" in modes:
+                        yield _event("messages", (chunk, {"langgraph_node": "model"}))
+
+    answer_message = AIMessage(content=answer)
+    yield _event("updates", {"model": {"messages": [answer_message]}})
+
+    # 写入对话记忆（与完整 Agent 运行留下的消息序列一致）
+    await asyncio.to_thread(
+        agent.update_state,
+        config,
+        {"messages": [HumanMessage(content=question), call_message, tool_message, answer_message]},
+        as_node="model",
+    )
@@ -0,0 +1,222 @@
+"""
+规则图表引擎 - 根据查询结果的列类型与基数在本地推断图表类型并生成 ECharts option
+覆盖常见形状（时间趋势 / 类别对比 / 占比分布 / 宽表），无法判定时返回 None 交由 LLM 决策
+"""
+
+import re
+from datetime import date, datetime
+from decimal import Decimal
+from typing import Any, Optional
+
+# 列类型
+TEMPORAL = "temporal"
+NUMERIC = "numeric"
+CATEGORICAL = "categorical"
+
+# 超过该列数视为宽表，直接使用表格
+MAX_CHART_COLUMNS = 4
+# 饼图最多类别数
+MAX_PIE_CATEGORIES = 8
+# 柱状图最多类别数（更多时由 LLM 判断或降级表格）
+MAX_BAR_CATEGORIES = 30
+# 多指标分组柱状图的最大指标数
+MAX_BAR_SERIES = 3
+
+# 问题中出现以下词语时优先饼图
+_SHARE_KEYWORDS = ("占比", "比例", "比重", "份额", "构成", "分布", "百分比")
+
+# 时间字符串：2024、2024-01、2024-01-31、2024/1/31、2024年1月、2024-01-31 12:00:00
+_TEMPORAL_STR = re.compile(
+    r"^\d{4}([-/]\d{1,2}([-/]\d{1,2})?([ T]\d{1,2}:\d{2}(:\d{2})?)?|年(\d{1,2}月(\d{1,2}日)?)?)$"
+)
+# 列名中的时间含义
+_TEMPORAL_NAME = re.compile(r"(date|time|day|month|year|week|日期|时间|月份|年份|季度|月|周)", re.IGNORECASE)
+
+# ECharts 深色主题通用样式
+_TEXT_COLOR = "#c0c0c0"
+_AXIS_STYLE = {
+    "axisLabel": {"color": _TEXT_COLOR},
+    "axisLine": {"lineStyle": {"color": "rgba(192, 192, 192, 0.3)"}},
+    "splitLine": {"lineStyle": {"color": "rgba(192, 192, 192, 0.08)"}},
+}
+
+
+def _is_number(value: Any) -> bool:
+    return isinstance(value, (int, float, Decimal)) and not isinstance(value, bool)
+
+
+def _to_number(value: Any) -> Any:
+    """Decimal 转为 float/int，便于 JSON 序列化"""
+    if isinstance(value, Decimal):
+        return int(value) if value == value.to_integral_value() else float(value)
+    return value
+
+
+def _to_label(value: Any) -> str:
+    """类别/时间轴标签"""
+    if isinstance(value, datetime):
+        return value.strftime("%Y-%m-%d %H:%M:%S") if value.time() != datetime.min.time() else value.strftime("%Y-%m-%d")
+    if isinstance(value, date):
+        return value.isoformat()
+    return "" if value is None else str(value)
+
+
+def _to_cell(value: Any) -> Any:
+    """表格单元格：数值保持数值，其余转字符串"""
+    if value is None:
+        return ""
+    if _is_number(value):
+        return _to_number(value)
+    return _to_label(value)
+
+
+def classify_column(name: str, values: list[Any]) -> str:
+    """
+    推断单列类型
+
+    Args:
+        name: 列名
+        values: 该列所有值
+
+    Returns:
+        temporal / numeric / categorical
+    """
+    present = [v for v in values if v is not None]
+    if not present:
+        return CATEGORICAL
+    if all(isinstance(v, (date, datetime)) for v in present):
+        return TEMPORAL
+    if all(_is_number(v) for v in present):
+        # 形如 2023、2024 的年份列
+        if _TEMPORAL_NAME.search(name) and all(isinstance(v, int) and 1900 <= v <= 2100 for v in present):
+            return TEMPORAL
+        return NUMERIC
+    if all(isinstance(v, str) and _TEMPORAL_STR.match(v.strip()) for v in present):
+        return TEMPORAL
+    return CATEGORICAL
+
+
+def build_table_data(columns: list[str], rows: list[Any]) -> dict[str, Any]:
+    """构建前端表格数据 {columns, rows}"""
+    return {
+        "columns": list(columns),
+        "rows": [[_to_cell(v) for v in row] for row in rows],
+    }
+
+
+def _result(chart_type: str, option: Optional[dict], columns: list[str], rows: list[Any]) -> dict[str, Any]:
+    return {
+        "chart_type": chart_type,
+        "echarts_option": option,
+        "table_data": build_table_data(columns, rows),
+    }
+
+
+def _axis_chart_option(
+    chart_type: str,
+    x_labels: list[str],
+    series: list[tuple[str, list[Any]]],
+) -> dict[str, Any]:
+    """柱状图/折线图 option"""
+    option: dict[str, Any] = {
+        "backgroundColor": "transparent",
+        "textStyle": {"color": _TEXT_COLOR},
+        "tooltip": {"trigger": "axis"},
+        "grid": {"left": "3%", "right": "4%", "bottom": "3%", "containLabel": True},
+        "xAxis": {"type": "category", "data": x_labels, **_AXIS_STYLE},
+        "yAxis": {"type": "value", **_AXIS_STYLE},
+        "series": [
+            {"name": name, "type": chart_type, "data": data, **({"smooth": True} if chart_type == "line" else {})}
+            for name, data in series
+        ],
+    }
+    if len(series) > 1:
+        option["legend"] = {"textStyle": {"color": _TEXT_COLOR}}
+    return option
+
+
+def _pie_option(name: str, labels: list[str], values: list[Any]) -> dict[str, Any]:
+    """饼图 option"""
+    return {
+        "backgroundColor": "transparent",
+        "textStyle": {"color": _TEXT_COLOR},
+        "tooltip": {"trigger": "item", "formatter": "{b}: {c} ({d}%)"},
+        "legend": {"orient": "vertical", "left": "left", "textStyle": {"color": _TEXT_COLOR}},
+        "series": [{
+            "name": name,
+            "type": "pie",
+            "radius": ["40%", "70%"],
+            "data": [{"name": label, "value": value} for label, value in zip(labels, values)],
+            "label": {"color": _TEXT_COLOR},
+        }],
+    }
+
+
+def infer_chart(
+    columns: list[str],
+    rows: list[Any],
+    question: str = "",
+) -> Optional[dict[str, Any]]:
+    """
+    根据列类型和类别基数推断图表
+
+    规则：
+    - 空结果、单行、列数超过 MAX_CHART_COLUMNS -> table
+    - 一个时间列 + 数值列 -> line
+    - 一个类别列 + 一个数值列：问题涉及占比且类别不多 -> pie，否则类别不多 -> bar
+    - 一个类别列 + 少量数值列 -> 分组 bar
+    - 其它形状（多类别列、纯数值、类别过多）无法判定，返回 None
+
+    Args:
+        columns: 列名
+        rows: 行数据（tuple 或 list）
+        question: 用户问题，用于识别占比类诉求
+
+    Returns:
+        {"chart_type", "echarts_option", "table_data"}，无法判定时返回 None
+    """
+    if not columns or not rows or len(rows) == 1 or len(columns) > MAX_CHART_COLUMNS:
+        return _result("table", None, columns, rows)
+
+    kinds = [classify_column(name, [row[i] for row in rows]) for i, name in enumerate(columns)]
+    temporal = [i for i, k in enumerate(kinds) if k == TEMPORAL]
+    numeric = [i for i, k in enumerate(kinds) if k == NUMERIC]
+    categorical = [i for i, k in enumerate(kinds) if k == CATEGORICAL]
+
+    if not numeric:
+        return None
+
+    def series_of(indices: list[int]) -> list[tuple[str, list[Any]]]:
+        return [(columns[i], [_to_number(row[i]) for row in rows]) for i in indices]
+
+    # 时间趋势 -> 折线图
+    if len(temporal) == 1 and not categorical:
+        x = temporal[0]
+        labels = [_to_label(row[x]) for row in rows]
+        return _result("line", _axis_chart_option("line", labels, series_of(numeric)), columns, rows)
+
+    if len(categorical) != 1 or temporal:
+        return None
+
+    x = categorical[0]
+    labels = [_to_label(row[x]) for row in rows]
+    if len(set(labels)) != len(labels):
+        # 类别重复（未聚合的明细），交给 LLM 判断
+        return None
+
+    if len(numeric) == 1:
+        values = [_to_number(row[numeric[0]]) for row in rows]
+        wants_share = any(k in question for k in _SHARE_KEYWORDS)
+        if (
+            wants_share
+            and len(labels) <= MAX_PIE_CATEGORIES
+            and all(v is not None and v >= 0 for v in values)
+        ):
+            return _result("pie", _pie_option(columns[numeric[0]], labels, values), columns, rows)
+        if len(labels) <= MAX_BAR_CATEGORIES:
+            return _result("bar", _axis_chart_option("bar", labels, series_of(numeric)), columns, rows)
+        return None
+
+    if len(numeric) <= MAX_BAR_SERIES and len(labels) <= MAX_BAR_CATEGORIES:
+        return _result("bar", _axis_chart_option("bar", labels, series_of(numeric)), columns, rows)
+    return None
@@ -1,28 +1,30 @@
 """
-图表服务层 - AI 图表类型决策 + ECharts option JSON 生成
-通过 Qwen3-max 分析查询结果，自动选择最合适的图表类型并生成配置
+图表服务层 - 图表类型决策 + ECharts option JSON 生成
+按 CHART_ENGINE 配置选择：本地规则引擎（chart_rules）/ Qwen3-max 分析 / 规则优先 + LLM 兜底
+输入为 sql_db_query 的结构化结果（QueryResult），表格数据始终在本地构建
 """
 
 import json
 import re
 from typing import Any, Optional
 from langchain_core.messages import HumanMessage, SystemMessage
+from app.config import get_settings
+from app.services import chart_rules
 from app.services.llm_service import get_llm
+from app.services.sql_tools import QueryResult
+
+# 图表 prompt 中最多展示的结果行数
+PROMPT_MAX_ROWS = 50
 
 CHART_SYSTEM_PROMPT = """你是一个数据可视化专家。根据用户的查询问题和 SQL 查询结果，你需要：
 
 1. 判断最合适的图表类型（bar/line/pie/table）
 2. 生成完整的 ECharts option 配置 JSON
-3. 同时生成表格数据
 
 返回严格的 JSON 格式（不要包含任何其他文字或 markdown 标记），结构如下：
 {
   "chartType": "bar|line|pie|table",
-  "echartsOption": { ... 完整的 ECharts option 配置 ... },
-  "tableData": {
-    "columns": ["列名1", "列名2"],
-    "rows": [["值1", "值2"], ...]
-  }
+  "echartsOption": { ... 完整的 ECharts option 配置 ... }
 }
 
 图表选择规则：
@@ -42,7 +44,7 @@ ECharts 配置要求：
 def generate_chart(
     question: str,
     sql: str,
-    query_result: str,
+    query_result: QueryResult,
 ) -> Optional[dict[str, Any]]:
     """
     根据查询结果生成图表配置
@@ -50,12 +52,30 @@ def generate_chart(
     Args:
         question: 用户的原始问题
         sql: 执行的 SQL 语句
-        query_result: SQL 查询结果字符串
+        query_result: SQL 查询的结构化结果
 
     Returns:
-        包含 chartType, echartsOption, tableData 的字典，失败时返回降级的 table 类型
+        包含 chart_type, echarts_option, table_data 的字典，失败时返回降级的 table 类型
     """
-    llm = get_llm()
+    engine = get_settings().CHART_ENGINE
+    if engine != "llm":
+        chart_data = chart_rules.infer_chart(query_result.columns, query_result.rows, question)
+        if chart_data is not None:
+            print(f"[ChartService] 规则引擎生成图表: type={chart_data['chart_type']}")
+            return chart_data
+        if engine == "rules":
+            return _fallback_table(query_result)
+
+    return _generate_chart_by_llm(question, sql, query_result)
+
+
+def _generate_chart_by_llm(
+    question: str,
+    sql: str,
+    query_result: QueryResult,
+) -> Optional[dict[str, Any]]:
+    """调用 LLM 选择图表类型并生成 ECharts 配置，失败时降级为表格"""
+    llm = get_llm(priority="chart")
 
     user_prompt = f"""用户问题: {question}
 
@@ -63,9 +83,9 @@ def generate_chart(
 {sql}
 
 查询结果:
-{query_result}
+{query_result.to_prompt_text(PROMPT_MAX_ROWS)}
 
-请分析以上数据，选择最合适的图表类型，并生成完整的 ECharts 配置和表格数据。
+请分析以上数据，选择最合适的图表类型，并生成完整的 ECharts 配置。
 只返回 JSON，不要任何其他文字。"""
 
     try:
@@ -104,7 +124,7 @@ def generate_chart(
         return {
             "chart_type": chart_data.get("chartType", "table"),
             "echarts_option": chart_data.get("echartsOption"),
-            "table_data": chart_data.get("tableData"),
+            "table_data": chart_rules.build_table_data(query_result.columns, query_result.rows),
         }
 
     except (json.JSONDecodeError, Exception) as e:
@@ -113,46 +133,19 @@ def generate_chart(
         return _fallback_table(query_result, str(e))
 
 
-def _fallback_table(query_result: str, error: str = "") -> dict[str, Any]:
+def _fallback_table(query_result: QueryResult, error: str = "") -> dict[str, Any]:
     """
     降级方案：将查询结果转为简单表格
 
     Args:
-        query_result: SQL 查询结果字符串（可能是 Python repr，含 Decimal、datetime 等）
+        query_result: SQL 查询的结构化结果
         error: 错误信息
 
     Returns:
         table 类型的图表数据
     """
-    try:
-        s = (query_result or "").strip()
-        # MySQL/PyMySQL 返回 Python repr，含 Decimal('x.xx')，eval 会报 NameError
-        s_clean = re.sub(r"Decimal\(['\"]([^'\"]+)['\"]\)", r"\1", s)
-        data = eval(s_clean) if s_clean else []
-
-        if isinstance(data, list) and len(data) > 0:
-            if isinstance(data[0], dict):
-                columns = list(data[0].keys())
-                rows = [[str(row.get(c, "")) for c in columns] for row in data]
-            elif isinstance(data[0], (tuple, list)):
-                columns = [f"列{i+1}" for i in range(len(data[0]))]
-                rows = [[str(v) for v in row] for row in data]
-            else:
-                columns = ["结果"]
-                rows = [[str(v)] for v in data]
-        else:
-            columns = ["结果"]
-            rows = [[str(query_result)]]
-
-    except Exception:
-        columns = ["结果"]
-        rows = [[str(query_result)]]
-
     return {
         "chart_type": "table",
         "echarts_option": None,
-        "table_data": {
-            "columns": columns,
-            "rows": rows,
-        },
+        "table_data": chart_rules.build_table_data(query_result.columns, query_result.rows),
     }
@@ -0,0 +1,319 @@
+"""
+对话记忆存储（LangGraph Checkpointer）
+- 后端由 CHECKPOINT_BACKEND 决定：sqlite（默认，本地文件，多个 worker 进程共享）/ memory（进程内）
+- 所有连接共用一个 Checkpointer，线程 ID 为 "{session_id}:{connection_id}"，同一会话切换数据库时对话互不影响
+- compact：每轮对话结束后只保留线程的最新 checkpoint（历史 checkpoint 仅供时间回溯，本项目不使用）
+- 记录每个线程的最近活跃时间，空闲超过 CHECKPOINT_THREAD_TTL 的线程定期清理
+- 删除会话 / 连接时删除其全部线程
+"""
+
+import asyncio
+import os
+import re
+import sqlite3
+import threading
+import time
+from typing import Any, AsyncIterator, Iterator, Optional, Sequence
+
+from langchain_core.runnables import RunnableConfig
+from langgraph.checkpoint.base import (
+    BaseCheckpointSaver,
+    ChannelVersions,
+    Checkpoint,
+    CheckpointMetadata,
+    CheckpointTuple,
+)
+from langgraph.checkpoint.memory import InMemorySaver
+from langgraph.checkpoint.sqlite import SqliteSaver
+
+from app.config import get_settings
+
+_ACTIVITY_DDL = """
+CREATE TABLE IF NOT EXISTS thread_activity (
+    thread_id TEXT PRIMARY KEY,
+    last_active REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_thread_activity_last_active ON thread_activity (last_active);
+"""
+
+# 对话记忆压缩生成的摘要消息的 name（HumanMessage.name）
+SUMMARY_MESSAGE_NAME = "conversation_summary"
+
+# 统计计数
+_stats = {"compactions": 0, "checkpoints_removed": 0, "threads_expired": 0, "threads_deleted": 0}
+
+_checkpointer: Optional[BaseCheckpointSaver] = None
+_init_lock = threading.Lock()
+
+
+class SqliteCheckpointer(SqliteSaver):
+    """
+    SQLite Checkpointer：WAL 模式支持多进程共享；异步接口在线程池中调用同步实现
+    （Agent 的 async 执行模式也可使用）
+    """
+
+    def __init__(self, path: str):
+        conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        super().__init__(conn)
+
+    def setup(self) -> None:
+        if self.is_setup:
+            return
+        super().setup()
+        self.conn.executescript(_ACTIVITY_DDL)
+
+    def put(
+        self,
+        config: RunnableConfig,
+        checkpoint: Checkpoint,
+        metadata: CheckpointMetadata,
+        new_versions: ChannelVersions,
+    ) -> RunnableConfig:
+        result = super().put(config, checkpoint, metadata, new_versions)
+        with self.cursor() as cur:
+            cur.execute(
+                "INSERT INTO thread_activity (thread_id, last_active) VALUES (?, ?) "
+                "ON CONFLICT(thread_id) DO UPDATE SET last_active = excluded.last_active",
+                (str(config["configurable"]["thread_id"]), time.time()),
+            )
+        return result
+
+    def delete_thread(self, thread_id: str) -> None:
+        super().delete_thread(thread_id)
+        with self.cursor() as cur:
+            cur.execute("DELETE FROM thread_activity WHERE thread_id = ?", (str(thread_id),))
+
+    def compact(self, thread_id: str) -> int:
+        """删除线程除各命名空间最新 checkpoint 以外的 checkpoint 与 writes，返回删除的 checkpoint 数"""
+        with self.cursor() as cur:
+            cur.execute(
+                "SELECT checkpoint_ns, MAX(checkpoint_id) FROM checkpoints "
+                "WHERE thread_id = ? GROUP BY checkpoint_ns",
+                (thread_id,),
+            )
+            removed = 0
+            for ns, latest in cur.fetchall():
+                cur.execute(
+                    "DELETE FROM checkpoints WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id <> ?",
+                    (thread_id, ns, latest),
+                )
+                removed += cur.rowcount
+                cur.execute(
+                    "DELETE FROM writes WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id <> ?",
+                    (thread_id, ns, latest),
+                )
+        return removed
+
+    def thread_ids(self, prefix: str = "", suffix: str = "") -> list[str]:
+        """按前缀 / 后缀筛选线程 ID（前缀按主键范围查找，后缀用 LIKE）"""
+        sql, params = "SELECT DISTINCT thread_id FROM checkpoints WHERE 1 = 1", []
+        if prefix:
+            # 主键 (thread_id, ...) 上的范围查找：prefix <= thread_id < prefix 末字符 + 1
+            sql += " AND thread_id >= ? AND thread_id < ?"
+            params += [prefix, prefix[:-1] + chr(ord(prefix[-1]) + 1)]
+        if suffix:
+            sql += " AND thread_id LIKE ? ESCAPE '\\'"
+            params.append("%" + re.sub(r"([\\%_])", r"\\\1", suffix))
+        with self.cursor(transaction=False) as cur:
+            cur.execute(sql, params)
+            return [row[0] for row in cur.fetchall()]
+
+    def idle_thread_ids(self, before: float) -> list[str]:
+        with self.cursor(transaction=False) as cur:
+            cur.execute("SELECT thread_id FROM thread_activity WHERE last_active < ?", (before,))
+            return [row[0] for row in cur.fetchall()]
+
+    # ---------- 异步接口：在线程池中执行同步实现 ----------
+
+    async def aget_tuple(self, config: RunnableConfig) -> Optional[CheckpointTuple]:
+        return await asyncio.to_thread(self.get_tuple, config)
+
+    async def alist(
+        self,
+        config: Optional[RunnableConfig],
+        *,
+        filter: Optional[dict[str, Any]] = None,
+        before: Optional[RunnableConfig] = None,
+        limit: Optional[int] = None,
+    ) -> AsyncIterator[CheckpointTuple]:
+        items = await asyncio.to_thread(
+            lambda: list(self.list(config, filter=filter, before=before, limit=limit))
+        )
+        for item in items:
+            yield item
+
+    async def aput(
+        self,
+        config: RunnableConfig,
+        checkpoint: Checkpoint,
+        metadata: CheckpointMetadata,
+        new_versions: ChannelVersions,
+    ) -> RunnableConfig:
+        return await asyncio.to_thread(self.put, config, checkpoint, metadata, new_versions)
+
+    async def aput_writes(
+        self,
+        config: RunnableConfig,
+        writes: Sequence[tuple[str, Any]],
+        task_id: str,
+        task_path: str = "",
+    ) -> None:
+        await asyncio.to_thread(self.put_writes, config, writes, task_id, task_path)
+
+    async def adelete_thread(self, thread_id: str) -> None:
+        await asyncio.to_thread(self.delete_thread, thread_id)
+
+
+class MemoryCheckpointer(InMemorySaver):
+    """进程内 Checkpointer，额外记录线程活跃时间并支持 compact"""
+
+    def __init__(self):
+        super().__init__()
+        self._last_active: dict[str, float] = {}
+        self._lock = threading.RLock()
+
+    def put(
+        self,
+        config: RunnableConfig,
+        checkpoint: Checkpoint,
+        metadata: CheckpointMetadata,
+        new_versions: ChannelVersions,
+    ) -> RunnableConfig:
+        with self._lock:
+            self._last_active[str(config["configurable"]["thread_id"])] = time.time()
+            return super().put(config, checkpoint, metadata, new_versions)
+
+    def put_writes(
+        self,
+        config: RunnableConfig,
+        writes: Sequence[tuple[str, Any]],
+        task_id: str,
+        task_path: str = "",
+    ) -> None:
+        with self._lock:
+            super().put_writes(config, writes, task_id, task_path)
+
+    def delete_thread(self, thread_id: str) -> None:
+        with self._lock:
+            super().delete_thread(thread_id)
+            self._last_active.pop(thread_id, None)
+
+    def compact(self, thread_id: str) -> int:
+        """只保留各命名空间最新 checkpoint 及其引用的 channel 值，返回删除的 checkpoint 数"""
+        removed = 0
+        with self._lock:
+            keep_blobs: set[tuple] = set()
+            for ns, checkpoints in self.storage.get(thread_id, {}).items():
+                if not checkpoints:
+                    continue
+                latest = max(checkpoints)
+                for checkpoint_id in [c for c in checkpoints if c != latest]:
+                    del checkpoints[checkpoint_id]
+                    self.writes.pop((thread_id, ns, checkpoint_id), None)
+                    removed += 1
+                checkpoint = self.serde.loads_typed(checkpoints[latest][0])
+                keep_blobs.update(
+                    (thread_id, ns, channel, version)
+                    for channel, version in checkpoint["channel_versions"].items()
+                )
+            for key in [k for k in self.blobs if k[0] == thread_id and k not in keep_blobs]:
+                del self.blobs[key]
+        return removed
+
+    def thread_ids(self, prefix: str = "", suffix: str = "") -> list[str]:
+        with self._lock:
+            return [t for t in self.storage if t.startswith(prefix) and t.endswith(suffix)]
+
+    def idle_thread_ids(self, before: float) -> list[str]:
+        with self._lock:
+            return [t for t, ts in self._last_active.items() if ts < before]
+
+
+def _get_db_path() -> str:
+    """checkpoint 数据库路径（相对路径基于 backend 目录）"""
+    path = get_settings().CHECKPOINT_DB_PATH
+    if not os.path.isabs(path):
+        backend_dir = os.path.dirname(os.path.dirname(os.path.dirname(__file__)))
+        path = os.path.join(backend_dir, path)
+    dir_path = os.path.dirname(path)
+    if dir_path and not os.path.exists(dir_path):
+        os.makedirs(dir_path, exist_ok=True)
+    return path
+
+
+def get_checkpointer() -> BaseCheckpointSaver:
+    """获取进程共用的 Checkpointer（按 CHECKPOINT_BACKEND 懒加载）"""
+    global _checkpointer
+    with _init_lock:
+        if _checkpointer is None:
+            if get_settings().CHECKPOINT_BACKEND == "memory":
+                _checkpointer = MemoryCheckpointer()
+            else:
+                _checkpointer = SqliteCheckpointer(_get_db_path())
+        return _checkpointer
+
+
+def thread_id_for(session_id: str, connection_id: str) -> str:
+    """会话在指定连接上的 Agent 线程 ID"""
+    return f"{session_id}:{connection_id}"
+
+
+def _matching_threads(session_id: Optional[str] = None, connection_id: Optional[str] = None) -> Iterator[str]:
+    thread_ids = get_checkpointer().thread_ids(
+        prefix=f"{session_id}:" if session_id is not None else "",
+        suffix=f":{connection_id}" if connection_id is not None else "",
+    )
+    for thread_id in thread_ids:
+        sid, _, cid = thread_id.partition(":")
+        if (session_id is None or sid == session_id) and (connection_id is None or cid == connection_id):
+            yield thread_id
+
+
+def delete_threads(session_id: Optional[str] = None, connection_id: Optional[str] = None) -> int:
+    """
+    删除会话和 / 或连接的全部线程（阻塞调用，async 代码中经 asyncio.to_thread 调用）
+
+    Args:
+        session_id: 会话 ID，为 None 时不按会话过滤
+        connection_id: 连接 ID，为 None 时不按连接过滤
+
+    Returns:
+        删除的线程数
+    """
+    checkpointer = get_checkpointer()
+    thread_ids = list(_matching_threads(session_id, connection_id))
+    for thread_id in thread_ids:
+        checkpointer.delete_thread(thread_id)
+    _stats["threads_deleted"] += len(thread_ids)
+    return len(thread_ids)
+
+
+def compact(thread_id: str) -> int:
+    """只保留线程最新的 checkpoint，返回删除的 checkpoint 数"""
+    removed = get_checkpointer().compact(thread_id)
+    _stats["compactions"] += 1
+    _stats["checkpoints_removed"] += removed
+    return removed
+
+
+def collect_idle_threads() -> int:
+    """删除空闲超过 CHECKPOINT_THREAD_TTL 的线程，返回删除数量"""
+    ttl = get_settings().CHECKPOINT_THREAD_TTL
+    if ttl <= 0:
+        return 0
+    checkpointer = get_checkpointer()
+    thread_ids = checkpointer.idle_thread_ids(time.time() - ttl)
+    for thread_id in thread_ids:
+        checkpointer.delete_thread(thread_id)
+    _stats["threads_expired"] += len(thread_ids)
+    return len(thread_ids)
+
+
+def get_stats() -> dict:
+    """对话记忆统计"""
+    checkpointer = get_checkpointer()
+    return {
+        "backend": "memory" if isinstance(checkpointer, MemoryCheckpointer) else "sqlite",
+        "threads": len(checkpointer.thread_ids()),
+        **_stats,
+    }
@@ -1,19 +1,27 @@
 """
 MySQL 连接管理服务
 - 连接配置 CRUD（JSON 文件持久化）
-- SQLDatabase 实例缓存（按 connection_id）
+- 按 connection_id 缓存连接资源（连接池 Engine、SQLDatabase、Agent），SQL 工作台与 Agent 共用同一连接池；
+  缓存数量按 LRU 淘汰、空闲超时释放，释放时 dispose 连接池并通知订阅者（schema 缓存、Agent 等）
 - 连接测试（pymysql 直连校验）
+- 异步访问入口 run_db：阻塞的数据库调用在专用线程池执行，REST 接口不阻塞事件循环
 """
 
+import asyncio
+import functools
 import json
 import os
+import threading
 import uuid
-from typing import Optional
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Any, Callable, Optional, TypeVar
 
 from langchain_community.utilities import SQLDatabase
+from sqlalchemy.engine import Engine
 
 from app.config import get_settings
-from app.database.connection import build_mysql_uri, create_sql_database, test_mysql_connection
+from app.database.connection import create_mysql_engine, open_unpooled_connection, test_mysql_connection
 from app.models.schemas import (
     MySQLConnectionConfig,
     MySQLConnectionCreate,
@@ -21,18 +29,27 @@ from app.models.schemas import (
     ConnectionTestResult,
     ConnectionTestRequest,
 )
+from app.services.resource_registry import INVALIDATED, ResourceRegistry
 
 # ==================== 内部状态 ====================
 
 # 连接配置列表（内存副本，定期与 JSON 文件同步）
 _connections: list[dict] = []
 
-# SQLDatabase 实例缓存：connection_id -> SQLDatabase
-_db_cache: dict[str, SQLDatabase] = {}
+# 保护资源槽位的延迟创建（Agent 线程池与事件循环会并发访问）
+_cache_lock = threading.RLock()
+
+# 资源释放时的订阅者：callback(connection_id, reason)
+_eviction_listeners: list[Callable[[str, str], None]] = []
 
 # 是否已初始化
 _initialized: bool = False
 
+# 数据库访问线程池（run_db 使用，延迟创建）
+_db_executor: Optional[ThreadPoolExecutor] = None
+
+T = TypeVar("T")
+
 
 # ==================== 持久化 ====================
 
@@ -157,6 +174,11 @@ def add_connection(config: MySQLConnectionCreate) -> MySQLConnectionConfig:
         "user": config.user,
         "password": config.password,
         "database": config.database,
+        "pool_size": config.pool_size,
+        "max_overflow": config.max_overflow,
+        "pool_recycle": config.pool_recycle,
+        "pool_pre_ping": config.pool_pre_ping,
+        "query_timeout": config.query_timeout,
     }
     _connections.append(conn_dict)
     _save_connections(_connections)
@@ -183,8 +205,8 @@ def update_connection(conn_id: str, update: MySQLConnectionUpdate) -> Optional[M
             _connections[i].update(update_data)
             _save_connections(_connections)
 
-            # 清除该连接的 SQLDatabase 缓存（配置已变更）
-            _db_cache.pop(conn_id, None)
+            # 释放该连接的连接池、SQLDatabase 与 Agent（配置已变更）
+            clear_db_cache(conn_id)
 
             return MySQLConnectionConfig(**_connections[i])
 
@@ -208,55 +230,202 @@ def delete_connection(conn_id: str) -> bool:
             _connections.pop(i)
             _save_connections(_connections)
 
-            # 清除该连接的 SQLDatabase 缓存
-            _db_cache.pop(conn_id, None)
+            # 释放该连接的连接池、SQLDatabase 与 Agent
+            clear_db_cache(conn_id)
 
             return True
 
     return False
 
 
-# ==================== SQLDatabase 缓存 ====================
+# ==================== 连接资源缓存 ====================
 
-def get_sql_database(conn_id: str) -> Optional[SQLDatabase]:
+@dataclass
+class ConnectionResources:
+    """某个连接缓存的资源，整体随连接淘汰 / 失效"""
+    engine: Engine
+    # LangChain SQLDatabase（首次使用时创建）
+    db: Optional[SQLDatabase] = None
+    # Agent 及其构建参数（由 agent_service 填充）
+    agent: Any = None
+    agent_key: Any = None
+
+
+def _notify_listeners(conn_id: str, reason: str) -> None:
+    for listener in list(_eviction_listeners):
+        listener(conn_id, reason)
+
+
+def _on_evict(conn_id: str, resources: ConnectionResources, reason: str) -> None:
+    """释放连接池并通知订阅者（INVALIDATED 由 clear_db_cache 通知，与资源是否缓存无关）"""
+    resources.engine.dispose()
+    if reason != INVALIDATED:
+        _notify_listeners(conn_id, reason)
+
+
+_resources: ResourceRegistry[ConnectionResources] = ResourceRegistry(
+    "connections",
+    max_entries=lambda: get_settings().RESOURCE_MAX_CONNECTIONS,
+    idle_ttl=lambda: get_settings().RESOURCE_IDLE_TTL,
+    on_evict=_on_evict,
+)
+
+
+def add_eviction_listener(listener: Callable[[str, str], None]) -> None:
     """
-    获取指定连接的 LangChain SQLDatabase 实例（带缓存）
+    订阅连接资源释放（LRU 淘汰、空闲超时、配置变更 / 删除）
+
+    Args:
+        listener: callback(connection_id, reason)，reason 见 resource_registry 中的常量
+    """
+    _eviction_listeners.append(listener)
+
+
+def _create_resources(conn_id: str) -> Optional[ConnectionResources]:
+    config = get_connection(conn_id)
+    if config is None:
+        return None
+    return ConnectionResources(
+        engine=create_mysql_engine(
+            host=config.host,
+            port=config.port,
+            user=config.user,
+            password=config.password,
+            database=config.database,
+            pool_size=config.pool_size,
+            max_overflow=config.max_overflow,
+            pool_recycle=config.pool_recycle,
+            pool_pre_ping=config.pool_pre_ping,
+            query_timeout=config.query_timeout,
+        )
+    )
+
+
+def get_resources(conn_id: str) -> Optional[ConnectionResources]:
+    """
+    获取指定连接的资源（不存在时创建连接池，并刷新 LRU / 空闲时间）
+
+    Returns:
+        ConnectionResources，连接不存在时返回 None
+    """
+    return _resources.get_or_create(conn_id, lambda: _create_resources(conn_id))
+
+
+def peek_resources(conn_id: str) -> Optional[ConnectionResources]:
+    """获取已缓存的连接资源（不创建、不刷新）"""
+    return _resources.peek(conn_id)
+
+
+def get_engine(conn_id: str) -> Optional[Engine]:
+    """
+    获取指定连接的连接池 Engine（带缓存）
+
+    连接池参数（pool_size / max_overflow / pool_recycle / pool_pre_ping）与 query_timeout 取自连接配置
 
     Args:
         conn_id: 连接 ID
 
     Returns:
-        SQLDatabase 实例，连接不存在时返回 None
+        Engine 实例，连接不存在时返回 None
     """
-    if conn_id in _db_cache:
-        return _db_cache[conn_id]
+    resources = get_resources(conn_id)
+    return resources.engine if resources is not None else None
 
-    config = get_connection(conn_id)
-    if config is None:
+
+def open_direct_connection(conn_id: str, query_timeout: int = 0):
+    """
+    为指定连接新建一个不经连接池的 pymysql 连接（调用方负责关闭）
+
+    Args:
+        conn_id: 连接 ID
+        query_timeout: 会话级查询超时秒数，0 表示不限制
+
+    Returns:
+        pymysql 连接，连接不存在时返回 None
+
+    Raises:
+        pymysql.Error: 连接失败
+    """
+    engine = get_engine(conn_id)
+    if engine is None:
         return None
+    return open_unpooled_connection(engine, query_timeout)
 
-    db = create_sql_database(
-        host=config.host,
-        port=config.port,
-        user=config.user,
-        password=config.password,
-        database=config.database,
-    )
-    _db_cache[conn_id] = db
-    return db
+
+def get_sql_database(conn_id: str) -> Optional[SQLDatabase]:
+    """
+    获取指定连接的 LangChain SQLDatabase 实例（带缓存，共用 get_engine 的连接池）
+
+    Args:
+        conn_id: 连接 ID
+
+    Returns:
+        SQLDatabase 实例，连接不存在时返回 None
+    """
+    resources = get_resources(conn_id)
+    if resources is None:
+        return None
+    with _cache_lock:
+        if resources.db is None:
+            # 表结构由 schema_service 缓存提供，此处跳过全量反射
+            resources.db = SQLDatabase(resources.engine, lazy_table_reflection=True)
+        return resources.db
 
 
 def clear_db_cache(conn_id: Optional[str] = None) -> None:
     """
-    清除 SQLDatabase 缓存
+    释放连接资源（连接池、SQLDatabase、Agent），并通知订阅者失效关联缓存
+
+    资源未加载或已被淘汰（重启、LRU、空闲超时）时同样通知订阅者，问题缓存与对话记忆等持久状态不会遗留
 
     Args:
-        conn_id: 指定连接 ID，为 None 时清除所有缓存
+        conn_id: 指定连接 ID，为 None 时释放所有连接
     """
-    if conn_id:
-        _db_cache.pop(conn_id, None)
+    if conn_id is not None:
+        conn_ids = [conn_id]
     else:
-        _db_cache.clear()
+        conn_ids = list(dict.fromkeys(_resources.keys() + [c["id"] for c in _connections]))
+    _resources.remove(conn_id, reason=INVALIDATED)
+    for cid in conn_ids:
+        _notify_listeners(cid, INVALIDATED)
+
+
+def sweep_idle_resources() -> int:
+    """释放空闲超时的连接资源，返回释放数量"""
+    return _resources.sweep()
+
+
+def get_resource_stats() -> dict:
+    """连接资源缓存统计（数量、命中率、淘汰次数、各连接空闲时间）"""
+    return _resources.stats()
+
+
+# ==================== 异步访问 ====================
+
+def _get_db_executor() -> ThreadPoolExecutor:
+    """获取数据库访问线程池（大小由 DB_EXECUTOR_WORKERS 决定）"""
+    global _db_executor
+    if _db_executor is None:
+        _db_executor = ThreadPoolExecutor(
+            max_workers=max(1, get_settings().DB_EXECUTOR_WORKERS),
+            thread_name_prefix="db-access",
+        )
+    return _db_executor
+
+
+async def run_db(func: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+    """
+    在数据库访问线程池中执行阻塞调用并等待结果
+
+    连接池仍是同步 Engine（与 Agent 的 SQLDatabase 共用），此处只负责把驱动的
+    阻塞 I/O 移出事件循环；函数抛出的异常（包括 HTTPException）原样向上传播
+
+    Args:
+        func: 阻塞函数
+        *args, **kwargs: 传给 func 的参数
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_get_db_executor(), functools.partial(func, *args, **kwargs))
 
 
 # ==================== 连接测试 ====================
@@ -0,0 +1,187 @@
+"""
+上下文窗口预算
+Agent 每次调用模型都会带上整个线程的历史消息（含较早轮次的大段表结构 / 查询结果），
+此处作为 Agent 中间件在调用模型前裁剪本次发送的消息（checkpointer 中的历史不变）：
+1. 最近 CONTEXT_KEEP_TURNS 轮（含当前轮）原样保留
+2. 更早轮次的工具输出折叠为一行摘要（查询结果只保留行数与列名，表结构只保留表名）
+3. 仍超出 CONTEXT_TOKEN_BUDGET 时从最早的轮次起整轮丢弃（对话摘要消息始终保留）
+token 数按字符估算（CJK 字符计 1，其余每 4 个字符计 1），统计节省的 prompt token 供观测
+"""
+
+import re
+import threading
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable
+
+from langchain.agents.middleware import AgentMiddleware, ModelRequest, ModelResponse
+from langchain_core.messages import AnyMessage, HumanMessage, ToolMessage
+
+from app.config import get_settings
+from app.services.checkpoint_service import SUMMARY_MESSAGE_NAME
+from app.services.sql_tools import QueryResult, query_result_meta
+
+# 每条消息的固定开销（角色、分隔符）
+_MESSAGE_OVERHEAD = 4
+
+_CJK = re.compile(r"[\u3000-\u303f\u4e00-\u9fff\uff00-\uffef]")
+_CREATE_TABLE = re.compile(r"CREATE TABLE\s+`?(\w+)`?", re.IGNORECASE)
+
+
+def estimate_tokens(text: str) -> int:
+    """估算文本的 token 数"""
+    if not text:
+        return 0
+    cjk = len(_CJK.findall(text))
+    return cjk + (len(text) - cjk + 3) // 4
+
+
+def _message_tokens(message: AnyMessage) -> int:
+    content = message.content if isinstance(message.content, str) else str(message.content)
+    tokens = _MESSAGE_OVERHEAD + estimate_tokens(content)
+    for tc in getattr(message, "tool_calls", None) or []:
+        tokens += estimate_tokens(tc.get("name", "")) + estimate_tokens(str(tc.get("args", "")))
+    return tokens
+
+
+def count_tokens(messages: list[AnyMessage]) -> int:
+    """估算消息列表的 token 数"""
+    return sum(_message_tokens(m) for m in messages)
+
+
+def _collapse_tool_message(message: ToolMessage) -> ToolMessage:
+    """把较早轮次的工具输出折叠为一行摘要（保留 tool_call_id，工具调用与结果仍成对）"""
+    content = message.content if isinstance(message.content, str) else str(message.content)
+    artifact = getattr(message, "artifact", None)
+    # 对话状态中为元信息 dict（query_result_meta）；旧 checkpoint 中为含 rows 的 dict
+    if isinstance(artifact, QueryResult):
+        artifact = query_result_meta(artifact)
+    if message.name == "sql_db_query" and isinstance(artifact, dict) and "columns" in artifact:
+        row_count = artifact.get("row_count", len(artifact.get("rows") or []))
+        total = f"{row_count}+" if artifact.get("truncated") else str(row_count)
+        summary = f"[较早的查询结果已省略] 共 {total} 行，列：{', '.join(artifact['columns'])}"
+    elif message.name == "sql_db_schema" and _CREATE_TABLE.search(content):
+        tables = ", ".join(dict.fromkeys(_CREATE_TABLE.findall(content)))
+        summary = f"[较早的表结构输出已省略] 表：{tables}"
+    else:
+        limit = get_settings().CONTEXT_COLLAPSED_TOOL_CHARS
+        if len(content) <= limit:
+            return message
+        summary = f"{content[:limit]}…[已省略，原文 {len(content)} 字符]"
+    return message.model_copy(update={"content": summary, "artifact": None})
+
+
+def _is_pinned(message: AnyMessage) -> bool:
+    """对话摘要消息（由对话记忆压缩生成）始终保留"""
+    return isinstance(message, HumanMessage) and message.name == SUMMARY_MESSAGE_NAME
+
+
+def fit_messages(
+    messages: list[AnyMessage],
+    budget: int,
+    keep_turns: int,
+    reserved: int = 0,
+) -> list[AnyMessage]:
+    """
+    按预算裁剪发送给模型的消息
+
+    Args:
+        messages: 线程的全部消息（最后一轮为当前轮）
+        budget: token 预算（<= 0 表示不限，只折叠较早的工具输出）
+        keep_turns: 原样保留的最近轮数（至少保留当前轮）
+        reserved: 预算中已被 system prompt 等占用的 token 数
+
+    Returns:
+        裁剪后的消息列表
+    """
+    starts = [i for i, m in enumerate(messages) if isinstance(m, HumanMessage) and not _is_pinned(m)]
+    if not starts:
+        return messages
+    keep_turns = max(1, keep_turns)
+    recent_start = starts[-keep_turns] if len(starts) > keep_turns else starts[0]
+
+    pinned = [m for m in messages[:starts[0]] if _is_pinned(m)]
+    head = [m for m in messages[:starts[0]] if not _is_pinned(m)]
+    # 较早轮次：[[turn messages], ...]，工具输出已折叠
+    old_turns = []
+    bounds = [i for i in starts if i < recent_start] + [recent_start]
+    for begin, end in zip(bounds, bounds[1:]):
+        old_turns.append([
+            _collapse_tool_message(m) if isinstance(m, ToolMessage) else m
+            for m in messages[begin:end]
+        ])
+    recent = messages[recent_start:]
+
+    if budget > 0:
+        fixed = reserved + count_tokens(pinned) + count_tokens(head) + count_tokens(recent)
+        turn_tokens = [count_tokens(t) for t in old_turns]
+        while old_turns and fixed + sum(turn_tokens) > budget:
+            old_turns.pop(0)
+            turn_tokens.pop(0)
+            # 最早的轮次被丢弃后，其之前的无主消息也不再保留
+            head = []
+
+    return pinned + head + [m for turn in old_turns for m in turn] + recent
+
+
+@dataclass
+class BudgetStats:
+    model_calls: int = 0
+    trimmed_calls: int = 0
+    tokens_before: int = 0
+    tokens_after: int = 0
+
+    def to_dict(self) -> dict:
+        return {
+            "model_calls": self.model_calls,
+            "trimmed_calls": self.trimmed_calls,
+            "prompt_tokens_before": self.tokens_before,
+            "prompt_tokens_after": self.tokens_after,
+            "prompt_tokens_saved": self.tokens_before - self.tokens_after,
+        }
+
+
+_stats = BudgetStats()
+_stats_lock = threading.Lock()
+
+
+def get_stats() -> dict:
+    """裁剪统计（估算的 prompt token 数）"""
+    with _stats_lock:
+        return _stats.to_dict()
+
+
+class ContextBudgetMiddleware(AgentMiddleware):
+    """调用模型前按预算裁剪消息的 Agent 中间件（同步 stream 与 astream 均适用）"""
+
+    def _fit(self, request: ModelRequest) -> ModelRequest:
+        settings = get_settings()
+        system = estimate_tokens(request.system_prompt or "")
+        before = count_tokens(request.messages)
+        messages = fit_messages(
+            request.messages,
+            settings.CONTEXT_TOKEN_BUDGET,
+            settings.CONTEXT_KEEP_TURNS,
+            reserved=system,
+        )
+        after = count_tokens(messages)
+        with _stats_lock:
+            _stats.model_calls += 1
+            _stats.tokens_before += system + before
+            _stats.tokens_after += system + after
+            if after < before:
+                _stats.trimmed_calls += 1
+        return request.override(messages=messages) if after < before else request
+
+    def wrap_model_call(
+        self,
+        request: ModelRequest,
+        handler: Callable[[ModelRequest], ModelResponse],
+    ) -> Any:
+        return handler(self._fit(request))
+
+    async def awrap_model_call(
+        self,
+        request: ModelRequest,
+        handler: Callable[[ModelRequest], Awaitable[ModelResponse]],
+    ) -> Any:
+        return await handler(self._fit(request))
@@ -0,0 +1,201 @@
+"""
+查询结果流式导出
+- 使用 pymysql SSCursor（无缓冲服务端游标）逐批 fetchmany，内存占用与结果总行数无关
+- 输出格式：CSV（带 BOM，便于 Excel 打开）/ NDJSON / Arrow IPC stream（需要 pyarrow）
+- 使用独立直连连接（不占用连接池），服务端执行时间上限为 EXPORT_TIMEOUT（远大于工作台查询超时）；
+  导出未读完即中断（客户端断开）时经 QueryGuard KILL QUERY 并直接关闭连接，
+  避免 SSCursor.close() 读完剩余结果、服务端继续执行
+- 响应体为异步生成器：每批读取与编码、结束 / 中断后的 KILL 与关闭连接均经 asyncio.to_thread 执行，不阻塞事件循环
+"""
+
+import asyncio
+import csv
+import datetime
+import io
+import json
+import threading
+from typing import Any, AsyncIterator, Iterator, Optional
+
+import anyio
+import pymysql.cursors
+from pymysql.constants import FIELD_TYPE
+
+from app.config import get_settings
+from app.services.query_guard import QueryGuard
+
+MEDIA_TYPES = {
+    "csv": "text/csv; charset=utf-8",
+    "ndjson": "application/x-ndjson",
+    "arrow": "application/vnd.apache.arrow.stream",
+}
+
+FILE_EXTENSIONS = {"csv": "csv", "ndjson": "ndjson", "arrow": "arrow"}
+
+
+def check_format(fmt: str) -> None:
+    """
+    校验导出格式的依赖是否可用
+
+    Raises:
+        ValueError: Arrow 导出但未安装 pyarrow
+    """
+    if fmt == "arrow":
+        try:
+            import pyarrow  # noqa: F401
+        except ImportError:
+            raise ValueError("Arrow 导出需要安装 pyarrow（pip install pyarrow）")
+
+
+def open_cursor(conn, sql: str):
+    """
+    以 SSCursor 执行查询（只发送查询，不拉取结果）
+
+    Raises:
+        pymysql.Error: SQL 执行失败
+    """
+    cursor = conn.cursor(pymysql.cursors.SSCursor)
+    try:
+        cursor.execute(sql)
+    except Exception:
+        cursor.close()
+        raise
+    return cursor
+
+
+async def stream_rows(conn, cursor, fmt: str, guard: Optional[QueryGuard] = None) -> AsyncIterator[bytes]:
+    """
+    按批读取游标并编码为指定格式（读取与清理在线程中执行）
+
+    Args:
+        conn: 导出专用的直连连接（结束或中断后关闭）
+        cursor: open_cursor 返回的 SSCursor
+        fmt: csv / ndjson / arrow
+        guard: 登记了该连接的 QueryGuard，中断时 KILL 服务端查询
+    """
+    chunks = _encode_rows(cursor, fmt)
+    # 读取线程持有；关闭连接前获取，等待已取消但仍在进行的读取结束（pymysql 连接不能跨线程并发使用）
+    read_lock = threading.Lock()
+    finished = False
+
+    def next_chunk() -> Optional[bytes]:
+        with read_lock:
+            return next(chunks, None)
+
+    try:
+        while True:
+            chunk = await asyncio.to_thread(next_chunk)
+            if chunk is None:
+                break
+            yield chunk
+        finished = True
+    finally:
+        # 客户端断开时所在的取消范围已被取消，清理需屏蔽取消才能执行完
+        with anyio.CancelScope(shield=True):
+            await asyncio.to_thread(_release, conn, cursor, guard, finished, read_lock)
+
+
+def _encode_rows(cursor, fmt: str) -> Iterator[bytes]:
+    chunk_rows = get_settings().EXPORT_CHUNK_ROWS
+    encoders = {"csv": _encode_csv, "ndjson": _encode_ndjson, "arrow": _encode_arrow}
+
+    def batches() -> Iterator[list[tuple]]:
+        while True:
+            rows = cursor.fetchmany(chunk_rows)
+            if not rows:
+                return
+            yield rows
+
+    yield from encoders[fmt](cursor.description or [], batches())
+
+
+def _release(conn, cursor, guard: Optional[QueryGuard], finished: bool, read_lock: threading.Lock) -> None:
+    """读完后关闭游标；未读完时先 KILL 服务端查询（进行中的读取随之出错返回），再关闭连接"""
+    if guard is not None and not finished:
+        guard.cancel()
+    with read_lock:
+        if finished:
+            cursor.close()
+            if guard is not None:
+                guard.detach()
+        conn.close()
+
+
+# ==================== 编码 ====================
+
+def _json_default(value: Any) -> Any:
+    if isinstance(value, (datetime.date, datetime.datetime, datetime.time)):
+        return value.isoformat()
+    if isinstance(value, bytes):
+        return value.decode("utf-8", errors="replace")
+    return str(value)
+
+
+def _encode_csv(description, batches: Iterator[list[tuple]]) -> Iterator[bytes]:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow([desc[0] for desc in description])
+    yield ("\ufeff" + buffer.getvalue()).encode("utf-8")
+    for rows in batches:
+        buffer.seek(0)
+        buffer.truncate()
+        writer.writerows(rows)
+        yield buffer.getvalue().encode("utf-8")
+
+
+def _encode_ndjson(description, batches: Iterator[list[tuple]]) -> Iterator[bytes]:
+    names = [desc[0] for desc in description]
+    for rows in batches:
+        lines = [
+            json.dumps(dict(zip(names, row)), ensure_ascii=False, default=_json_default)
+            for row in rows
+        ]
+        yield ("\n".join(lines) + "\n").encode("utf-8")
+
+
+_INT_TYPES = {FIELD_TYPE.TINY, FIELD_TYPE.SHORT, FIELD_TYPE.LONG, FIELD_TYPE.LONGLONG,
+              FIELD_TYPE.INT24, FIELD_TYPE.YEAR}
+_FLOAT_TYPES = {FIELD_TYPE.FLOAT, FIELD_TYPE.DOUBLE}
+_DATETIME_TYPES = {FIELD_TYPE.DATETIME, FIELD_TYPE.TIMESTAMP}
+
+
+def _arrow_field(pa, desc):
+    """按 MySQL 列类型确定 Arrow 类型（整批固定 schema，不随数据推断）；其余类型按字符串导出"""
+    type_code = desc[1]
+    if type_code in _INT_TYPES:
+        return pa.field(desc[0], pa.int64()), None
+    if type_code in _FLOAT_TYPES:
+        return pa.field(desc[0], pa.float64()), None
+    if type_code == FIELD_TYPE.DATE:
+        return pa.field(desc[0], pa.date32()), None
+    if type_code in _DATETIME_TYPES:
+        return pa.field(desc[0], pa.timestamp("us")), None
+    if type_code == FIELD_TYPE.TIME:
+        return pa.field(desc[0], pa.duration("us")), None
+    return pa.field(desc[0], pa.string()), lambda v: v if isinstance(v, str) else _json_default(v)
+
+
+def _encode_arrow(description, batches: Iterator[list[tuple]]) -> Iterator[bytes]:
+    import pyarrow as pa
+
+    fields, converters = zip(*(_arrow_field(pa, desc) for desc in description)) if description else ((), ())
+    schema = pa.schema(list(fields))
+    sink = io.BytesIO()
+    writer = pa.ipc.new_stream(sink, schema)
+
+    def drain() -> bytes:
+        data = sink.getvalue()
+        sink.seek(0)
+        sink.truncate()
+        return data
+
+    yield drain()
+    for rows in batches:
+        arrays = []
+        for i, field in enumerate(fields):
+            convert = converters[i]
+            values = [row[i] if row[i] is None or convert is None else convert(row[i]) for row in rows]
+            arrays.append(pa.array(values, type=field.type))
+        writer.write_batch(pa.RecordBatch.from_arrays(arrays, schema=schema))
+        yield drain()
+    writer.close()
+    yield drain()
@@ -0,0 +1,245 @@
+"""
+LLM 录制 / 回放（离线压测与 CI 使用）
+- LLM_PROVIDER=record：正常调用 DashScope，同时把每次调用的 prompt 与模型输出（文本 + 工具调用）追加写入 LLM_TRACE_FILE
+- LLM_PROVIDER=replay：不访问网络，按 prompt 哈希从录制文件中取出输出，按配置模拟首 token 延迟与逐 token 间隔
+- 录制文件为 JSONL，每行一条：{"prompt_hash", "turn_key", "content", "tool_calls"}
+  - prompt_hash：完整消息序列（类型、内容、工具调用名与参数，不含消息 / 调用 ID）的哈希
+  - turn_key：最后一条用户消息 + 其后的模型轮次序号的哈希；完整 prompt 变化（如 schema 摘要、查询结果不同）时作为退路
+- 未命中时按 LLM_REPLAY_ON_MISS 处理：error（抛出异常）/ answer（返回固定回答，保证流程可继续）
+"""
+
+import asyncio
+import hashlib
+import json
+import os
+import threading
+import time
+import uuid
+from typing import Any, AsyncIterator, Iterator, Optional, Sequence
+
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage, HumanMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+from app.config import get_settings
+
+# 未命中且 LLM_REPLAY_ON_MISS=answer 时的回答
+MISS_ANSWER = "（回放模式：未找到与该问题匹配的录制内容）"
+
+
+def _message_content(message: BaseMessage) -> str:
+    return message.content if isinstance(message.content, str) else json.dumps(message.content, ensure_ascii=False)
+
+
+def _canonical(message: BaseMessage) -> dict:
+    item = {"type": message.type, "content": _message_content(message)}
+    tool_calls = getattr(message, "tool_calls", None)
+    if tool_calls:
+        item["tool_calls"] = [{"name": tc["name"], "args": tc["args"]} for tc in tool_calls]
+    return item
+
+
+def prompt_hash(messages: Sequence[BaseMessage]) -> str:
+    """完整 prompt 的哈希（不含消息与工具调用 ID）"""
+    payload = json.dumps([_canonical(m) for m in messages], ensure_ascii=False, sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def turn_key(messages: Sequence[BaseMessage]) -> Optional[str]:
+    """最后一条用户消息 + 此后第几次调用模型 的哈希；没有用户消息时返回 None"""
+    for i in range(len(messages) - 1, -1, -1):
+        if isinstance(messages[i], HumanMessage):
+            step = sum(1 for m in messages[i + 1:] if isinstance(m, AIMessage))
+            return make_turn_key(_message_content(messages[i]), step)
+    return None
+
+
+def make_turn_key(question: str, step: int) -> str:
+    """
+    构造 turn_key（手工编写回放文件时使用）
+
+    Args:
+        question: 用户消息原文（图表 / 摘要等内部调用为其完整 prompt）
+        step: 该问题之后第几次调用模型（从 0 开始）
+    """
+    return hashlib.sha256(f"{question}\x00{step}".encode("utf-8")).hexdigest()
+
+
+class TraceStore:
+    """录制文件的内存索引（首次使用时加载，录制时追加写入）"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._by_prompt: dict[str, dict] = {}
+        self._by_turn: dict[str, dict] = {}
+        self._lock = threading.Lock()
+        self._loaded = False
+        self.hits = 0
+        self.turn_hits = 0
+        self.misses = 0
+
+    def _load_locked(self) -> None:
+        if self._loaded:
+            return
+        self._loaded = True
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, "r", encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if line:
+                    self._index(json.loads(line))
+
+    def _index(self, record: dict) -> None:
+        if record.get("prompt_hash"):
+            self._by_prompt[record["prompt_hash"]] = record
+        if record.get("turn_key"):
+            self._by_turn[record["turn_key"]] = record
+
+    def lookup(self, messages: Sequence[BaseMessage]) -> Optional[dict]:
+        """按 prompt_hash 精确匹配，未命中时按 turn_key 匹配"""
+        with self._lock:
+            self._load_locked()
+            record = self._by_prompt.get(prompt_hash(messages))
+            if record is not None:
+                self.hits += 1
+                return record
+            key = turn_key(messages)
+            record = self._by_turn.get(key) if key else None
+            if record is not None:
+                self.turn_hits += 1
+                return record
+            self.misses += 1
+            return None
+
+    def record(self, messages: Sequence[BaseMessage], message: BaseMessage) -> None:
+        """追加一条录制记录"""
+        record = {
+            "prompt_hash": prompt_hash(messages),
+            "turn_key": turn_key(messages),
+            "content": _message_content(message),
+            "tool_calls": [
+                {"name": tc["name"], "args": tc["args"]}
+                for tc in getattr(message, "tool_calls", None) or []
+            ],
+        }
+        with self._lock:
+            self._load_locked()
+            self._index(record)
+            dir_path = os.path.dirname(self.path)
+            if dir_path and not os.path.exists(dir_path):
+                os.makedirs(dir_path, exist_ok=True)
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "path": self.path,
+                "records": len(self._by_prompt),
+                "hits": self.hits,
+                "turn_hits": self.turn_hits,
+                "misses": self.misses,
+            }
+
+
+_store: Optional[TraceStore] = None
+_store_lock = threading.Lock()
+
+
+def get_trace_store() -> TraceStore:
+    """获取录制文件索引（路径相对 backend 目录）"""
+    global _store
+    with _store_lock:
+        if _store is None:
+            path = get_settings().LLM_TRACE_FILE
+            if not os.path.isabs(path):
+                backend_dir = os.path.dirname(os.path.dirname(os.path.dirname(__file__)))
+                path = os.path.join(backend_dir, path)
+            _store = TraceStore(path)
+        return _store
+
+
+def _replay_message(messages: Sequence[BaseMessage]) -> AIMessage:
+    record = get_trace_store().lookup(messages)
+    if record is None:
+        if get_settings().LLM_REPLAY_ON_MISS != "answer":
+            raise ValueError("回放模式：未找到与该 prompt 匹配的录制内容")
+        record = {"content": MISS_ANSWER, "tool_calls": []}
+    return AIMessage(
+        content=record.get("content") or "",
+        tool_calls=[
+            {"name": tc["name"], "args": tc["args"], "id": f"call_{uuid.uuid4().hex[:24]}"}
+            for tc in record.get("tool_calls") or []
+        ],
+    )
+
+
+def _chunks(message: AIMessage, chunk_chars: int) -> list[AIMessageChunk]:
+    """把回放的消息拆成流式分片：文本按 chunk_chars 切分，工具调用各一片"""
+    chunks = [
+        AIMessageChunk(content=message.content[i:i + chunk_chars])
+        for i in range(0, len(message.content), chunk_chars)
+    ]
+    for index, tc in enumerate(message.tool_calls):
+        chunks.append(AIMessageChunk(
+            content="",
+            tool_call_chunks=[{
+                "name": tc["name"],
+                "args": json.dumps(tc["args"], ensure_ascii=False),
+                "id": tc["id"],
+                "index": index,
+            }],
+        ))
+    return chunks or [AIMessageChunk(content="")]
+
+
+class ReplayChatModel(BaseChatModel):
+    """从录制文件回放输出的聊天模型（不访问网络）"""
+
+    # 与 ChatOpenAI 一致：为 True 时 invoke 也走流式接口
+    streaming: bool = False
+    # 首个分片前的延迟、分片间隔（毫秒），每个分片的字符数
+    latency_ms: int = 0
+    token_interval_ms: int = 0
+    chunk_chars: int = 4
+
+    @property
+    def _llm_type(self) -> str:
+        return "replay"
+
+    def bind_tools(self, tools: Sequence[Any], *, tool_choice: Optional[str] = None, **kwargs: Any):
+        # 工具调用来自录制内容，绑定的工具不影响输出
+        return self
+
+    def _generate(self, messages: list[BaseMessage], stop: Any = None, run_manager: Any = None, **kwargs: Any) -> ChatResult:
+        message = _replay_message(messages)
+        time.sleep((self.latency_ms + self.token_interval_ms * len(_chunks(message, self.chunk_chars))) / 1000)
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    async def _agenerate(self, messages: list[BaseMessage], stop: Any = None, run_manager: Any = None, **kwargs: Any) -> ChatResult:
+        message = _replay_message(messages)
+        await asyncio.sleep((self.latency_ms + self.token_interval_ms * len(_chunks(message, self.chunk_chars))) / 1000)
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    def _stream(self, messages: list[BaseMessage], stop: Any = None, run_manager: Any = None, **kwargs: Any) -> Iterator[ChatGenerationChunk]:
+        message = _replay_message(messages)
+        time.sleep(self.latency_ms / 1000)
+        for i, chunk in enumerate(_chunks(message, self.chunk_chars)):
+            if i:
+                time.sleep(self.token_interval_ms / 1000)
+            generation = ChatGenerationChunk(message=chunk)
+            if run_manager and chunk.content:
+                run_manager.on_llm_new_token(chunk.content, chunk=generation)
+            yield generation
+
+    async def _astream(self, messages: list[BaseMessage], stop: Any = None, run_manager: Any = None, **kwargs: Any) -> AsyncIterator[ChatGenerationChunk]:
+        message = _replay_message(messages)
+        await asyncio.sleep(self.latency_ms / 1000)
+        for i, chunk in enumerate(_chunks(message, self.chunk_chars)):
+            if i:
+                await asyncio.sleep(self.token_interval_ms / 1000)
+            generation = ChatGenerationChunk(message=chunk)
+            if run_manager and chunk.content:
+                await run_manager.on_llm_new_token(chunk.content, chunk=generation)
+            yield generation
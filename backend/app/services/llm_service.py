@@ -1,27 +1,427 @@
 """
 LLM 服务层 - Qwen3-max via DashScope OpenAI 兼容端点
 基于 playground/test_qwen3.py 实测验证
+- 进程内共用一组 httpx 客户端（keep-alive 连接池，安装 h2 时启用 HTTP/2），重复调用复用已建立的 TLS 连接
+- ChatOpenAI 实例按 (模型, 是否流式, temperature, 优先级) 缓存复用
+- LLM_PROVIDER：dashscope（默认）/ record（调用 DashScope 并录制）/ replay（按录制文件回放，不访问网络），见 llm_replay
+- LLM 网关：所有模型调用先在网关排队，受并发上限与每分钟请求数 / token 数（令牌桶）约束；
+  超出的调用按优先级（interactive 回答 > chart 图表 > background 摘要）、同级先到先得排队等待，不直接失败
 """
 
+import asyncio
+import heapq
+import importlib.util
+import itertools
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Any, AsyncIterator, Iterator, Optional
+
+import httpx
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import BaseMessage
+from langchain_core.outputs import ChatGenerationChunk, ChatResult
 from langchain_openai import ChatOpenAI
 from app.config import get_settings
+from app.services.context_budget import count_tokens
+from app.services.llm_replay import ReplayChatModel, get_trace_store
+
+# 优先级：数值越小越先调度
+PRIORITIES = {"interactive": 0, "chart": 1, "background": 2}
+
+# (provider, model, streaming, temperature, priority) -> ChatModel
+_llm_cache: dict[tuple[str, str, bool, float, str], BaseChatModel] = {}
+_http_client: Optional[httpx.Client] = None
+_async_http_client: Optional[httpx.AsyncClient] = None
+_lock = threading.Lock()
+
+
+def _client_options() -> dict:
+    """httpx 客户端参数：连接池上限、keep-alive 时长、超时、HTTP/2（需安装 h2）"""
+    settings = get_settings()
+    return {
+        "http2": settings.LLM_HTTP2 and importlib.util.find_spec("h2") is not None,
+        "limits": httpx.Limits(
+            max_connections=settings.LLM_MAX_CONNECTIONS,
+            max_keepalive_connections=settings.LLM_MAX_CONNECTIONS,
+            keepalive_expiry=settings.LLM_KEEPALIVE_EXPIRY,
+        ),
+        "timeout": httpx.Timeout(settings.LLM_TIMEOUT, connect=10.0),
+    }
+
+
+def _get_http_clients() -> tuple[httpx.Client, httpx.AsyncClient]:
+    """获取共用的同步 / 异步 httpx 客户端（调用方持有 _lock）"""
+    global _http_client, _async_http_client
+    if _http_client is None:
+        _http_client = httpx.Client(**_client_options())
+    if _async_http_client is None:
+        _async_http_client = httpx.AsyncClient(**_client_options())
+    return _http_client, _async_http_client
+
+
+# ==================== LLM 网关 ====================
+
+class _TokenBucket:
+    """每分钟 rate 个令牌的令牌桶（rate <= 0 表示不限）；允许透支，透支部分由后续补充抵消"""
+
+    def __init__(self, rate: int):
+        self.rate = rate
+        self.capacity = float(rate)
+        self.tokens = float(rate)
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float) -> None:
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate / 60)
+        self.updated = now
+
+    def wait_time(self, amount: float, now: float) -> float:
+        """取出 amount 个令牌还需等待的秒数（超过桶容量的请求等到桶满即可）"""
+        if self.rate <= 0:
+            return 0.0
+        self._refill(now)
+        need = min(amount, self.capacity) - self.tokens
+        return max(0.0, need * 60 / self.rate)
+
+    def take(self, amount: float) -> None:
+        """取出令牌（amount 为负时归还，不超过桶容量）"""
+        if self.rate > 0:
+            self.tokens = min(self.capacity, self.tokens - amount)
+
+
+@dataclass(order=True)
+class _Waiter:
+    priority: int
+    seq: int
+    cost: int = field(compare=False)
+    priority_name: str = field(compare=False)
+    enqueued_at: float = field(compare=False, default_factory=time.monotonic)
+    # 同步调用方等待 event，异步调用方等待 future（经 call_soon_threadsafe 唤醒）
+    event: Optional[threading.Event] = field(compare=False, default=None)
+    future: Optional[asyncio.Future] = field(compare=False, default=None)
+    loop: Optional[asyncio.AbstractEventLoop] = field(compare=False, default=None)
+    granted: bool = field(compare=False, default=False)
+    cancelled: bool = field(compare=False, default=False)
+
+
+class LLMGateway:
+    """LLM 调用的并发 / 速率限制与优先级调度（线程安全，同步与异步调用方共用）"""
+
+    def __init__(self, max_concurrency: int, rpm: int, tpm: int):
+        self.max_concurrency = max(1, max_concurrency)
+        self._requests = _TokenBucket(rpm)
+        self._tokens = _TokenBucket(tpm)
+        self._queue: list[_Waiter] = []
+        self._seq = itertools.count()
+        self._lock = threading.Lock()
+        self._timer: Optional[threading.Timer] = None
+        self._active = 0
+        self._stats = {name: {"granted": 0, "wait_seconds": 0.0, "max_wait_seconds": 0.0} for name in PRIORITIES}
+        self._rate_limited = 0
+        self._max_queue_depth = 0
+
+    def _enqueue(self, priority: str, cost: int, **wait: Any) -> _Waiter:
+        if priority not in PRIORITIES:
+            priority = "interactive"
+        waiter = _Waiter(PRIORITIES[priority], next(self._seq), cost, priority, **wait)
+        with self._lock:
+            heapq.heappush(self._queue, waiter)
+            self._max_queue_depth = max(self._max_queue_depth, len(self._queue))
+            self._dispatch_locked()
+        return waiter
+
+    def _dispatch_locked(self) -> None:
+        """按优先级放行队首请求，直到并发或速率受限；速率受限时定时重试"""
+        while self._queue:
+            head = self._queue[0]
+            if head.cancelled:
+                heapq.heappop(self._queue)
+                continue
+            if self._active >= self.max_concurrency:
+                return
+            now = time.monotonic()
+            delay = max(self._requests.wait_time(1, now), self._tokens.wait_time(head.cost, now))
+            if delay > 0:
+                self._rate_limited += 1
+                self._schedule_locked(delay)
+                return
+            heapq.heappop(self._queue)
+            self._requests.take(1)
+            self._tokens.take(head.cost)
+            self._active += 1
+            head.granted = True
+            waited = now - head.enqueued_at
+            stats = self._stats[head.priority_name]
+            stats["granted"] += 1
+            stats["wait_seconds"] += waited
+            stats["max_wait_seconds"] = max(stats["max_wait_seconds"], waited)
+            if head.event is not None:
+                head.event.set()
+            else:
+                head.loop.call_soon_threadsafe(_resolve, head.future)
+
+    def _schedule_locked(self, delay: float) -> None:
+        if self._timer is not None:
+            return
+
+        def _fire() -> None:
+            with self._lock:
+                self._timer = None
+                self._dispatch_locked()
+
+        self._timer = threading.Timer(delay, _fire)
+        self._timer.daemon = True
+        self._timer.start()
+
+    def acquire(self, priority: str, cost: int) -> None:
+        """同步获取调用许可（阻塞直到放行）"""
+        waiter = self._enqueue(priority, cost, event=threading.Event())
+        waiter.event.wait()
+
+    async def aacquire(self, priority: str, cost: int) -> None:
+        """异步获取调用许可；等待期间被取消时退出队列（已放行则归还）"""
+        loop = asyncio.get_running_loop()
+        waiter = self._enqueue(priority, cost, future=loop.create_future(), loop=loop)
+        try:
+            await waiter.future
+        except asyncio.CancelledError:
+            with self._lock:
+                waiter.cancelled = True
+                granted = waiter.granted
+            if granted:
+                self.release(0, 0)
+            raise
+
+    def release(self, estimated: int, actual: int) -> None:
+        """
+        归还调用许可
+
+        Args:
+            estimated: 放行时按估算扣除的 token 数
+            actual: 实际消耗的 token 数（未知时为 0，不做校正）
+        """
+        with self._lock:
+            self._active -= 1
+            if actual > 0:
+                self._tokens.take(actual - estimated)
+            self._dispatch_locked()
+
+    def stats(self) -> dict:
+        """队列深度、并发与等待时间统计"""
+        with self._lock:
+            depth = {name: 0 for name in PRIORITIES}
+            for waiter in self._queue:
+                if not waiter.cancelled:
+                    depth[waiter.priority_name] += 1
+            return {
+                "max_concurrency": self.max_concurrency,
+                "active": self._active,
+                "queue_depth": sum(depth.values()),
+                "queue_depth_by_priority": depth,
+                "max_queue_depth": self._max_queue_depth,
+                "rate_limited_waits": self._rate_limited,
+                "rpm_limit": self._requests.rate,
+                "tpm_limit": self._tokens.rate,
+                "priorities": {
+                    name: {
+                        "granted": s["granted"],
+                        "avg_wait_seconds": round(s["wait_seconds"] / s["granted"], 4) if s["granted"] else 0.0,
+                        "max_wait_seconds": round(s["max_wait_seconds"], 4),
+                    }
+                    for name, s in self._stats.items()
+                },
+            }
+
+
+def _resolve(future: asyncio.Future) -> None:
+    if not future.done():
+        future.set_result(None)
 
 
-def get_llm(streaming: bool = False) -> ChatOpenAI:
+_gateway: Optional[LLMGateway] = None
+
+
+def get_gateway() -> LLMGateway:
+    """获取进程级 LLM 网关（按 LLM_MAX_CONCURRENCY / LLM_RPM / LLM_TPM 懒加载）"""
+    global _gateway
+    with _lock:
+        if _gateway is None:
+            settings = get_settings()
+            _gateway = LLMGateway(settings.LLM_MAX_CONCURRENCY, settings.LLM_RPM, settings.LLM_TPM)
+        return _gateway
+
+
+def _estimate_cost(messages: list[BaseMessage]) -> int:
+    """放行前估算本次调用的 token 数（输入估算 + 预留输出）"""
+    return count_tokens(messages) + get_settings().LLM_OUTPUT_TOKEN_ESTIMATE
+
+
+def _usage_tokens(message: Any) -> int:
+    usage = getattr(message, "usage_metadata", None) or {}
+    return int(usage.get("total_tokens") or 0)
+
+
+class _GatewayMixin:
+    """模型调用经 LLM 网关调度（bind_tools 等包装后的调用同样经过网关）；子类声明 priority 字段"""
+
+    def _generate(self, messages: list[BaseMessage], *args: Any, **kwargs: Any) -> ChatResult:
+        gateway = get_gateway()
+        cost = _estimate_cost(messages)
+        gateway.acquire(self.priority, cost)
+        actual = 0
+        try:
+            result = super()._generate(messages, *args, **kwargs)
+            actual = sum(_usage_tokens(g.message) for g in result.generations)
+            return result
+        finally:
+            gateway.release(cost, actual)
+
+    async def _agenerate(self, messages: list[BaseMessage], *args: Any, **kwargs: Any) -> ChatResult:
+        gateway = get_gateway()
+        cost = _estimate_cost(messages)
+        await gateway.aacquire(self.priority, cost)
+        actual = 0
+        try:
+            result = await super()._agenerate(messages, *args, **kwargs)
+            actual = sum(_usage_tokens(g.message) for g in result.generations)
+            return result
+        finally:
+            gateway.release(cost, actual)
+
+    def _stream(self, messages: list[BaseMessage], *args: Any, **kwargs: Any) -> Iterator[ChatGenerationChunk]:
+        gateway = get_gateway()
+        cost = _estimate_cost(messages)
+        gateway.acquire(self.priority, cost)
+        actual = 0
+        try:
+            for chunk in super()._stream(messages, *args, **kwargs):
+                actual += _usage_tokens(chunk.message)
+                yield chunk
+        finally:
+            gateway.release(cost, actual)
+
+    async def _astream(
+        self, messages: list[BaseMessage], *args: Any, **kwargs: Any
+    ) -> AsyncIterator[ChatGenerationChunk]:
+        gateway = get_gateway()
+        cost = _estimate_cost(messages)
+        await gateway.aacquire(self.priority, cost)
+        actual = 0
+        try:
+            async for chunk in super()._astream(messages, *args, **kwargs):
+                actual += _usage_tokens(chunk.message)
+                yield chunk
+        finally:
+            gateway.release(cost, actual)
+
+
+class _RecordingMixin:
+    """把每次调用的 prompt 与完整输出写入录制文件（流式输出合并各分片后写入）"""
+
+    def _generate(self, messages: list[BaseMessage], *args: Any, **kwargs: Any) -> ChatResult:
+        result = super()._generate(messages, *args, **kwargs)
+        get_trace_store().record(messages, result.generations[0].message)
+        return result
+
+    async def _agenerate(self, messages: list[BaseMessage], *args: Any, **kwargs: Any) -> ChatResult:
+        result = await super()._agenerate(messages, *args, **kwargs)
+        get_trace_store().record(messages, result.generations[0].message)
+        return result
+
+    def _stream(self, messages: list[BaseMessage], *args: Any, **kwargs: Any) -> Iterator[ChatGenerationChunk]:
+        merged = None
+        for chunk in super()._stream(messages, *args, **kwargs):
+            merged = chunk if merged is None else merged + chunk
+            yield chunk
+        if merged is not None:
+            get_trace_store().record(messages, merged.message)
+
+    async def _astream(
+        self, messages: list[BaseMessage], *args: Any, **kwargs: Any
+    ) -> AsyncIterator[ChatGenerationChunk]:
+        merged = None
+        async for chunk in super()._astream(messages, *args, **kwargs):
+            merged = chunk if merged is None else merged + chunk
+            yield chunk
+        if merged is not None:
+            get_trace_store().record(messages, merged.message)
+
+
+class GatedChatOpenAI(_GatewayMixin, ChatOpenAI):
+    """经 LLM 网关调度的 ChatOpenAI"""
+
+    priority: str = "interactive"
+
+
+class RecordingChatOpenAI(_GatewayMixin, _RecordingMixin, ChatOpenAI):
+    """经 LLM 网关调度、并录制每次调用的 ChatOpenAI（LLM_PROVIDER=record）"""
+
+    priority: str = "interactive"
+
+
+class GatedReplayChatModel(_GatewayMixin, ReplayChatModel):
+    """经 LLM 网关调度的回放模型（LLM_PROVIDER=replay，网关限流与排队行为与线上一致）"""
+
+    priority: str = "interactive"
+
+
+def get_llm(
+    streaming: bool = False,
+    temperature: Optional[float] = None,
+    priority: str = "interactive",
+) -> BaseChatModel:
     """
-    获取 Qwen3-max LLM 实例
+    获取 Qwen3-max LLM 实例（按参数缓存，共用连接池，调用经 LLM 网关调度）
 
     Args:
         streaming: 是否启用流式输出
+        temperature: 采样温度，为 None 时使用 LLM_TEMPERATURE
+        priority: 网关优先级 interactive（回答）/ chart（图表生成）/ background（摘要等后台任务）
 
     Returns:
-        ChatOpenAI 实例，已配置 DashScope 兼容端点
+        ChatOpenAI 实例，已配置 DashScope 兼容端点；LLM_PROVIDER=replay 时为回放模型
     """
     settings = get_settings()
-    return ChatOpenAI(
-        model=settings.LLM_MODEL_NAME,
-        api_key=settings.DASHSCOPE_API_KEY,
-        base_url=settings.LLM_BASE_URL,
-        streaming=streaming,
-        temperature=settings.LLM_TEMPERATURE,
-    )
+    if temperature is None:
+        temperature = settings.LLM_TEMPERATURE
+    provider = settings.LLM_PROVIDER
+    key = (provider, settings.LLM_MODEL_NAME, streaming, temperature, priority)
+    with _lock:
+        llm = _llm_cache.get(key)
+        if llm is None:
+            if provider == "replay":
+                llm = GatedReplayChatModel(
+                    streaming=streaming,
+                    latency_ms=settings.LLM_REPLAY_LATENCY_MS,
+                    token_interval_ms=settings.LLM_REPLAY_TOKEN_INTERVAL_MS,
+                    chunk_chars=settings.LLM_REPLAY_CHUNK_CHARS,
+                    priority=priority,
+                )
+            else:
+                http_client, async_http_client = _get_http_clients()
+                llm_class = RecordingChatOpenAI if provider == "record" else GatedChatOpenAI
+                llm = llm_class(
+                    model=settings.LLM_MODEL_NAME,
+                    api_key=settings.DASHSCOPE_API_KEY,
+                    base_url=settings.LLM_BASE_URL,
+                    streaming=streaming,
+                    temperature=temperature,
+                    http_client=http_client,
+                    http_async_client=async_http_client,
+                    priority=priority,
+                )
+            _llm_cache[key] = llm
+        return llm
+
+
+async def close_llm_clients() -> None:
+    """关闭共用的 httpx 客户端并清空实例缓存（应用关闭时调用）"""
+    global _http_client, _async_http_client
+    with _lock:
+        http_client, async_http_client = _http_client, _async_http_client
+        _http_client = _async_http_client = None
+        _llm_cache.clear()
+    if http_client is not None:
+        http_client.close()
+    if async_http_client is not None:
+        await async_http_client.aclose()
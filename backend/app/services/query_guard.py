@@ -0,0 +1,128 @@
+"""
+查询取消
+- QueryGuard 记录一次请求 / 一次 Agent 运行当前正在执行查询的 MySQL 线程 ID
+  （Agent 经 config["configurable"]["query_guard"] 传给 sql_db_query 工具）
+- 客户端断开或 Agent 运行中止时 cancel()：另开一个直连连接执行 KILL QUERY，中止服务端查询
+- 建立 KILL 用的连接时不持有锁（不阻塞查询线程的 attach / detach）；
+  KILL 前在锁内确认仍是同一次 attach，连接归还连接池后不会误杀其他请求的查询
+"""
+
+import asyncio
+import logging
+import threading
+from typing import Any, Callable, Optional, TypeVar
+
+import pymysql
+from fastapi import HTTPException, Request
+
+from app.services import connection_service
+
+logger = logging.getLogger(__name__)
+
+# 等待查询期间检测客户端断开的间隔（秒）
+DISCONNECT_POLL_INTERVAL = 0.5
+
+T = TypeVar("T")
+
+
+class QueryCancelledError(Exception):
+    """查询在开始前已被取消"""
+
+
+class QueryGuard:
+    """一次请求内可被 KILL QUERY 中止的查询"""
+
+    def __init__(self, connection_id: str):
+        self.connection_id = connection_id
+        self.cancelled = False
+        self._thread_id: Optional[int] = None
+        # 每次 attach 递增，KILL 前据此确认登记的仍是同一次查询
+        self._attach_seq = 0
+        self._lock = threading.Lock()
+
+    def attach(self, conn: Any) -> None:
+        """
+        登记即将执行查询的连接（pymysql 连接或连接池代理）
+
+        Raises:
+            QueryCancelledError: 已被取消
+        """
+        raw = getattr(conn, "dbapi_connection", conn)
+        # 非 MySQL 驱动（如测试用 SQLite）没有线程 ID，只做取消检查
+        thread_id = getattr(raw, "thread_id", None)
+        with self._lock:
+            if self.cancelled:
+                raise QueryCancelledError("查询已取消")
+            self._thread_id = thread_id() if callable(thread_id) else None
+            self._attach_seq += 1
+
+    def detach(self) -> None:
+        """查询结束（连接归还前调用）"""
+        with self._lock:
+            self._thread_id = None
+
+    def cancel(self) -> None:
+        """标记取消并中止正在执行的查询（阻塞调用，应在线程中执行）"""
+        with self._lock:
+            self.cancelled = True
+            thread_id, seq = self._thread_id, self._attach_seq
+        if thread_id is None:
+            return
+        try:
+            conn = connection_service.open_direct_connection(self.connection_id)
+        except pymysql.Error as e:
+            logger.debug("KILL QUERY %s failed: %s", thread_id, e)
+            return
+        if conn is None:
+            return
+        try:
+            with self._lock:
+                # 建立连接期间查询已结束，连接可能已被其他请求复用
+                if self._thread_id != thread_id or self._attach_seq != seq:
+                    return
+                cursor = conn.cursor()
+                cursor.execute(f"KILL QUERY {int(thread_id)}")
+                cursor.close()
+        except pymysql.Error as e:
+            # 查询可能已结束（Unknown thread id），忽略
+            logger.debug("KILL QUERY %s failed: %s", thread_id, e)
+        finally:
+            conn.close()
+
+    def cancel_in_background(self) -> None:
+        """在后台线程中取消（用于不能 await 的清理路径）"""
+        with self._lock:
+            if self._thread_id is None:
+                self.cancelled = True
+                return
+        threading.Thread(target=self.cancel, name="query-kill", daemon=True).start()
+
+
+async def run_until_disconnected(
+    request: Request,
+    guard: QueryGuard,
+    func: Callable[..., T],
+    *args: Any,
+) -> T:
+    """
+    在数据库访问线程池执行 func，期间客户端断开则 KILL 正在执行的查询
+
+    Raises:
+        HTTPException(499): 客户端已断开
+    """
+    task = asyncio.ensure_future(connection_service.run_db(func, *args))
+    try:
+        while True:
+            done, _ = await asyncio.wait({task}, timeout=DISCONNECT_POLL_INTERVAL)
+            if done:
+                return task.result()
+            if await request.is_disconnected():
+                break
+    except asyncio.CancelledError:
+        guard.cancel_in_background()
+        raise
+
+    await asyncio.to_thread(guard.cancel)
+    # 查询被中止后的异常无人接收，避免 "exception was never retrieved" 日志
+    task.add_done_callback(lambda t: t.cancelled() or t.exception())
+    raise HTTPException(status_code=499, detail="客户端已断开，查询已取消")
@@ -0,0 +1,510 @@
+"""
+SQL 工作台查询结果缓存
+- 首次查询只执行一次：结果物化（最多 QUERY_CACHE_MAX_ROWS 行）并登记为结果句柄（query_handle）
+- 后续翻页与总行数直接从句柄读取，不再执行 COUNT(*) 与 LIMIT/OFFSET
+- 结果超过物化上限时，总行数按 count_mode 精确计算（仅一次，缓存在句柄上）或用 EXPLAIN 估算，
+  超出物化范围的页回退为 LIMIT/OFFSET 查询
+- 句柄按 TTL 过期，按 LRU 淘汰
+- 键集分页（keyset）：按排序键 WHERE (k1, k2) > (...) 定位下一页，续页令牌由上一页末行的键值编码。
+  单表简单查询时条件直接并入原查询的 WHERE（可走索引，深页与首页代价相同）；
+  含 GROUP BY / DISTINCT / LIMIT / 窗口函数等无法下推时回退为派生表过滤（深页开销随位置增长），
+  并在结果中标记 pushdown=False
+"""
+
+import base64
+import datetime
+import hashlib
+import json
+import re
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from decimal import Decimal
+from typing import Any, Optional
+
+from app.config import get_settings
+from app.services import schema_service
+
+
+@dataclass
+class ResultHandle:
+    """一次查询的物化结果"""
+    handle: str
+    connection_id: str
+    sql: str
+    columns: list[str]
+    rows: list[list[Any]]
+    # rows 是否为完整结果（未触及物化上限）
+    complete: bool
+    # 总行数；complete 时为 len(rows)，否则按需计算后缓存
+    total_count: Optional[int] = None
+    count_estimated: bool = False
+    created_at: float = field(default_factory=time.time)
+    last_access: float = field(default_factory=time.time)
+
+
+# handle -> ResultHandle（按最近访问排序）
+_handles: "OrderedDict[str, ResultHandle]" = OrderedDict()
+_lock = threading.Lock()
+
+
+def _evict_expired(now: float) -> None:
+    ttl = get_settings().QUERY_CACHE_TTL
+    for key in [k for k, h in _handles.items() if now - h.last_access >= ttl]:
+        _handles.pop(key, None)
+
+
+def get_handle(handle: str, connection_id: str, sql: str) -> Optional[ResultHandle]:
+    """
+    获取未过期的结果句柄（连接与 SQL 需一致，否则视为失效）
+
+    Args:
+        handle: 句柄 ID
+        connection_id: 连接 ID
+        sql: 查询语句
+    """
+    now = time.time()
+    with _lock:
+        _evict_expired(now)
+        entry = _handles.get(handle)
+        if entry is None or entry.connection_id != connection_id or entry.sql != sql:
+            return None
+        entry.last_access = now
+        _handles.move_to_end(handle)
+        return entry
+
+
+def open_result(conn, connection_id: str, sql: str) -> ResultHandle:
+    """
+    执行查询（仅一次）并登记结果句柄
+
+    Args:
+        conn: DB-API 连接
+        connection_id: 连接 ID
+        sql: 已校验的 SELECT 语句
+
+    Raises:
+        pymysql.Error: SQL 执行失败
+    """
+    settings = get_settings()
+    max_rows = settings.QUERY_CACHE_MAX_ROWS
+    cursor = conn.cursor()
+    try:
+        cursor.execute(f"SELECT * FROM ({sql}) AS _paged_subquery LIMIT {max_rows + 1}")
+        rows = [list(row) for row in cursor.fetchall()]
+        columns = [desc[0] for desc in cursor.description] if cursor.description else []
+    finally:
+        cursor.close()
+
+    complete = len(rows) <= max_rows
+    entry = ResultHandle(
+        handle=uuid.uuid4().hex,
+        connection_id=connection_id,
+        sql=sql,
+        columns=columns,
+        rows=rows[:max_rows],
+        complete=complete,
+        total_count=len(rows) if complete else None,
+    )
+    with _lock:
+        _evict_expired(entry.created_at)
+        _handles[entry.handle] = entry
+        while len(_handles) > settings.QUERY_CACHE_MAX_ENTRIES:
+            _handles.popitem(last=False)
+    return entry
+
+
+def ensure_count(conn, entry: ResultHandle, count_mode: str) -> None:
+    """
+    为未完整物化的结果计算总行数（结果缓存在句柄上，仅计算一次）
+
+    Args:
+        conn: DB-API 连接
+        entry: 结果句柄
+        count_mode: exact（COUNT(*)）/ estimate（EXPLAIN 估算）
+
+    Raises:
+        pymysql.Error: SQL 执行失败
+    """
+    if entry.total_count is not None and not (entry.count_estimated and count_mode == "exact"):
+        return
+
+    cursor = conn.cursor()
+    try:
+        if count_mode == "estimate":
+            cursor.execute(f"EXPLAIN SELECT * FROM ({entry.sql}) AS _count_subquery")
+            names = [desc[0].lower() for desc in cursor.description]
+            explain_rows = cursor.fetchall()
+            idx = names.index("rows") if "rows" in names else None
+            estimate = explain_rows[0][idx] if idx is not None and explain_rows and explain_rows[0][idx] else 0
+            entry.total_count = max(int(estimate), len(entry.rows))
+            entry.count_estimated = True
+        else:
+            cursor.execute(f"SELECT COUNT(*) FROM ({entry.sql}) AS _count_subquery")
+            entry.total_count = cursor.fetchone()[0]
+            entry.count_estimated = False
+    finally:
+        cursor.close()
+
+
+def get_page(entry: ResultHandle, page: int, page_size: int, conn=None) -> list[list[Any]]:
+    """
+    读取指定页；物化范围内直接切片，超出时回退为 LIMIT/OFFSET 查询
+
+    Args:
+        entry: 结果句柄
+        page: 页码（从 1 开始）
+        page_size: 每页条数
+        conn: DB-API 连接，仅在未完整物化时需要
+
+    Raises:
+        pymysql.Error: 回退查询执行失败
+    """
+    offset = (page - 1) * page_size
+    if entry.complete or offset + page_size <= len(entry.rows):
+        return entry.rows[offset:offset + page_size]
+
+    cursor = conn.cursor()
+    try:
+        cursor.execute(
+            f"SELECT * FROM ({entry.sql}) AS _paged_subquery LIMIT {page_size} OFFSET {offset}"
+        )
+        return [list(row) for row in cursor.fetchall()]
+    finally:
+        cursor.close()
+
+
+def close_handle(handle: str) -> bool:
+    """主动释放结果句柄"""
+    with _lock:
+        return _handles.pop(handle, None) is not None
+
+
+# ==================== 键集分页 ====================
+
+# 仅对单表查询推断主键作为排序键（多表 JOIN / UNION 时主键不再唯一）
+_FROM_TABLE = re.compile(r"\bFROM\s+`?(\w+)`?", re.IGNORECASE)
+_MULTI_SOURCE = re.compile(r"\b(JOIN|UNION)\b|\bFROM\s+`?\w+`?\s*(?:AS\s+\w+\s*)?,", re.IGNORECASE)
+
+
+@dataclass
+class KeysetPage:
+    """键集分页的一页结果"""
+    columns: list[str]
+    rows: list[list[Any]]
+    key_columns: list[str]
+    next_cursor: Optional[str]
+    # 排序键条件是否并入原查询（False 时为派生表过滤，深页开销随位置增长）
+    pushdown: bool = True
+
+
+def _quote(name: str) -> str:
+    return "`" + name.replace("`", "``") + "`"
+
+
+def _query_signature(sql: str, key_columns: list[str]) -> str:
+    """SQL 与排序键的摘要，防止令牌被用于其他查询"""
+    digest = hashlib.sha1((sql + "\0" + ",".join(key_columns)).encode("utf-8"))
+    return digest.hexdigest()[:16]
+
+
+def _encode_value(value: Any) -> list:
+    """键值编码为 [类型, 值]，解码时还原类型（datetime / Decimal / bytes 等经 JSON 会丢失类型）"""
+    if value is None or isinstance(value, (bool, int, float, str)):
+        return ["", value]
+    if isinstance(value, Decimal):
+        return ["decimal", str(value)]
+    if isinstance(value, datetime.datetime):
+        return ["datetime", value.isoformat()]
+    if isinstance(value, datetime.date):
+        return ["date", value.isoformat()]
+    if isinstance(value, datetime.time):
+        return ["time", value.isoformat()]
+    if isinstance(value, datetime.timedelta):
+        # pymysql 将 TIME 列读为 timedelta
+        return ["timedelta", [value.days, value.seconds, value.microseconds]]
+    if isinstance(value, (bytes, bytearray)):
+        return ["bytes", base64.b64encode(value).decode("ascii")]
+    return ["", str(value)]
+
+
+_VALUE_DECODERS = {
+    "": lambda v: v,
+    "decimal": Decimal,
+    "datetime": datetime.datetime.fromisoformat,
+    "date": datetime.date.fromisoformat,
+    "time": datetime.time.fromisoformat,
+    "timedelta": lambda v: datetime.timedelta(days=v[0], seconds=v[1], microseconds=v[2]),
+    "bytes": base64.b64decode,
+}
+
+
+def _decode_value(item: Any) -> Any:
+    """
+    还原 _encode_value 编码的键值
+
+    Raises:
+        ValueError: 编码格式无效
+    """
+    try:
+        kind, value = item
+        return _VALUE_DECODERS[kind](value)
+    except (KeyError, TypeError, IndexError, ArithmeticError) as e:
+        raise ValueError(str(e))
+
+
+def encode_cursor(sql: str, key_columns: list[str], values: list[Any]) -> str:
+    """将末行键值（带类型）编码为不透明的续页令牌"""
+    payload = {
+        "s": _query_signature(sql, key_columns),
+        "k": key_columns,
+        "v": [_encode_value(v) for v in values],
+    }
+    raw = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_cursor(token: str, sql: str) -> tuple[list[str], list[Any]]:
+    """
+    解析续页令牌
+
+    Returns:
+        (排序键列名, 末行键值)
+
+    Raises:
+        ValueError: 令牌无效或不属于当前查询
+    """
+    try:
+        raw = base64.urlsafe_b64decode(token + "=" * (-len(token) % 4))
+        payload = json.loads(raw)
+        key_columns = list(payload["k"])
+        values = [_decode_value(item) for item in payload["v"]]
+    except (ValueError, KeyError, TypeError):
+        raise ValueError("无效的续页令牌")
+    if payload.get("s") != _query_signature(sql, key_columns) or len(key_columns) != len(values):
+        raise ValueError("续页令牌与当前查询不匹配")
+    return key_columns, values
+
+
+def _source_table(connection_id: str, sql: str):
+    """单表查询的表结构（TableInfo），多表或无法识别时返回 None（只看顶层，忽略子查询中的表）"""
+    masked = _mask_nested(sql)
+    if _MULTI_SOURCE.search(masked):
+        return None
+    match = _FROM_TABLE.search(masked)
+    snapshot = schema_service.get_schema(connection_id)
+    if match is None or snapshot is None:
+        return None
+    return snapshot.table_map().get(match.group(1))
+
+
+def infer_key_columns(connection_id: str, sql: str) -> list[str]:
+    """
+    推断排序键：单表查询时使用该表主键
+
+    Returns:
+        主键列名列表，无法推断时返回空列表
+    """
+    table = _source_table(connection_id, sql)
+    if table is None:
+        return []
+    return [col.name for col in table.columns if col.primary_key]
+
+
+# 顶层出现以下子句时，排序键条件不能并入原查询的 WHERE（会改变结果集或分组 / 截取语义）
+_NOT_PUSHABLE = re.compile(
+    r"\b(GROUP\s+BY|HAVING|DISTINCT|LIMIT|UNION|OVER|WINDOW|INTO|FOR\s+UPDATE|LOCK\s+IN)\b",
+    re.IGNORECASE,
+)
+_SELECT = re.compile(r"^\s*SELECT\b", re.IGNORECASE)
+_FROM = re.compile(r"\bFROM\b", re.IGNORECASE)
+_WHERE = re.compile(r"\bWHERE\b", re.IGNORECASE)
+_FROM_NAME = re.compile(r"\s+`?\w")
+_ORDER_BY = re.compile(r"\bORDER\s+BY\b", re.IGNORECASE)
+_ORDER_ITEM = re.compile(r"^`?(\w+)`?(?:\s+ASC)?$", re.IGNORECASE)
+
+
+def _mask_nested(sql: str) -> str:
+    """把字符串字面量、注释与括号内的内容替换为空格（长度不变，引号与括号保留），便于只匹配顶层子句"""
+    out = []
+    depth = 0
+    i, n = 0, len(sql)
+    while i < n:
+        ch = sql[i]
+        if ch in ("'", '"', "`"):
+            j = i + 1
+            while j < n and sql[j] != ch:
+                j += 2 if sql[j] == "\\" and ch != "`" else 1
+            end = min(j + 1, n)
+            # 顶层标识符原样保留（ORDER BY 比对需要），字面量只保留引号
+            if ch == "`" and depth == 0:
+                out.append(sql[i:end])
+            else:
+                out.append(ch + " " * (end - i - 2) + sql[end - 1] if end - i >= 2 else ch)
+            i = end
+            continue
+        if sql.startswith("/*", i):
+            end = sql.find("*/", i + 2)
+            end = n if end < 0 else end + 2
+        elif sql.startswith("--", i) or ch == "#":
+            end = sql.find("\n", i)
+            end = n if end < 0 else end
+        else:
+            if ch == ")":
+                depth = max(depth - 1, 0)
+            out.append(ch if depth == 0 or ch in "()" else " ")
+            if ch == "(":
+                depth += 1
+            i += 1
+            continue
+        out.append(" " * (end - i))
+        i = end
+    return "".join(out)
+
+
+def _escape_percent(sql: str) -> str:
+    """带参数执行（pymysql 以 % 格式化）时转义 SQL 中的 %"""
+    return sql.replace("%", "%%")
+
+
+def _pushdown_query(
+    sql: str,
+    source_columns: set[str],
+    key_columns: list[str],
+    page_size: int,
+    after: Optional[list[Any]],
+) -> Optional[tuple[str, Optional[tuple]]]:
+    """
+    把排序键条件并入原查询：WHERE (keys) > (...) [AND (原条件)] ORDER BY keys LIMIT n+1
+
+    Args:
+        sql: 已校验的 SELECT 语句
+        source_columns: 单表查询的表列名（排序键须为表中的列，WHERE 中才能直接引用）
+        key_columns: 排序键列名
+        page_size: 每页条数
+        after: 上一页末行的键值
+
+    Returns:
+        (SQL, 参数)；无法下推时返回 None
+    """
+    masked = _mask_nested(sql)
+    # 去掉末尾的注释与分号（其后拼接的条件不能落入注释中）
+    masked = masked.rstrip().rstrip(";").rstrip()
+    sql = sql[:len(masked)]
+    from_match = _FROM.search(masked)
+    if (
+        _SELECT.match(masked) is None
+        or from_match is None
+        # FROM 后须直接为表名（派生表内的列可能已改名）
+        or _FROM_NAME.match(masked, from_match.end()) is None
+        or _NOT_PUSHABLE.search(masked)
+        or any(k not in source_columns for k in key_columns)
+    ):
+        return None
+    # 结果列中的同名别名会让 WHERE（表列）与 ORDER BY（别名）引用不同的值
+    select_list = masked[:from_match.start()]
+    if any(re.search(rf"\bAS\s+`?{re.escape(k)}`?(?=\W|$)", select_list, re.IGNORECASE) for k in key_columns):
+        return None
+
+    end = len(sql)
+    order = _ORDER_BY.search(masked)
+    if order is not None:
+        # 原查询已按排序键升序排列时可替换，否则下推会改变排序语义
+        items = [_ORDER_ITEM.match(item.strip()) for item in masked[order.end():].split(",")]
+        if [item.group(1) if item else None for item in items] != key_columns:
+            return None
+        end = order.start()
+    body = sql[:len(masked[:end].rstrip())]
+
+    keys = ", ".join(_quote(k) for k in key_columns)
+    params = None
+    if after is not None:
+        condition = f"({keys}) > ({', '.join(['%s'] * len(after))})"
+        where = _WHERE.search(masked[:end])
+        # 先按 WHERE 位置切分再转义 %（带参数执行时需转义，如 LIKE '%x%'、DATE_FORMAT(..., '%Y')）
+        if where is None:
+            body = f"{_escape_percent(body)} WHERE {condition}"
+        else:
+            head, rest = body[:where.start()], body[where.end():].strip()
+            body = f"{_escape_percent(head)}WHERE {condition} AND ({_escape_percent(rest)})"
+        params = tuple(after)
+    return f"{body} ORDER BY {keys} LIMIT {page_size + 1}", params
+
+
+def _check_key_columns(key_columns: list[str], columns: list[str]) -> None:
+    missing = [k for k in key_columns if k not in columns]
+    if missing:
+        raise ValueError(f"排序键 {missing} 不在查询结果列中")
+
+
+def fetch_keyset_page(
+    conn,
+    connection_id: str,
+    sql: str,
+    key_columns: list[str],
+    page_size: int,
+    after: Optional[list[Any]] = None,
+) -> KeysetPage:
+    """
+    按排序键读取一页（条件优先并入原查询，无法下推时按派生表过滤）
+
+    Args:
+        conn: DB-API 连接
+        connection_id: 连接 ID（读取单表查询的表结构）
+        sql: 已校验的 SELECT 语句
+        key_columns: 排序键列名（组合需唯一，且均出现在结果列中）
+        page_size: 每页条数
+        after: 上一页末行的键值，为 None 时读取第一页
+
+    Raises:
+        ValueError: 排序键不在结果列中
+        pymysql.Error: SQL 执行失败
+    """
+    table = _source_table(connection_id, sql)
+    pushed = None
+    if table is not None:
+        pushed = _pushdown_query(sql, {col.name for col in table.columns}, key_columns, page_size, after)
+
+    cursor = conn.cursor()
+    try:
+        if pushed is None:
+            # 先取结果列，校验排序键（同时避免把未校验的列名拼入 SQL）
+            cursor.execute(f"SELECT * FROM ({sql}) AS _keyset_subquery LIMIT 0")
+            columns = [desc[0] for desc in cursor.description] if cursor.description else []
+            cursor.fetchall()
+            _check_key_columns(key_columns, columns)
+
+            keys = ", ".join(_quote(k) for k in key_columns)
+            source, where, params = sql, "", None
+            if after is not None:
+                placeholders = ", ".join(["%s"] * len(after))
+                source = _escape_percent(sql)
+                where = f" WHERE ({keys}) > ({placeholders})"
+                params = tuple(after)
+            cursor.execute(
+                f"SELECT * FROM ({source}) AS _keyset_subquery{where} ORDER BY {keys} LIMIT {page_size + 1}",
+                params,
+            )
+        else:
+            # 排序键均为表中的列，可直接拼入 SQL；仍需出现在结果列中才能生成续页令牌
+            cursor.execute(*pushed)
+            columns = [desc[0] for desc in cursor.description] if cursor.description else []
+            _check_key_columns(key_columns, columns)
+        rows = [list(row) for row in cursor.fetchall()]
+    finally:
+        cursor.close()
+
+    next_cursor = None
+    if len(rows) > page_size:
+        rows = rows[:page_size]
+        indexes = [columns.index(k) for k in key_columns]
+        next_cursor = encode_cursor(sql, key_columns, [rows[-1][i] for i in indexes])
+    return KeysetPage(
+        columns=columns,
+        rows=rows,
+        key_columns=key_columns,
+        next_cursor=next_cursor,
+        pushdown=pushed is not None,
+    )
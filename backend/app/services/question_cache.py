@@ -0,0 +1,196 @@
+"""
+问题 → SQL 缓存
+- 键：connection_id + schema 指纹 + 归一化问题（NFKC、小写、去空白与标点）
+- 精确匹配优先；QUESTION_CACHE_SIMILARITY > 0 时再按字符 bigram 的 Jaccard 相似度做近似匹配
+- 条目按 TTL 过期、按 LRU 淘汰；统计命中率供观测
+- schema 指纹变化后旧条目自然失配（不会用旧表结构下生成的 SQL 回答新问题）
+"""
+
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Optional
+
+from app.config import get_settings
+
+
+@dataclass
+class CachedQuestion:
+    """一条缓存的问题与其 SQL"""
+    connection_id: str
+    fingerprint: str
+    question: str
+    normalized: str
+    sql: str
+    bigrams: frozenset[str]
+    created_at: float = field(default_factory=time.time)
+    last_access: float = field(default_factory=time.time)
+    hits: int = 0
+
+
+@dataclass
+class CacheStats:
+    lookups: int = 0
+    exact_hits: int = 0
+    similar_hits: int = 0
+    stores: int = 0
+    evictions: int = 0
+    replay_failures: int = 0
+
+    def to_dict(self) -> dict:
+        hits = self.exact_hits + self.similar_hits
+        return {
+            "lookups": self.lookups,
+            "hits": hits,
+            "exact_hits": self.exact_hits,
+            "similar_hits": self.similar_hits,
+            "misses": self.lookups - hits,
+            "hit_rate": round(hits / self.lookups, 4) if self.lookups else 0.0,
+            "stores": self.stores,
+            "evictions": self.evictions,
+            "replay_failures": self.replay_failures,
+        }
+
+
+# (connection_id, fingerprint, normalized) -> CachedQuestion（按最近访问排序）
+_entries: "OrderedDict[tuple[str, str, str], CachedQuestion]" = OrderedDict()
+_stats = CacheStats()
+_lock = threading.Lock()
+
+
+def normalize_question(question: str) -> str:
+    """归一化问题文本：全半角统一、小写、去除空白与标点"""
+    text = unicodedata.normalize("NFKC", question).lower()
+    return "".join(
+        ch for ch in text
+        if not ch.isspace() and not unicodedata.category(ch).startswith("P")
+    )
+
+
+def _bigrams(text: str) -> frozenset[str]:
+    if len(text) < 2:
+        return frozenset([text]) if text else frozenset()
+    return frozenset(text[i:i + 2] for i in range(len(text) - 1))
+
+
+def _similarity(a: frozenset[str], b: frozenset[str]) -> float:
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+
+def _evict_expired(now: float) -> None:
+    ttl = get_settings().QUESTION_CACHE_TTL
+    expired = [k for k, e in _entries.items() if now - e.created_at >= ttl]
+    for key in expired:
+        del _entries[key]
+    _stats.evictions += len(expired)
+
+
+def lookup(connection_id: str, fingerprint: str, question: str) -> Optional[CachedQuestion]:
+    """
+    查找缓存的 SQL
+
+    Args:
+        connection_id: 连接 ID
+        fingerprint: 当前 schema 指纹
+        question: 用户问题（原文）
+
+    Returns:
+        命中的缓存条目，未命中返回 None
+    """
+    normalized = normalize_question(question)
+    threshold = get_settings().QUESTION_CACHE_SIMILARITY
+    now = time.time()
+    with _lock:
+        _stats.lookups += 1
+        _evict_expired(now)
+
+        key = (connection_id, fingerprint, normalized)
+        entry = _entries.get(key)
+        if entry is not None:
+            _stats.exact_hits += 1
+        elif threshold > 0:
+            grams = _bigrams(normalized)
+            best, best_score = None, threshold
+            for candidate in _entries.values():
+                if candidate.connection_id != connection_id or candidate.fingerprint != fingerprint:
+                    continue
+                score = _similarity(grams, candidate.bigrams)
+                if score >= best_score:
+                    best, best_score = candidate, score
+            entry = best
+            if entry is not None:
+                _stats.similar_hits += 1
+                key = (entry.connection_id, entry.fingerprint, entry.normalized)
+
+        if entry is None:
+            return None
+        entry.hits += 1
+        entry.last_access = now
+        _entries.move_to_end(key)
+        return entry
+
+
+def store(connection_id: str, fingerprint: str, question: str, sql: str) -> None:
+    """
+    记录问题与成功执行的 SQL
+
+    Args:
+        connection_id: 连接 ID
+        fingerprint: 生成 SQL 时的 schema 指纹
+        question: 用户问题（原文）
+        sql: Agent 最终执行成功的 SQL
+    """
+    normalized = normalize_question(question)
+    if not normalized:
+        return
+    entry = CachedQuestion(
+        connection_id=connection_id,
+        fingerprint=fingerprint,
+        question=question,
+        normalized=normalized,
+        sql=sql,
+        bigrams=_bigrams(normalized),
+    )
+    with _lock:
+        key = (connection_id, fingerprint, normalized)
+        _entries[key] = entry
+        _entries.move_to_end(key)
+        _stats.stores += 1
+        max_entries = get_settings().QUESTION_CACHE_MAX_ENTRIES
+        while len(_entries) > max_entries:
+            _entries.popitem(last=False)
+            _stats.evictions += 1
+
+
+def discard(entry: CachedQuestion) -> None:
+    """丢弃重放失败的条目（SQL 已不可执行）"""
+    with _lock:
+        _entries.pop((entry.connection_id, entry.fingerprint, entry.normalized), None)
+        _stats.replay_failures += 1
+
+
+def invalidate(connection_id: Optional[str] = None) -> None:
+    """
+    清除缓存
+
+    Args:
+        connection_id: 指定连接 ID，为 None 时清除所有条目
+    """
+    with _lock:
+        if connection_id is None:
+            _entries.clear()
+            return
+        for key in [k for k in _entries if k[0] == connection_id]:
+            del _entries[key]
+
+
+def get_stats() -> dict:
+    """命中率等统计"""
+    with _lock:
+        stats = _stats.to_dict()
+        stats["entries"] = len(_entries)
+    return stats
@@ -0,0 +1,161 @@
+"""
+资源注册表
+按键缓存重量级资源（连接池、Agent 等），数量上限按 LRU 淘汰，超过空闲时间的条目在访问或定期清理时淘汰；
+条目移除时回调 on_evict 释放资源（如 Engine.dispose），并通知订阅者做关联缓存的失效
+"""
+
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Callable, Generic, Optional, TypeVar
+
+T = TypeVar("T")
+
+# 移除原因
+EVICTED = "evicted"          # 超过数量上限，按 LRU 淘汰
+EXPIRED = "expired"          # 超过空闲时间
+INVALIDATED = "invalidated"  # 主动失效（连接配置变更 / 删除）
+
+
+@dataclass
+class _Entry(Generic[T]):
+    value: T
+    created_at: float = field(default_factory=time.time)
+    last_access: float = field(default_factory=time.time)
+
+
+class ResourceRegistry(Generic[T]):
+    """
+    带 LRU 与空闲 TTL 的资源缓存（线程安全）
+
+    Args:
+        name: 名称（用于统计）
+        max_entries: 返回数量上限的函数（每次读取，便于随配置调整）
+        idle_ttl: 返回空闲秒数上限的函数，<= 0 表示不按空闲淘汰
+        on_evict: 条目移除后的回调 (key, value, reason)，在锁外执行
+    """
+
+    def __init__(
+        self,
+        name: str,
+        max_entries: Callable[[], int],
+        idle_ttl: Callable[[], float],
+        on_evict: Optional[Callable[[str, T, str], None]] = None,
+    ):
+        self.name = name
+        self._max_entries = max_entries
+        self._idle_ttl = idle_ttl
+        self._on_evict = on_evict
+        self._entries: "OrderedDict[str, _Entry[T]]" = OrderedDict()
+        self._lock = threading.RLock()
+        self._hits = 0
+        self._misses = 0
+        self._removed = {EVICTED: 0, EXPIRED: 0, INVALIDATED: 0}
+
+    def _expired_keys(self, now: float) -> list[str]:
+        ttl = self._idle_ttl()
+        if ttl <= 0:
+            return []
+        return [k for k, e in self._entries.items() if now - e.last_access >= ttl]
+
+    def _pop_locked(self, key: str, reason: str, removed: list) -> None:
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._removed[reason] += 1
+            removed.append((key, entry.value, reason))
+
+    def _notify(self, removed: list) -> None:
+        if self._on_evict is None:
+            return
+        for key, value, reason in removed:
+            self._on_evict(key, value, reason)
+
+    def get_or_create(self, key: str, factory: Callable[[], Optional[T]]) -> Optional[T]:
+        """
+        获取资源（刷新访问时间），不存在时调用 factory 创建；factory 返回 None 时不缓存
+        """
+        removed: list = []
+        now = time.time()
+        try:
+            with self._lock:
+                for k in self._expired_keys(now):
+                    self._pop_locked(k, EXPIRED, removed)
+                entry = self._entries.get(key)
+                if entry is not None:
+                    self._hits += 1
+                    entry.last_access = now
+                    self._entries.move_to_end(key)
+                    return entry.value
+
+                self._misses += 1
+                value = factory()
+                if value is None:
+                    return None
+                self._entries[key] = _Entry(value=value)
+                while len(self._entries) > max(1, self._max_entries()):
+                    oldest = next(iter(self._entries))
+                    self._pop_locked(oldest, EVICTED, removed)
+                return value
+        finally:
+            self._notify(removed)
+
+    def peek(self, key: str) -> Optional[T]:
+        """读取资源但不创建、不刷新访问时间"""
+        with self._lock:
+            entry = self._entries.get(key)
+            return entry.value if entry is not None else None
+
+    def keys(self) -> list[str]:
+        with self._lock:
+            return list(self._entries)
+
+    def values(self) -> list[T]:
+        with self._lock:
+            return [e.value for e in self._entries.values()]
+
+    def remove(self, key: Optional[str] = None, reason: str = INVALIDATED) -> None:
+        """
+        移除资源
+
+        Args:
+            key: 指定键，为 None 时移除全部
+            reason: 移除原因（传给 on_evict）
+        """
+        removed: list = []
+        with self._lock:
+            keys = [key] if key is not None else list(self._entries)
+            for k in keys:
+                self._pop_locked(k, reason, removed)
+        self._notify(removed)
+
+    def sweep(self) -> int:
+        """移除所有超过空闲时间的条目，返回移除数量"""
+        removed: list = []
+        with self._lock:
+            for k in self._expired_keys(time.time()):
+                self._pop_locked(k, EXPIRED, removed)
+        self._notify(removed)
+        return len(removed)
+
+    def stats(self) -> dict:
+        """缓存统计"""
+        now = time.time()
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                "name": self.name,
+                "size": len(self._entries),
+                "max_entries": self._max_entries(),
+                "idle_ttl": self._idle_ttl(),
+                "hits": self._hits,
+                "misses": self._misses,
+                "hit_rate": round(self._hits / lookups, 4) if lookups else 0.0,
+                "evicted": self._removed[EVICTED],
+                "expired": self._removed[EXPIRED],
+                "invalidated": self._removed[INVALIDATED],
+                "entries": [
+                    {"key": k, "idle_seconds": round(now - e.last_access, 1), "age_seconds": round(now - e.created_at, 1)}
+                    for k, e in self._entries.items()
+                ],
+            }
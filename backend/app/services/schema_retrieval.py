@@ -0,0 +1,143 @@
+"""
+相关表检索
+- 按连接构建 BM25 索引：表名（权重最高）、表注释、列名、列注释
+- 英文标识符按 _ / 驼峰拆词，中文按单字 + 相邻二字切分，无需分词词典
+- 对每个问题选出 top-k 相关表，并补充其外键引用的表（JOIN 常用）
+- 索引缓存在 schema 快照上，随 schema 版本失效重建
+"""
+
+import math
+import re
+import unicodedata
+from collections import Counter
+from dataclasses import dataclass
+from typing import Optional
+
+from app.models.schemas import TableSchema
+from app.services import schema_service
+
+# BM25 参数
+_K1 = 1.5
+_B = 0.75
+
+# 各字段的词频权重
+_TABLE_NAME_WEIGHT = 3
+_TABLE_COMMENT_WEIGHT = 2
+
+_CAMEL = re.compile(r"([a-z0-9])([A-Z])")
+_TOKEN = re.compile(r"[a-z0-9]+|[\u4e00-\u9fff]+")
+
+
+def tokenize(text: Optional[str]) -> list[str]:
+    """切分标识符与中英文文本"""
+    if not text:
+        return []
+    text = unicodedata.normalize("NFKC", text)
+    text = _CAMEL.sub(r"\1 \2", text).replace("_", " ").lower()
+    tokens: list[str] = []
+    for word in _TOKEN.findall(text):
+        if "\u4e00" <= word[0] <= "\u9fff":
+            tokens.extend(word)
+            tokens.extend(word[i:i + 2] for i in range(len(word) - 1))
+        else:
+            tokens.append(word)
+            # 粗略的单复数归一（orders -> order）
+            if len(word) > 3 and word.endswith("s"):
+                tokens.append(word[:-1])
+    return tokens
+
+
+def _table_terms(table: TableSchema) -> Counter:
+    terms: Counter = Counter()
+    for token in tokenize(table.name):
+        terms[token] += _TABLE_NAME_WEIGHT
+    for token in tokenize(table.comment):
+        terms[token] += _TABLE_COMMENT_WEIGHT
+    for col in table.columns:
+        terms.update(tokenize(col.name))
+        terms.update(tokenize(col.comment))
+    return terms
+
+
+@dataclass
+class SchemaIndex:
+    """某个 schema 版本的 BM25 索引"""
+    version: int
+    tables: list[TableSchema]
+    terms: list[Counter]
+    lengths: list[int]
+    avg_length: float
+    idf: dict[str, float]
+
+    @classmethod
+    def build(cls, tables: list[TableSchema], version: int) -> "SchemaIndex":
+        terms = [_table_terms(t) for t in tables]
+        lengths = [sum(t.values()) for t in terms]
+        df: Counter = Counter()
+        for t in terms:
+            df.update(t.keys())
+        n = len(tables)
+        idf = {term: math.log(1 + (n - f + 0.5) / (f + 0.5)) for term, f in df.items()}
+        return cls(
+            version=version,
+            tables=tables,
+            terms=terms,
+            lengths=lengths,
+            avg_length=(sum(lengths) / n) if n else 0.0,
+            idf=idf,
+        )
+
+    def scores(self, query: str) -> list[float]:
+        query_terms = set(tokenize(query)) & self.idf.keys()
+        result = []
+        for terms, length in zip(self.terms, self.lengths):
+            norm = _K1 * (1 - _B + _B * length / self.avg_length) if self.avg_length else _K1
+            score = 0.0
+            for term in query_terms:
+                tf = terms.get(term, 0)
+                if tf:
+                    score += self.idf[term] * tf * (_K1 + 1) / (tf + norm)
+            result.append(score)
+        return result
+
+
+def _get_index(conn_id: str) -> Optional[SchemaIndex]:
+    """获取索引（缓存在 schema 快照上，schema 变化即随快照一并失效）"""
+    snapshot = schema_service.get_schema(conn_id)
+    if snapshot is None:
+        return None
+    if snapshot.retrieval_index is None:
+        snapshot.retrieval_index = SchemaIndex.build(snapshot.tables, snapshot.version)
+    return snapshot.retrieval_index
+
+
+def select_tables(conn_id: str, question: str, top_k: int) -> list[str]:
+    """
+    选出与问题最相关的表
+
+    Args:
+        conn_id: 连接 ID
+        question: 检索文本（当前问题，可拼接近几轮问题）
+        top_k: 按得分选取的表数量；外键引用的表另行补充
+
+    Returns:
+        表名列表（按相关度排序，外键补充的表在后）；没有任何表命中时返回空列表
+    """
+    index = _get_index(conn_id)
+    if index is None or not index.tables:
+        return []
+    scores = index.scores(question)
+    ranked = sorted(
+        (i for i, score in enumerate(scores) if score > 0),
+        key=lambda i: scores[i],
+        reverse=True,
+    )[:top_k]
+
+    selected = [index.tables[i].name for i in ranked]
+    known = {t.name for t in index.tables}
+    for i in ranked:
+        for fk in index.tables[i].foreign_keys:
+            if fk.referenced_table in known and fk.referenced_table not in selected:
+                selected.append(fk.referenced_table)
+    return selected
+
@@ -0,0 +1,290 @@
+"""
+Schema 缓存服务
+- 按 connection_id 缓存完整表结构（information_schema 批量读取）及指纹
+- TTL 到期后仅执行一条指纹查询（表、列定义、注释、外键的内容哈希），指纹不变则继续使用缓存
+- 指纹变化或手动刷新时重新读取，版本号 +1
+- SQL 工作台 /api/database/schema 与 Agent 的 sql_db_list_tables / sql_db_schema 共用
+- 紧凑摘要（render_digest）可直接注入 Agent system prompt，省去表结构探查的工具调用
+"""
+
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Any, Optional
+
+from sqlalchemy import text
+from sqlalchemy.exc import ProgrammingError
+
+from app.config import get_settings
+from app.database.introspection import fetch_schema
+from app.models.schemas import TableSchema
+from app.services import connection_service
+
+# 每张表的示例行数（与 SQLDatabase 默认一致）
+SAMPLE_ROWS = 3
+
+# 指纹按缓存内容计算：表名 / 表注释、列定义 / 列注释、外键逐行取 CRC32 后求和（与行顺序无关），
+# 改列类型、改注释、增删列等任意变化都会改变指纹；只读 information_schema，不扫描业务数据
+_FINGERPRINT_SQL = """
+SELECT
+    (SELECT CONCAT(COUNT(*), ':', COALESCE(SUM(CRC32(CONCAT_WS(CHAR(0),
+        TABLE_NAME, TABLE_COMMENT))), 0))
+     FROM information_schema.TABLES WHERE TABLE_SCHEMA = DATABASE()),
+    (SELECT CONCAT(COUNT(*), ':', COALESCE(SUM(CRC32(CONCAT_WS(CHAR(0),
+        TABLE_NAME, ORDINAL_POSITION, COLUMN_NAME, COLUMN_TYPE, IS_NULLABLE, COLUMN_KEY, COLUMN_COMMENT))), 0))
+     FROM information_schema.COLUMNS WHERE TABLE_SCHEMA = DATABASE()),
+    (SELECT CONCAT(COUNT(*), ':', COALESCE(SUM(CRC32(CONCAT_WS(CHAR(0),
+        TABLE_NAME, CONSTRAINT_NAME, COLUMN_NAME, REFERENCED_TABLE_NAME, REFERENCED_COLUMN_NAME))), 0))
+     FROM information_schema.KEY_COLUMN_USAGE
+     WHERE TABLE_SCHEMA = DATABASE() AND REFERENCED_TABLE_NAME IS NOT NULL)
+"""
+
+
+@dataclass
+class SchemaSnapshot:
+    """某个连接的 schema 缓存条目"""
+    tables: list[TableSchema]
+    fingerprint: str
+    version: int
+    fetched_at: float
+    checked_at: float
+    # 创建该快照时的 Engine，连接配置变更后 Engine 被替换，快照随之失效
+    engine: Any = None
+    # 示例行缓存：表名 -> 已格式化的示例行文本
+    sample_rows: dict[str, str] = field(default_factory=dict)
+    # 紧凑 schema 摘要（首次使用时生成）
+    digest: Optional[str] = None
+    # 相关表检索索引（schema_retrieval.SchemaIndex，首次使用时构建）
+    retrieval_index: Any = None
+
+    def table_map(self) -> dict[str, TableSchema]:
+        return {t.name: t for t in self.tables}
+
+
+# connection_id -> SchemaSnapshot
+_snapshots: dict[str, SchemaSnapshot] = {}
+_lock = threading.RLock()
+
+
+def _read_fingerprint(conn) -> str:
+    cursor = conn.cursor()
+    try:
+        cursor.execute(_FINGERPRINT_SQL)
+        row = cursor.fetchone()
+    finally:
+        cursor.close()
+    return "|".join("" if v is None else str(v) for v in row)
+
+
+def get_schema(conn_id: str, refresh: bool = False) -> Optional[SchemaSnapshot]:
+    """
+    获取指定连接的 schema 快照
+
+    Args:
+        conn_id: 连接 ID
+        refresh: 是否忽略 TTL 强制校验指纹并重新读取
+
+    Returns:
+        SchemaSnapshot，连接不存在时返回 None
+
+    Raises:
+        pymysql.Error / SQLAlchemyError: 数据库访问失败
+    """
+    engine = connection_service.get_engine(conn_id)
+    if engine is None:
+        return None
+
+    ttl = get_settings().SCHEMA_CACHE_TTL
+    now = time.time()
+    with _lock:
+        snapshot = _snapshots.get(conn_id)
+        if snapshot is not None and snapshot.engine is not engine:
+            snapshot = None
+        if snapshot is not None and not refresh and now - snapshot.checked_at < ttl:
+            return snapshot
+
+    conn = engine.raw_connection()
+    try:
+        fingerprint = _read_fingerprint(conn)
+        if snapshot is not None and not refresh and fingerprint == snapshot.fingerprint:
+            snapshot.checked_at = now
+            return snapshot
+        tables = fetch_schema(conn)
+    finally:
+        conn.close()
+
+    with _lock:
+        previous = _snapshots.get(conn_id)
+        version = previous.version + 1 if previous is not None else 1
+        snapshot = SchemaSnapshot(
+            tables=tables,
+            fingerprint=fingerprint,
+            version=version,
+            fetched_at=now,
+            checked_at=now,
+            engine=engine,
+        )
+        _snapshots[conn_id] = snapshot
+    return snapshot
+
+
+def invalidate(conn_id: Optional[str] = None) -> None:
+    """
+    丢弃 schema 缓存
+
+    Args:
+        conn_id: 指定连接 ID，为 None 时清除所有缓存
+    """
+    with _lock:
+        if conn_id:
+            _snapshots.pop(conn_id, None)
+        else:
+            _snapshots.clear()
+
+
+def _on_connection_evicted(conn_id: str, reason: str) -> None:
+    """连接资源释放后丢弃其 schema 快照（快照引用着已 dispose 的 Engine）"""
+    invalidate(conn_id)
+
+
+connection_service.add_eviction_listener(_on_connection_evicted)
+
+
+# ==================== Agent 工具使用的文本形式 ====================
+
+def list_table_names(conn_id: str) -> list[str]:
+    """获取表名列表（来自缓存）"""
+    snapshot = get_schema(conn_id)
+    return [t.name for t in snapshot.tables] if snapshot else []
+
+
+def _sql_string(value: str) -> str:
+    """注释转为 SQL 字符串字面量（转义引号、反斜杠与换行，保证每列仍在一行内）"""
+    escaped = value.replace("\\", "\\\\").replace("'", "''").replace("\n", "\\n").replace("\r", "\\r")
+    return f"'{escaped}'"
+
+
+def _one_line(value: str) -> str:
+    """摘要中的表注释压成一行"""
+    return " ".join(value.split())
+
+
+def _render_ddl(table: TableSchema) -> str:
+    """将缓存的表结构渲染为 CREATE TABLE 文本"""
+    lines = []
+    for col in table.columns:
+        line = f"\t`{col.name}` {col.type}"
+        if not col.nullable:
+            line += " NOT NULL"
+        if col.comment:
+            line += f" COMMENT {_sql_string(col.comment)}"
+        lines.append(line)
+    pk = [col.name for col in table.columns if col.primary_key]
+    if pk:
+        lines.append("\tPRIMARY KEY (" + ", ".join(f"`{c}`" for c in pk) + ")")
+    for fk in table.foreign_keys:
+        lines.append(
+            f"\tFOREIGN KEY(`{fk.column}`) REFERENCES `{fk.referenced_table}` (`{fk.referenced_column}`)"
+        )
+    ddl = f"CREATE TABLE `{table.name}` (\n" + ",\n".join(lines) + "\n)"
+    if table.comment:
+        ddl += f" COMMENT={_sql_string(table.comment)}"
+    return ddl
+
+
+def render_digest(tables: list[TableSchema]) -> str:
+    """
+    生成紧凑的 schema 摘要（每表一行），供直接注入 Agent system prompt
+
+    格式：表名(列名 类型 [PK] [→引用表.引用列] ['列注释'], ...)  -- 表注释
+    """
+    lines = []
+    for table in tables:
+        fks = {fk.column: fk for fk in table.foreign_keys}
+        columns = []
+        for col in table.columns:
+            part = f"{col.name} {col.type}"
+            if col.primary_key:
+                part += " PK"
+            fk = fks.get(col.name)
+            if fk is not None:
+                part += f" →{fk.referenced_table}.{fk.referenced_column}"
+            if col.comment:
+                part += f" {_sql_string(col.comment)}"
+            columns.append(part)
+        line = f"{table.name}({', '.join(columns)})"
+        if table.comment:
+            line += f"  -- {_one_line(table.comment)}"
+        lines.append(line)
+    return "\n".join(lines)
+
+
+def get_table_digest(conn_id: str, table_names: list[str]) -> str:
+    """
+    获取指定表的 schema 摘要（按快照中的表顺序，忽略未知表名）
+    """
+    snapshot = get_schema(conn_id)
+    if snapshot is None:
+        return ""
+    wanted = set(table_names)
+    return render_digest([t for t in snapshot.tables if t.name in wanted])
+
+
+def get_digest(conn_id: str) -> Optional[tuple[str, int]]:
+    """
+    获取 schema 摘要及其对应的 schema 版本（摘要缓存在快照上）
+
+    Returns:
+        (摘要文本, 版本号)，连接不存在时返回 None
+    """
+    snapshot = get_schema(conn_id)
+    if snapshot is None:
+        return None
+    if snapshot.digest is None:
+        snapshot.digest = render_digest(snapshot.tables)
+    return snapshot.digest, snapshot.version
+
+
+def _fetch_sample_rows(conn_id: str, table: TableSchema) -> str:
+    """读取示例行并格式化（与 SQLDatabase 输出格式一致）"""
+    engine = connection_service.get_engine(conn_id)
+    columns_str = "\t".join(col.name for col in table.columns)
+    try:
+        with engine.connect() as connection:
+            result = connection.execute(text(f"SELECT * FROM `{table.name}` LIMIT {SAMPLE_ROWS}"))
+            rows = [[str(v)[:100] for v in row] for row in result]
+        rows_str = "\n".join("\t".join(row) for row in rows)
+    except ProgrammingError:
+        rows_str = ""
+    return f"{SAMPLE_ROWS} rows from {table.name} table:\n{columns_str}\n{rows_str}"
+
+
+def get_table_info(conn_id: str, table_names: list[str]) -> str:
+    """
+    获取指定表的结构与示例行文本（sql_db_schema 工具输出）
+
+    表结构来自缓存；示例行首次读取后缓存在当前快照中，schema 版本变化时一并失效
+
+    Args:
+        conn_id: 连接 ID
+        table_names: 表名列表
+
+    Raises:
+        ValueError: 存在未知表名
+    """
+    snapshot = get_schema(conn_id)
+    if snapshot is None:
+        raise ValueError(f"连接 '{conn_id}' 不存在")
+    tables = snapshot.table_map()
+    missing = [name for name in table_names if name not in tables]
+    if missing:
+        raise ValueError(f"table_names {set(missing)} not found in database")
+
+    parts = []
+    for name in sorted(set(table_names)):
+        table = tables[name]
+        if name not in snapshot.sample_rows:
+            snapshot.sample_rows[name] = _fetch_sample_rows(conn_id, table)
+        parts.append(f"{_render_ddl(table)}\n\n/*\n{snapshot.sample_rows[name]}\n*/")
+    return "\n\n".join(parts)
+
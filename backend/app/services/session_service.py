@@ -1,13 +1,15 @@
 """
 会话管理服务层
 - 内存字典存储会话信息
-- 通过 Agent 的 thread_id 实现对话记忆隔离
+- 通过 Agent 的 thread_id 实现对话记忆隔离（删除会话时一并删除其对话记忆）
 """
 
 import uuid
 from datetime import datetime
 from typing import Optional
 
+from app.services import checkpoint_service
+
 
 # 内存存储：session_id -> session_data
 _sessions: dict[str, dict] = {}
@@ -77,9 +79,10 @@ def update_session_title(session_id: str, title: str) -> Optional[dict]:
 
 
 def delete_session(session_id: str) -> bool:
-    """删除会话"""
+    """删除会话及其在各连接上的对话记忆"""
     if session_id in _sessions:
         del _sessions[session_id]
+        checkpoint_service.delete_threads(session_id=session_id)
         return True
     return False
 
@@ -0,0 +1,285 @@
+"""
+Agent SQL 工具集
+在 SQLDatabaseToolkit 基础上替换：
+- sql_db_query：返回给 LLM 的文本与结构化列式结果（QueryResult）分离，
+  结构化结果经 ToolMessage.artifact 传给图表/表格构建，无需再解析 Python repr 字符串；
+  QueryResultSinkMiddleware 把完整结果交给本次运行的 configurable.query_results（按 tool_call_id），
+  写入对话状态（checkpointer）的 artifact 只保留列名 / 行数等元信息
+- sql_db_list_tables / sql_db_schema：读取 schema_service 缓存，不再每次查询元数据；
+  本次运行检索出相关表时（configurable.relevant_tables）只列出 / 开放这些表
+- sql_db_query 执行时登记到本次运行的 QueryGuard，运行中止时 KILL QUERY
+"""
+
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Literal, Optional
+
+from langchain.agents.middleware import AgentMiddleware
+from langchain.agents.middleware.types import ToolCallRequest
+from langchain_community.agent_toolkits import SQLDatabaseToolkit
+from langchain_community.tools import (
+    InfoSQLDatabaseTool,
+    ListSQLDatabaseTool,
+    QuerySQLDatabaseTool,
+)
+from langchain_community.utilities import SQLDatabase
+from langchain_community.utilities.sql_database import truncate_word
+from langchain_core.callbacks import CallbackManagerForToolRun
+from langchain_core.language_models import BaseLanguageModel
+from langchain_core.messages import ToolMessage
+from langchain_core.runnables import RunnableConfig
+from langchain_core.tools import BaseTool
+from langgraph.config import get_config
+from pymysql.constants import FIELD_TYPE
+from sqlalchemy import text
+from sqlalchemy.exc import SQLAlchemyError
+
+from app.services import schema_service
+from app.services.query_guard import QueryCancelledError, QueryGuard
+
+# 单次查询保留的最大行数（Agent 查询通常带 LIMIT，此处仅作兜底）
+MAX_RESULT_ROWS = 1000
+
+# pymysql 类型码 -> 类型名
+_FIELD_TYPE_NAMES = {
+    value: name for name, value in vars(FIELD_TYPE).items() if name.isupper()
+}
+
+
+@dataclass
+class QueryResult:
+    """SQL 查询的结构化列式结果"""
+    columns: list[str]
+    types: list[str]
+    rows: list[tuple] = field(default_factory=list)
+    truncated: bool = False
+
+    def to_prompt_text(self, max_rows: int = 50) -> str:
+        """
+        生成紧凑的文本形式（供图表 prompt 使用），超过 max_rows 的行只给出行数
+
+        Args:
+            max_rows: 最多展示的行数
+        """
+        header = " | ".join(
+            f"{name}({type_name})" if type_name else name
+            for name, type_name in zip(self.columns, self.types)
+        )
+        lines = [header]
+        for row in self.rows[:max_rows]:
+            lines.append(" | ".join("" if v is None else str(v) for v in row))
+        total = f"{len(self.rows)}+" if self.truncated else str(len(self.rows))
+        if len(self.rows) > max_rows:
+            lines.append(f"...（共 {total} 行，仅展示前 {max_rows} 行）")
+        else:
+            lines.append(f"（共 {total} 行）")
+        return "\n".join(lines)
+
+
+def _type_name(type_code: Any) -> str:
+    """cursor.description 中的类型码转为类型名"""
+    if isinstance(type_code, int):
+        return _FIELD_TYPE_NAMES.get(type_code, str(type_code))
+    return "" if type_code is None else str(type_code)
+
+
+def execute_structured(
+    db: SQLDatabase,
+    query: str,
+    max_rows: int = MAX_RESULT_ROWS,
+    guard: Optional[QueryGuard] = None,
+) -> QueryResult:
+    """
+    执行查询并返回结构化结果
+
+    Args:
+        db: SQLDatabase 实例
+        query: SQL 语句
+        max_rows: 最多读取的行数，超出部分不拉取并标记 truncated
+        guard: 登记执行中的查询，运行中止时可被 KILL QUERY
+
+    Raises:
+        SQLAlchemyError: SQL 执行失败（含超时、被中止）
+        QueryCancelledError: 运行已中止
+    """
+    with db._engine.connect() as conn:
+        if guard is not None:
+            guard.attach(conn.connection)
+        try:
+            result = conn.execute(text(query))
+            if not result.returns_rows:
+                return QueryResult(columns=[], types=[])
+            description = result.cursor.description or []
+            rows = [tuple(row) for row in result.fetchmany(max_rows + 1)]
+        finally:
+            if guard is not None:
+                guard.detach()
+    return QueryResult(
+        columns=[desc[0] for desc in description],
+        types=[_type_name(desc[1]) for desc in description],
+        rows=rows[:max_rows],
+        truncated=len(rows) > max_rows,
+    )
+
+
+def render_query_content(db: SQLDatabase, result: QueryResult) -> str:
+    """生成 sql_db_query 返回给 LLM 的文本（与原工具一致：行元组列表的字符串，长值截断）"""
+    if not result.rows:
+        return ""
+    max_length = db._max_string_length
+    return str([
+        tuple(truncate_word(v, length=max_length) for v in row)
+        for row in result.rows
+    ])
+
+
+class StructuredQueryTool(QuerySQLDatabaseTool):
+    """
+    sql_db_query 工具（结构化版本）
+
+    content 与原工具一致（行元组列表的字符串，长值截断），供 LLM 阅读；
+    artifact 为 QueryResult，出错时为 None
+    """
+
+    response_format: Literal["content", "content_and_artifact"] = "content_and_artifact"
+    max_rows: int = MAX_RESULT_ROWS
+
+    def _run(
+        self,
+        query: str,
+        run_manager: Optional[CallbackManagerForToolRun] = None,
+        config: RunnableConfig = None,
+    ) -> tuple[str, Optional[QueryResult]]:
+        """执行查询，返回 (文本, 结构化结果)"""
+        guard = ((config or {}).get("configurable") or {}).get("query_guard")
+        try:
+            result = execute_structured(self.db, query, self.max_rows, guard)
+        except (SQLAlchemyError, QueryCancelledError) as e:
+            return f"Error: {e}", None
+
+        return render_query_content(self.db, result), result
+
+
+def query_result_meta(result: QueryResult) -> dict:
+    """写入对话状态的查询结果元信息（不含行数据）"""
+    return {"columns": result.columns, "row_count": len(result.rows), "truncated": result.truncated}
+
+
+def publish_query_result(config: Optional[RunnableConfig], tool_call_id: str, result: QueryResult) -> None:
+    """
+    把完整查询结果交给本次运行的接收方（config["configurable"]["query_results"]，按 tool_call_id）
+
+    未提供 query_results 时丢弃（结果只用于图表 / 表格，不进入对话状态）
+    """
+    sink = ((config or {}).get("configurable") or {}).get("query_results")
+    if sink is not None:
+        sink[tool_call_id] = result
+
+
+class QueryResultSinkMiddleware(AgentMiddleware):
+    """
+    sql_db_query 的完整结果不进入对话状态
+
+    tools 节点返回的 ToolMessage 会随每个 checkpoint 持久化，
+    此处把 artifact 中的 QueryResult 交给本次运行的 query_results，消息只保留元信息
+    """
+
+    def _strip(self, message: Any) -> Any:
+        if not isinstance(message, ToolMessage) or not isinstance(message.artifact, QueryResult):
+            return message
+        publish_query_result(get_config(), message.tool_call_id, message.artifact)
+        return message.model_copy(update={"artifact": query_result_meta(message.artifact)})
+
+    def wrap_tool_call(
+        self,
+        request: ToolCallRequest,
+        handler: Callable[[ToolCallRequest], Any],
+    ) -> Any:
+        return self._strip(handler(request))
+
+    async def awrap_tool_call(
+        self,
+        request: ToolCallRequest,
+        handler: Callable[[ToolCallRequest], Awaitable[Any]],
+    ) -> Any:
+        return self._strip(await handler(request))
+
+
+def _relevant_tables(config: Optional[RunnableConfig]) -> Optional[list[str]]:
+    """本次运行检索出的相关表（config["configurable"]["relevant_tables"]），未限定时为 None"""
+    return ((config or {}).get("configurable") or {}).get("relevant_tables")
+
+
+class CachedListTablesTool(ListSQLDatabaseTool):
+    """sql_db_list_tables 工具（读取 schema 缓存）"""
+
+    connection_id: str
+
+    def _run(
+        self,
+        tool_input: str = "",
+        run_manager: Optional[CallbackManagerForToolRun] = None,
+        config: RunnableConfig = None,
+    ) -> str:
+        """返回逗号分隔的表名（本次运行限定了相关表时仅返回这些表）"""
+        relevant = _relevant_tables(config)
+        if relevant:
+            return ", ".join(relevant)
+        try:
+            return ", ".join(schema_service.list_table_names(self.connection_id))
+        except Exception as e:
+            return f"Error: {e}"
+
+
+class CachedInfoTool(InfoSQLDatabaseTool):
+    """sql_db_schema 工具（读取 schema 缓存，示例行按 schema 版本缓存）"""
+
+    connection_id: str
+
+    def _run(
+        self,
+        table_names: str,
+        run_manager: Optional[CallbackManagerForToolRun] = None,
+        config: RunnableConfig = None,
+    ) -> str:
+        """返回指定表的建表语句与示例行（本次运行限定了相关表时仅开放这些表）"""
+        names = [t.strip().strip("`") for t in table_names.split(",") if t.strip()]
+        relevant = _relevant_tables(config)
+        if relevant:
+            outside = [name for name in names if name not in relevant]
+            if outside:
+                return (
+                    f"Error: table_names {set(outside)} not available for this question. "
+                    f"Available tables: {', '.join(relevant)}"
+                )
+        try:
+            return schema_service.get_table_info(self.connection_id, names)
+        except Exception as e:
+            return f"Error: {e}"
+
+
+def get_sql_tools(db: SQLDatabase, llm: BaseLanguageModel, connection_id: str) -> list[BaseTool]:
+    """
+    获取 Agent 使用的 SQL 工具集（基于 SQLDatabaseToolkit 的名称与描述）
+
+    - sql_db_query 替换为结构化版本
+    - sql_db_list_tables / sql_db_schema 替换为读取 schema 缓存的版本
+
+    Args:
+        db: SQLDatabase 实例
+        llm: 供 sql_db_query_checker 使用的 LLM
+        connection_id: 连接 ID（schema 缓存键）
+    """
+    replacements = {
+        "sql_db_query": lambda tool: StructuredQueryTool(db=db, description=tool.description),
+        "sql_db_list_tables": lambda tool: CachedListTablesTool(
+            db=db, description=tool.description, connection_id=connection_id
+        ),
+        "sql_db_schema": lambda tool: CachedInfoTool(
+            db=db, description=tool.description, connection_id=connection_id
+        ),
+    }
+    tools = SQLDatabaseToolkit(db=db, llm=llm).get_tools()
+    return [
+        replacements[tool.name](tool) if tool.name in replacements else tool
+        for tool in tools
+    ]
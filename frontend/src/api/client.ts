@@ -8,8 +8,10 @@
  *    GET    /api/sessions/:id                   会话详情（含消息）
  *    PUT    /api/sessions/:id                   更新标题
  *    DELETE /api/sessions/:id                   删除会话
- *    GET    /api/database/schema?connection_id=  数据库表结构（需要 connection_id）
+ *    GET    /api/database/schema?connection_id=  数据库表结构（需要 connection_id，服务端缓存）
+ *    POST   /api/database/schema/refresh?connection_id=  强制刷新表结构缓存
  *    POST   /api/database/query                 SQL 查询（需要 connection_id）
+ *    POST   /api/database/export                流式导出完整结果（CSV / NDJSON / Arrow）
  *    GET    /api/connections                    连接列表
  *    POST   /api/connections                    新增连接
  *    GET    /api/connections/:id                连接详情
@@ -105,32 +107,107 @@ export async function fetchSchemaApi(connectionId: string): Promise<{ tables: Ta
   return data
 }
 
+/** 强制刷新数据库 schema 缓存并返回最新表结构 */
+export async function refreshSchemaApi(connectionId: string): Promise<{ tables: TableSchema[] }> {
+  const { data } = await api.post<{ tables: TableSchema[] }>('/database/schema/refresh', null, {
+    params: { connection_id: connectionId },
+  })
+  return data
+}
+
 /** 执行 SQL 查询（仅 SELECT，带分页，需要 connection_id） */
 export async function executeSqlApi(
   connectionId: string,
   sql: string,
   page: number = 1,
   pageSize: number = 50,
+  queryHandle?: string | null,
 ): Promise<SqlQueryResult> {
   const { data } = await api.post<SqlQueryResult>('/database/query', {
     connection_id: connectionId,
     sql,
     page,
     page_size: pageSize,
+    query_handle: queryHandle ?? null,
+  })
+  return data
+}
+
+/**
+ * 键集分页执行 SQL：cursor 为空时读取第一页，之后传入上一页返回的 next_cursor
+ * keyColumns 为空时服务端使用单表查询的主键
+ */
+export async function executeSqlKeysetApi(
+  connectionId: string,
+  sql: string,
+  cursor?: string | null,
+  pageSize: number = 50,
+  keyColumns?: string[],
+): Promise<SqlQueryResult> {
+  const { data } = await api.post<SqlQueryResult>('/database/query', {
+    connection_id: connectionId,
+    sql,
+    page_size: pageSize,
+    pagination: 'keyset',
+    cursor: cursor ?? null,
+    key_columns: keyColumns ?? null,
   })
   return data
 }
 
+/**
+ * 导出完整查询结果并触发浏览器下载
+ * 服务端流式输出，不受分页条数限制
+ */
+export async function exportSqlApi(
+  connectionId: string,
+  sql: string,
+  format: 'csv' | 'ndjson' | 'arrow' = 'csv',
+): Promise<void> {
+  const response = await fetch('/api/database/export', {
+    method: 'POST',
+    headers: { 'Content-Type': 'application/json' },
+    body: JSON.stringify({ connection_id: connectionId, sql, format }),
+  })
+  if (!response.ok) {
+    const data = await response.json().catch(() => null)
+    throw new Error(data?.detail || `导出失败: HTTP ${response.status}`)
+  }
+
+  const disposition = response.headers.get('Content-Disposition') || ''
+  const filename = /filename="([^"]+)"/.exec(disposition)?.[1] || `export.${format}`
+  const url = URL.createObjectURL(await response.blob())
+  const link = document.createElement('a')
+  link.href = url
+  link.download = filename
+  link.click()
+  URL.revokeObjectURL(url)
+}
+
 // ======================== SSE 聊天流式接口 ========================
 
+/**
+ * thinking 事件负载
+ *  - content：全量思考过程（full 模式每次发送，delta 模式下为周期性快照）
+ *  - delta：delta 模式下新增的单个步骤，接收方以空行拼接
+ *  - seq：追加后的步骤总数，用于检测丢失
+ */
+export interface ThinkingEvent {
+  seq?: number
+  content?: string
+  delta?: string
+}
+
 /** SSE 事件回调 */
 export interface SSECallbacks {
-  /** 收到文本片段（仅最终回答） */
+  /** 收到文本片段（仅最终回答，逐 token 推送） */
   onToken: (content: string) => void
+  /** 已推送的片段被撤回（实为工具调用前的思考），需清空当前回答 */
+  onTokenReset: () => void
   /** 收到 SQL 语句 */
   onSql: (sql: string) => void
-  /** 收到思考过程（用户问题+推理步骤+回答，追加累积） */
-  onThinking: (content: string) => void
+  /** 收到思考过程事件（全量快照或增量步骤，由调用方重组） */
+  onThinking: (event: ThinkingEvent) => void
   /** 收到图表配置 */
   onChart: (chartData: ChartData) => void
   /** 流结束 */
@@ -152,7 +229,8 @@ export async function sendChatMessageApi(
   const response = await fetch(`/api/chat/${sessionId}/stream`, {
     method: 'POST',
     headers: { 'Content-Type': 'application/json' },
-    body: JSON.stringify({ message, connection_id: connectionId }),
+    // delta 模式：thinking 事件仅携带新增步骤，避免长流程反复传输全量文本
+    body: JSON.stringify({ message, connection_id: connectionId, thinking_mode: 'delta' }),
   })
 
   if (!response.ok) {
@@ -195,7 +273,9 @@ export async function sendChatMessageApi(
 
         switch (eventType) {
           case 'token':
-            if (parsed.content) {
+            if (parsed.reset) {
+              callbacks.onTokenReset()
+            } else if (parsed.content) {
               callbacks.onToken(parsed.content)
             }
             break
@@ -205,8 +285,8 @@ export async function sendChatMessageApi(
             }
             break
           case 'thinking':
-            if (parsed.content) {
-              callbacks.onThinking(parsed.content)
+            if (parsed.content || parsed.delta) {
+              callbacks.onThinking(parsed as ThinkingEvent)
             }
             break
           case 'chart':
@@ -10,6 +10,10 @@ export function QueryResult({ result, onPageChange }: Props) {
     return <p className="text-sm text-gray-500 text-center py-4">查询无返回列</p>
   }
 
+  // 键集分页没有总页数，是否有下一页看续页令牌
+  const keyset = result.key_columns != null
+  const hasNext = keyset ? !!result.next_cursor : result.page < result.total_pages
+
   return (
     <div className="flex flex-col h-full">
       {/* 表格区域 */}
@@ -61,7 +65,10 @@ export function QueryResult({ result, onPageChange }: Props) {
         style={{ borderColor: 'var(--tech-border)', backgroundColor: 'var(--tech-bg-panel)', color: 'var(--tech-text-muted)' }}
       >
         <span>
-          共 {result.total_count.toLocaleString()} 条，每页 {result.page_size} 条，耗时 {result.elapsed_ms}ms
+          {result.total_count === null
+            ? '总数未知'
+            : `共 ${result.count_estimated ? '约 ' : ''}${result.total_count.toLocaleString()} 条`}，每页 {result.page_size} 条，耗时 {result.elapsed_ms}ms
+          {keyset && result.keyset_pushdown === false && '（该查询无法按排序键定位，越往后翻页越慢）'}
         </span>
 
         <div className="flex items-center gap-2">
@@ -80,16 +87,16 @@ export function QueryResult({ result, onPageChange }: Props) {
             上一页
           </button>
           <span style={{ color: 'var(--tech-text)' }}>
-            {result.page} / {result.total_pages}
+            {keyset ? `第 ${result.page} 页` : `${result.page} / ${result.total_pages}`}
           </span>
           <button
             onClick={() => onPageChange(result.page + 1)}
-            disabled={result.page >= result.total_pages}
+            disabled={!hasNext}
             className={`px-2 py-1 rounded transition-colors ${
-              result.page >= result.total_pages ? 'cursor-not-allowed' : ''
+              !hasNext ? 'cursor-not-allowed' : ''
             }`}
             style={
-              result.page >= result.total_pages
+              !hasNext
                 ? { color: 'var(--tech-text-muted)' }
                 : { color: 'var(--tech-text)' }
             }
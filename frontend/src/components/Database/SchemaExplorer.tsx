@@ -1,6 +1,6 @@
 import { useState, useEffect } from 'react'
 import type { TableSchema } from '../../types'
-import { fetchSchemaApi } from '../../api/client'
+import { fetchSchemaApi, refreshSchemaApi } from '../../api/client'
 
 interface Props {
   /** 点击表名时回调，传递预填 SQL */
@@ -25,12 +25,13 @@ export function SchemaExplorer({ onFillSql, connectionId }: Props) {
     }
   }, [connectionId])
 
-  const loadSchema = async () => {
+  /** 加载表结构；force 为 true 时要求服务端重新读取（忽略缓存） */
+  const loadSchema = async (force = false) => {
     if (!connectionId) return
     setLoading(true)
     setError(null)
     try {
-      const { tables } = await fetchSchemaApi(connectionId)
+      const { tables } = force ? await refreshSchemaApi(connectionId) : await fetchSchemaApi(connectionId)
       setTables(tables)
       // 默认展开第一张表
       if (tables.length > 0) {
@@ -64,7 +65,7 @@ export function SchemaExplorer({ onFillSql, connectionId }: Props) {
     return (
       <div className="flex flex-col items-center justify-center h-full gap-2" style={{ color: 'var(--tech-text-muted)' }}>
         <p className="text-sm text-red-400">{error}</p>
-        <button onClick={loadSchema} className="text-xs underline" style={{ color: 'var(--tech-accent)' }}>
+        <button onClick={() => loadSchema()} className="text-xs underline" style={{ color: 'var(--tech-accent)' }}>
           重试
         </button>
       </div>
@@ -73,6 +74,12 @@ export function SchemaExplorer({ onFillSql, connectionId }: Props) {
 
   return (
     <div className="overflow-y-auto h-full px-3 py-2 space-y-1">
+      <div className="flex items-center justify-between px-3 py-1 text-xs" style={{ color: 'var(--tech-text-muted)' }}>
+        <span>共 {tables.length} 张表</span>
+        <button onClick={() => loadSchema(true)} className="underline" style={{ color: 'var(--tech-accent)' }}>
+          刷新
+        </button>
+      </div>
       {tables.map((table) => {
         const isExpanded = expandedTable === table.name
         return (
@@ -1,6 +1,6 @@
 import { useState, useRef, useEffect, type KeyboardEvent } from 'react'
 import type { SqlQueryResult } from '../../types'
-import { executeSqlApi } from '../../api/client'
+import { executeSqlApi, executeSqlKeysetApi, exportSqlApi } from '../../api/client'
 import { QueryResult } from './QueryResult'
 
 interface Props {
@@ -16,6 +16,11 @@ export function SqlEditor({ prefillSql, onPrefillConsumed, connectionId }: Props
   const [loading, setLoading] = useState(false)
   const [error, setError] = useState<string | null>(null)
   const [result, setResult] = useState<SqlQueryResult | null>(null)
+  const [exporting, setExporting] = useState(false)
+  /** 键集分页：按续页令牌翻页，不计算总行数，深页开销恒定 */
+  const [keyset, setKeyset] = useState(false)
+  /** 键集分页各页的续页令牌（下标 i 为第 i + 1 页，第 1 页为 null），用于返回上一页 */
+  const [cursors, setCursors] = useState<(string | null)[]>([null])
   const textareaRef = useRef<HTMLTextAreaElement>(null)
 
   // 接收外部预填 SQL
@@ -27,7 +32,8 @@ export function SqlEditor({ prefillSql, onPrefillConsumed, connectionId }: Props
     }
   }, [prefillSql, onPrefillConsumed])
 
-  const executeQuery = async (page: number = 1) => {
+  /** 执行查询；翻页时携带上次结果的句柄，服务端直接从缓存取页 */
+  const executeQuery = async (page: number = 1, queryHandle?: string | null) => {
     const trimmed = sql.trim()
     if (!trimmed || loading || !connectionId) return
 
@@ -35,8 +41,18 @@ export function SqlEditor({ prefillSql, onPrefillConsumed, connectionId }: Props
     setError(null)
 
     try {
-      const data = await executeSqlApi(connectionId, trimmed, page, 50)
-      setResult(data)
+      if (keyset) {
+        // 第 1 页重新开始；之后的页使用上一页返回的 next_cursor
+        const pageCursors = page === 1 ? [null] : cursors
+        const data = await executeSqlKeysetApi(connectionId, trimmed, pageCursors[page - 1], 50)
+        const next = pageCursors.slice(0, page)
+        if (data.next_cursor) next.push(data.next_cursor)
+        setCursors(next)
+        setResult({ ...data, page })
+      } else {
+        const data = await executeSqlApi(connectionId, trimmed, page, 50, queryHandle)
+        setResult(data)
+      }
     } catch (err) {
       setError(err instanceof Error ? err.message : '查询失败')
       setResult(null)
@@ -53,6 +69,22 @@ export function SqlEditor({ prefillSql, onPrefillConsumed, connectionId }: Props
     }
   }
 
+  /** 导出当前 SQL 的完整结果（CSV） */
+  const handleExport = async () => {
+    const trimmed = sql.trim()
+    if (!trimmed || exporting || !connectionId) return
+
+    setExporting(true)
+    setError(null)
+    try {
+      await exportSqlApi(connectionId, trimmed, 'csv')
+    } catch (err) {
+      setError(err instanceof Error ? err.message : '导出失败')
+    } finally {
+      setExporting(false)
+    }
+  }
+
   const handleClear = () => {
     setSql('')
     setResult(null)
@@ -61,7 +93,7 @@ export function SqlEditor({ prefillSql, onPrefillConsumed, connectionId }: Props
   }
 
   const handlePageChange = (page: number) => {
-    executeQuery(page)
+    executeQuery(page, result?.query_handle)
   }
 
   return (
@@ -104,6 +136,32 @@ export function SqlEditor({ prefillSql, onPrefillConsumed, connectionId }: Props
           >
             清空
           </button>
+          <button
+            onClick={handleExport}
+            disabled={!sql.trim() || exporting || !connectionId}
+            className={`px-3 py-1 text-xs rounded-md transition-colors ${
+              sql.trim() && !exporting && connectionId ? '' : 'cursor-not-allowed'
+            }`}
+            style={{ color: 'var(--tech-text-muted)' }}
+          >
+            {exporting ? '导出中...' : '导出 CSV'}
+          </button>
+          <label
+            className="flex items-center gap-1 text-xs cursor-pointer"
+            style={{ color: 'var(--tech-text-muted)' }}
+            title="按主键（或唯一排序键）翻页，不计算总行数，深页与首页耗时相同"
+          >
+            <input
+              type="checkbox"
+              checked={keyset}
+              onChange={(e) => {
+                setKeyset(e.target.checked)
+                setCursors([null])
+                setResult(null)
+              }}
+            />
+            键集分页
+          </label>
           <span className="ml-auto text-xs" style={{ color: 'var(--tech-text-muted)' }}>Ctrl+Enter 执行</span>
         </div>
       </div>
@@ -8,6 +8,7 @@ import {
   sendChatMessageApi,
   getSessionDetailApi,
   type BackendMessage,
+  type ThinkingEvent,
 } from '../api/client'
 import { useSessionStore } from './sessionStore'
 
@@ -20,6 +21,22 @@ function toSessionTitle(content: string): string {
   return oneLine.length <= MAX_TITLE_LENGTH ? oneLine : oneLine.slice(0, MAX_TITLE_LENGTH) + '…'
 }
 
+/**
+ * 将 thinking 事件合并到当前思考过程
+ * 全量快照直接覆盖；增量步骤仅在 seq 连续时追加，出现缺口则保持原样等待下一次快照
+ * @returns 合并后的 [文本, seq]，事件无法应用时返回 null
+ */
+function applyThinkingEvent(text: string, seq: number, event: ThinkingEvent): [string, number] | null {
+  if (event.content != null) {
+    return [event.content, event.seq ?? seq + 1]
+  }
+  if (event.delta != null) {
+    if (event.seq != null && event.seq !== seq + 1) return null
+    return [text ? `${text}\n\n${event.delta}` : event.delta, seq + 1]
+  }
+  return null
+}
+
 interface ChatState {
   messages: Message[]
   isStreaming: boolean
@@ -78,6 +95,7 @@ export const useChatStore = create<ChatState>((set, get) => ({
     let finalContent = ''
     let finalSql: string | null = null
     let finalThinking = ''
+    let thinkingSeq = 0
     let finalChart: ChartData | null = null
 
     const updateTitleIfFirst = () => {
@@ -92,13 +110,20 @@ export const useChatStore = create<ChatState>((set, get) => ({
           finalContent += text
           set({ streamingContent: finalContent })
         },
+        onTokenReset: () => {
+          finalContent = ''
+          set({ streamingContent: '' })
+        },
         onSql: (sql) => {
           finalSql = sql
           set({ streamingSql: sql })
         },
-        onThinking: (content) => {
-          finalThinking = content
-          set({ streamingThinking: content })
+        onThinking: (event) => {
+          const merged = applyThinkingEvent(finalThinking, thinkingSeq, event)
+          if (!merged) return
+          finalThinking = merged[0]
+          thinkingSeq = merged[1]
+          set({ streamingThinking: finalThinking })
         },
         onChart: (chartData) => {
           finalChart = chartData
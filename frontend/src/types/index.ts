@@ -56,23 +56,44 @@ export interface ColumnInfo {
   type: string
   primary_key: boolean
   nullable: boolean
+  comment?: string | null
+}
+
+/** 外键信息（单列） */
+export interface ForeignKeyInfo {
+  column: string
+  referenced_table: string
+  referenced_column: string
 }
 
 /** 单表结构 */
 export interface TableSchema {
   name: string
+  comment?: string | null
   columns: ColumnInfo[]
+  foreign_keys?: ForeignKeyInfo[]
 }
 
 /** SQL 查询结果（分页） */
 export interface SqlQueryResult {
   columns: string[]
   rows: (string | number | null)[][]
-  total_count: number
+  /** 总行数；keyset 分页不计算总行数，为 null */
+  total_count: number | null
   page: number
   page_size: number
   total_pages: number
   elapsed_ms: number
+  /** 结果句柄，翻页时回传以复用服务端缓存的结果 */
+  query_handle?: string | null
+  /** 总行数是否为估算值 */
+  count_estimated?: boolean
+  /** keyset 分页：下一页的续页令牌，无更多数据时为空 */
+  next_cursor?: string | null
+  /** keyset 分页实际使用的排序键 */
+  key_columns?: string[] | null
+  /** keyset 分页排序键条件是否并入原查询；false 时按派生表过滤，深页开销随位置增长 */
+  keyset_pushdown?: boolean | null
 }
 
 // ===== MySQL 连接管理 =====
@@ -86,6 +107,16 @@ export interface MySQLConnection {
   user: string
   password: string
   database: string
+  /** 连接池常驻连接数（默认 5） */
+  pool_size?: number
+  /** 连接池峰值额外连接数（默认 10） */
+  max_overflow?: number
+  /** 连接最大存活秒数，-1 表示不回收（默认 3600） */
+  pool_recycle?: number
+  /** 取出连接前是否 ping 检测（默认 true） */
+  pool_pre_ping?: boolean
+  /** 单条查询超时秒数，0 表示不限制（默认 30） */
+  query_timeout?: number
 }
 
 /** 创建连接请求（无 id） */
@@ -96,6 +127,16 @@ export interface MySQLConnectionCreate {
   user: string
   password: string
   database: string
+  /** 连接池常驻连接数（默认 5） */
+  pool_size?: number
+  /** 连接池峰值额外连接数（默认 10） */
+  max_overflow?: number
+  /** 连接最大存活秒数，-1 表示不回收（默认 3600） */
+  pool_recycle?: number
+  /** 取出连接前是否 ping 检测（默认 true） */
+  pool_pre_ping?: boolean
+  /** 单条查询超时秒数，0 表示不限制（默认 30） */
+  query_timeout?: number
 }
 
 /** 更新连接请求（所有字段可选） */
@@ -106,6 +147,16 @@ export interface MySQLConnectionUpdate {
   user?: string
   password?: string
   database?: string
+  /** 连接池常驻连接数（默认 5） */
+  pool_size?: number
+  /** 连接池峰值额外连接数（默认 10） */
+  max_overflow?: number
+  /** 连接最大存活秒数，-1 表示不回收（默认 3600） */
+  pool_recycle?: number
+  /** 取出连接前是否 ping 检测（默认 true） */
+  pool_pre_ping?: boolean
+  /** 单条查询超时秒数，0 表示不限制（默认 30） */
+  query_timeout?: number
 }
 
 /** 连接测试请求 */
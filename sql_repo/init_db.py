@@ -1,12 +1,19 @@
 """
 SQLite3 初始化数据库脚本（独立运行，供测试使用）
 在 sql_repo/data/ 下创建 test.db，四张表全部重建，金额/数值字段为 REAL/INTEGER 类型，每张表 100+ 条数据。
+
+另可生成规模可配置的合成表（供压测使用，见 backend/app/playground/bench_database_router.py）：
+  - bench_t0001 ~ bench_tNNNN：--tables 张表，每张 --rows 行、--columns 列，ref_id 外键引用上一张表
+  - bench_facts：--fact-rows 行的大表（深分页、总行数计算）
+合成表 DDL 同时兼容 SQLite 与 MySQL，init_scaled_tables 接受任意 DB-API 连接
 """
 
+import argparse
 import os
 import sqlite3
 import random
 from datetime import datetime, timedelta
+from typing import Iterator, Optional
 
 # 数据库文件路径：sql_repo/data/test.db
 SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
@@ -19,28 +26,35 @@ NUM_EMPLOYEES = 120
 NUM_PRODUCTS = 110
 NUM_SALES = 150
 
+# 合成表：表名前缀、大表名、每批插入行数、固定列（其余为 VARCHAR 填充列）
+SYNTHETIC_PREFIX = "bench_t"
+FACT_TABLE = "bench_facts"
+INSERT_BATCH = 5000
+SYNTHETIC_FIXED_COLUMNS = ["id", "ref_id", "name", "amount", "quantity", "created_on"]
+FACT_CATEGORIES = ["云计算", "云存储", "数据库", "网络", "人工智能", "安全", "大数据", "物联网"]
+
 
-def _random_date(start_year: int, end_year: int) -> str:
+def _random_date(start_year: int, end_year: int, rng: Optional[random.Random] = None) -> str:
     s = datetime(start_year, 1, 1)
     e = datetime(end_year, 12, 31)
-    d = s + timedelta(days=random.randint(0, (e - s).days))
+    d = s + timedelta(days=(rng or random).randint(0, (e - s).days))
     return d.strftime("%Y-%m-%d")
 
 
-def init_database(force: bool = False) -> bool:
+def init_database(force: bool = False, db_path: str = DB_PATH) -> bool:
     """
     初始化 SQLite 数据库。若 force=True 则删除已有库后重建。
     金额、预算、薪资、单价等均为 REAL，数量、ID 等为 INTEGER。
     """
-    if force and os.path.exists(DB_PATH):
-        os.remove(DB_PATH)
+    if force and os.path.exists(db_path):
+        os.remove(db_path)
 
-    if not force and os.path.exists(DB_PATH) and os.path.getsize(DB_PATH) > 0:
-        print(f"[跳过] 数据库已存在: {DB_PATH}")
+    if not force and os.path.exists(db_path) and os.path.getsize(db_path) > 0:
+        print(f"[跳过] 数据库已存在: {db_path}")
         return False
 
-    os.makedirs(DATA_DIR, exist_ok=True)
-    conn = sqlite3.connect(DB_PATH)
+    os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+    conn = sqlite3.connect(db_path)
     cursor = conn.cursor()
 
     # ---- 删除旧表（若存在）后重建，保证类型正确 ----
@@ -161,13 +175,161 @@ def init_database(force: bool = False) -> bool:
 
     conn.commit()
     conn.close()
-    print(f"[完成] 数据库已初始化: {DB_PATH}")
+    print(f"[完成] 数据库已初始化: {db_path}")
     print(f"  表: departments({NUM_DEPARTMENTS}), employees({NUM_EMPLOYEES}), products({NUM_PRODUCTS}), sales({NUM_SALES})")
     print("  金额/预算/薪资/单价字段均为 REAL，数量/ID 为 INTEGER")
     return True
 
 
+# ==================== 合成表（压测用） ====================
+
+def synthetic_table_name(index: int) -> str:
+    """第 index 张合成表的表名（从 1 开始）"""
+    return f"{SYNTHETIC_PREFIX}{index:04d}"
+
+
+def synthetic_columns(columns: int) -> list[str]:
+    """合成表的列名（至少包含固定列）"""
+    extra = max(0, columns - len(SYNTHETIC_FIXED_COLUMNS))
+    return SYNTHETIC_FIXED_COLUMNS + [f"attr_{i:02d}" for i in range(1, extra + 1)]
+
+
+def _synthetic_ddl(index: int, columns: int) -> str:
+    defs = [
+        "id INTEGER PRIMARY KEY",
+        "ref_id INTEGER",
+        "name VARCHAR(64) NOT NULL",
+        "amount DOUBLE",
+        "quantity INTEGER",
+        "created_on VARCHAR(10)",
+    ]
+    defs += [f"{name} VARCHAR(32)" for name in synthetic_columns(columns)[len(SYNTHETIC_FIXED_COLUMNS):]]
+    if index > 1:
+        defs.append(f"FOREIGN KEY (ref_id) REFERENCES {synthetic_table_name(index - 1)}(id)")
+    return f"CREATE TABLE {synthetic_table_name(index)} (\n    " + ",\n    ".join(defs) + "\n)"
+
+
+def _synthetic_rows(index: int, columns: int, rows: int, rng: random.Random) -> Iterator[tuple]:
+    extra = len(synthetic_columns(columns)) - len(SYNTHETIC_FIXED_COLUMNS)
+    for i in range(1, rows + 1):
+        yield (
+            i,
+            rng.randint(1, rows) if index > 1 else None,
+            f"记录{index}-{i}",
+            round(rng.uniform(1, 100_000), 2),
+            rng.randint(1, 1000),
+            _random_date(2020, 2024, rng),
+            *(f"v{rng.randint(0, 9999):04d}" for _ in range(extra)),
+        )
+
+
+def _fact_rows(rows: int, tables: int, rng: random.Random) -> Iterator[tuple]:
+    for i in range(1, rows + 1):
+        yield (
+            i,
+            rng.randint(1, tables) if tables else None,
+            rng.choice(FACT_CATEGORIES),
+            round(rng.uniform(1, 100_000), 2),
+            rng.randint(1, 50),
+            _random_date(2020, 2024, rng),
+            f"备注{rng.randint(0, 99999):05d}",
+        )
+
+
+def _insert_batches(conn, placeholder: str, table: str, columns: list[str], rows: Iterator[tuple]) -> None:
+    sql = f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join([placeholder] * len(columns))})"
+    cursor = conn.cursor()
+    try:
+        batch = []
+        for row in rows:
+            batch.append(row)
+            if len(batch) >= INSERT_BATCH:
+                cursor.executemany(sql, batch)
+                batch = []
+        if batch:
+            cursor.executemany(sql, batch)
+    finally:
+        cursor.close()
+    conn.commit()
+
+
+def init_scaled_tables(
+    conn,
+    tables: int = 0,
+    rows: int = 0,
+    columns: int = 8,
+    fact_rows: int = 0,
+    seed: int = 42,
+    placeholder: str = "?",
+    existing_tables: Optional[int] = None,
+) -> None:
+    """
+    重建合成表（DDL 兼容 SQLite / MySQL）
+
+    Args:
+        conn: DB-API 连接（sqlite3 / pymysql）
+        tables: 合成表数量
+        rows: 每张合成表的行数
+        columns: 每张合成表的列数（不少于固定的 6 列）
+        fact_rows: bench_facts 大表的行数，0 表示不创建
+        seed: 随机种子（相同参数生成相同数据）
+        placeholder: 驱动的参数占位符，sqlite3 为 "?"，pymysql 为 "%s"
+        existing_tables: 需要删除的旧合成表数量，为 None 时与 tables 相同
+    """
+    rng = random.Random(seed)
+    cursor = conn.cursor()
+    try:
+        # 先删引用方（编号大的表引用编号小的表）
+        cursor.execute(f"DROP TABLE IF EXISTS {FACT_TABLE}")
+        for index in range(max(tables, existing_tables or 0), 0, -1):
+            cursor.execute(f"DROP TABLE IF EXISTS {synthetic_table_name(index)}")
+        for index in range(1, tables + 1):
+            cursor.execute(_synthetic_ddl(index, columns))
+        if fact_rows:
+            cursor.execute(f"""
+                CREATE TABLE {FACT_TABLE} (
+                    id INTEGER PRIMARY KEY,
+                    table_id INTEGER,
+                    category VARCHAR(32),
+                    amount DOUBLE,
+                    quantity INTEGER,
+                    created_on VARCHAR(10),
+                    note VARCHAR(64)
+                )
+            """)
+    finally:
+        cursor.close()
+    conn.commit()
+
+    for index in range(1, tables + 1):
+        _insert_batches(
+            conn, placeholder, synthetic_table_name(index), synthetic_columns(columns),
+            _synthetic_rows(index, columns, rows, rng),
+        )
+    if fact_rows:
+        _insert_batches(
+            conn, placeholder, FACT_TABLE,
+            ["id", "table_id", "category", "amount", "quantity", "created_on", "note"],
+            _fact_rows(fact_rows, tables, rng),
+        )
+
+
 if __name__ == "__main__":
-    import sys
-    force = "--force" in sys.argv or "-f" in sys.argv
-    init_database(force=force)
+    parser = argparse.ArgumentParser(description="初始化 SQLite 测试数据库")
+    parser.add_argument("-f", "--force", action="store_true", help="删除已有库后重建")
+    parser.add_argument("--path", default=DB_PATH, help="数据库文件路径")
+    parser.add_argument("--tables", type=int, default=0, help="合成表数量（压测用）")
+    parser.add_argument("--rows", type=int, default=0, help="每张合成表的行数")
+    parser.add_argument("--columns", type=int, default=8, help="每张合成表的列数")
+    parser.add_argument("--fact-rows", type=int, default=0, help="bench_facts 大表的行数")
+    parser.add_argument("--seed", type=int, default=42, help="合成数据的随机种子")
+    args = parser.parse_args()
+
+    init_database(force=args.force, db_path=args.path)
+    if args.tables or args.fact_rows:
+        conn = sqlite3.connect(args.path)
+        try:
+            init_scaled_tables(conn, args.tables, args.rows, args.columns, args.fact_rows, args.seed)
+        finally:
+            conn.close()
+        print(f"[完成] 合成表: {args.tables} 张 × {args.rows} 行 × {args.columns} 列，{FACT_TABLE}({args.fact_rows})")